@@ -1,16 +1,25 @@
-from fastapi import FastAPI, Request, Body, HTTPException
+from fastapi import FastAPI, Request, Body, Header, HTTPException, Query
 from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
 from datetime import datetime
+from typing import Dict, Optional
 import asyncio
 import uuid
 from json import dumps
 
 # Import the logger module
 from app.logger import logger
+from app.broadcast import BroadcastChannel
+from app.config import config
+from app.event_bus import AgentEvent, EventType
+from app.exceptions import SlowConsumerError
+from app.http_client import close_http_clients
+from app.scheduler import TaskScheduler
+from app.task_store import Task, TaskStore, create_task_store
+from app.tool.bash import close_session_pool
+from app.tool.python_kernel import close_kernel_pool, get_kernel_pool
 
 app = FastAPI()
 
@@ -23,25 +32,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["Content-Type"]
+    expose_headers=["Content-Type", "X-Total-Count"]
 )
 
-class Task(BaseModel):
-    id: str
-    prompt: str
-    created_at: datetime
-    status: str
-    steps: list = []
-
-    def model_dump(self, *args, **kwargs):
-        data = super().model_dump(*args, **kwargs)
-        data['created_at'] = self.created_at.isoformat()
-        return data
-
 class TaskManager:
-    def __init__(self):
-        self.tasks = {}
-        self.queues = {}
+    def __init__(self, store: TaskStore, event_buffer_size: int = 1024, slow_subscriber_wait: float = 0):
+        self.store = store
+        # One broadcast channel per unfinished task, shared by all of its SSE subscribers
+        self.channels: Dict[str, BroadcastChannel] = {}
+        self.event_buffer_size = event_buffer_size
+        self.slow_subscriber_wait = slow_subscriber_wait
 
     def create_task(self, prompt: str) -> Task:
         task_id = str(uuid.uuid4())
@@ -51,139 +51,102 @@ class TaskManager:
             created_at=datetime.now(),
             status="pending"
         )
-        self.tasks[task_id] = task
-        self.queues[task_id] = asyncio.Queue()
+        self.store.add(task)
+        self.channels[task_id] = BroadcastChannel(self.event_buffer_size, max_wait=self.slow_subscriber_wait)
         return task
 
+    def get_task(self, task_id: str) -> Optional[Task]:
+        return self.store.get(task_id)
+
+    async def set_status(self, task_id: str, status: str):
+        self.store.set_status(task_id, status)
+        if task_id in self.channels:
+            await self.channels[task_id].send({"type": "status", "status": status})
+
     async def update_task_step(self, task_id: str, step: int, result: str, step_type: str = "step"):
-        if task_id in self.tasks:
-            task = self.tasks[task_id]
-            task.steps.append({"step": step, "result": result, "type": step_type})
-            await self.queues[task_id].put({
-                "type": step_type,
-                "step": step,
-                "result": result
-            })
-            await self.queues[task_id].put({
-                "type": "status",
-                "status": task.status,
-                "steps": task.steps
-            })
+        task = self.store.get(task_id)
+        if task is not None and task_id in self.channels:
+            # Each step is sent once as a delta; seq doubles as the SSE event id clients resume from
+            event = {"seq": len(task.steps), "type": step_type, "step": step, "result": result}
+            self.store.append_step(task_id, event)
+            await self.channels[task_id].send(event)
+
+    async def publish_event(self, task_id: str, event: dict):
+        """Push a transient event to the task's stream without recording it as a step"""
+        if task_id in self.channels:
+            await self.channels[task_id].send(event)
 
     async def complete_task(self, task_id: str):
-        if task_id in self.tasks:
-            task = self.tasks[task_id]
-            task.status = "completed"
-            await self.queues[task_id].put({
-                "type": "status",
-                "status": task.status,
-                "steps": task.steps
-            })
-            await self.queues[task_id].put({"type": "complete"})
+        if task_id in self.channels:
+            await self.set_status(task_id, "completed")
+            await self.channels[task_id].send({"type": "complete"})
+            self._close_channel(task_id)
 
     async def fail_task(self, task_id: str, error: str):
-        if task_id in self.tasks:
-            self.tasks[task_id].status = f"failed: {error}"
-            await self.queues[task_id].put({
+        if task_id in self.channels:
+            await self.set_status(task_id, f"failed: {error}")
+            await self.channels[task_id].send({
                 "type": "error",
                 "message": error
             })
+            self._close_channel(task_id)
 
-task_manager = TaskManager()
+    def _close_channel(self, task_id: str):
+        """Close a finished task's channel; connected subscribers still drain it, new ones replay from the store"""
+        self.channels.pop(task_id).close()
+
+task_manager = TaskManager(
+    create_task_store(config.task_store),
+    event_buffer_size=config.server.event_buffer_size,
+    slow_subscriber_wait=config.server.slow_subscriber_wait,
+)
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
-# Import run_flow functionality
-from app.agent.manus import Manus
-from app.flow.base import FlowType
-from app.flow.flow_factory import FlowFactory
 # Import the task executor
 from app.task_executor import task_executor
 
-@app.post("/tasks")
-async def create_task(prompt: str = Body(..., embed=True)):
-    try:
-        # Create a new task and start processing
-        task = task_manager.create_task(prompt)
-        print(f"Created task: {task.id}")
-        
-        # Start processing in the background
-        asyncio.create_task(run_task(task.id, prompt))
-        
-        # Return a simple, clean response with just the task_id as a string
-        return {"task_id": task.id}
-    except Exception as e:
-        print(f"Error creating task: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to create task: {str(e)}")
-
 async def run_task(task_id: str, prompt: str):
     try:
-        task_manager.tasks[task_id].status = "running"
+        await task_manager.set_status(task_id, "running")
         
-        # Create a custom SSE log handler to capture logs
-        class SSELogHandler:
+        # Map agent events onto the step types the frontends render
+        step_types = {
+            EventType.STEP: "log",
+            EventType.THOUGHT: "think",
+            EventType.TOOL_SELECTED: "tool",
+            EventType.TOOL_STARTED: "tool",
+            EventType.TOOL_FINISHED: "act",
+            EventType.PLAN_UPDATED: "plan",
+        }
+
+        class SSEEventHandler:
             def __init__(self, task_id):
                 self.task_id = task_id
                 self.step_counter = 0
-                
-            async def __call__(self, message):
-                # Handle string messages from logger
-                if isinstance(message, str):
-                    import re
-                    
-                    # Extract content and identify message type based on patterns
-                    event_type = "log"
-                    cleaned_message = message
-                    
-                    # Remove timestamp and log level if present
-                    timestamp_pattern = r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}.\d{3} \| \w+ +\| '
-                    cleaned_message = re.sub(timestamp_pattern, '', cleaned_message)
-                    
-                    # Remove module info if present
-                    module_pattern = r'^[\w\.]+:\w+:\d+ - '
-                    cleaned_message = re.sub(module_pattern, '', cleaned_message)
-                    
-                    # Determine event type based on message content and icons
-                    if '✨' in cleaned_message or 'thoughts:' in cleaned_message.lower():
-                        event_type = "think"
-                        # Extract the actual thought content after the emoji
-                        thoughts_match = re.search(r'✨ \w+\'s thoughts: (.*)', cleaned_message)
-                        if thoughts_match:
-                            cleaned_message = thoughts_match.group(1)
-                    elif '🛠️' in cleaned_message or 'selected tool' in cleaned_message.lower():
-                        event_type = "tool"
-                    elif '🔧' in cleaned_message or 'Activating tool:' in cleaned_message:
-                        event_type = "tool"
-                    elif '🎯' in cleaned_message or 'Tool .* completed' in cleaned_message:
-                        event_type = "act"
-                        # Extract the result after "Result:"
-                        result_match = re.search(r'Result: (.*)', cleaned_message, re.DOTALL)
-                        if result_match:
-                            cleaned_message = result_match.group(1)
-                    elif 'error' in cleaned_message.lower() or 'failed' in cleaned_message.lower():
-                        event_type = "error"
-                    
-                    print(f"Processing log: {event_type} - {cleaned_message[:50]}...")
-                    
-                    self.step_counter += 1
-                    await task_manager.update_task_step(self.task_id, self.step_counter, cleaned_message, event_type)
-                
-                # Handle structured log data
-                elif isinstance(message, dict):
-                    event_type = message.get("type", "log")
-                    content = message.get("message", "")
-                    step = message.get("step", self.step_counter)
-                    self.step_counter += 1
-                    await task_manager.update_task_step(self.task_id, step, content, event_type)
-        
-        # Register the SSE handler with the logger
-        sse_handler = SSELogHandler(task_id)
-        
-        # Directly hook into the logger's handlers list to capture all logs
-        logger.add(sse_handler, level="INFO")
-        print(f"SSE handler registered for task {task_id}")
+
+            async def __call__(self, event: AgentEvent):
+                if event.type == EventType.THOUGHT_DELTA:
+                    # Streamed thought tokens are live-only; the full thought arrives as a "think" step
+                    await task_manager.publish_event(self.task_id, {"type": "think_delta", "result": event.content})
+                    return
+                if event.type == EventType.TOOL_OUTPUT:
+                    # Output of a running command is live-only too; the tool's result arrives as an "act" step
+                    await task_manager.publish_event(self.task_id, {"type": "tool_output", "result": event.content, "stream": event.data.get("stream")})
+                    return
+                self.step_counter += 1
+                step = event.data.get("step", self.step_counter)
+                await task_manager.update_task_step(self.task_id, step, event.content, step_types.get(event.type, "log"))
+
+            async def on_error_log(self, message):
+                # Errors are still only reported through the logger
+                self.step_counter += 1
+                await task_manager.update_task_step(self.task_id, self.step_counter, message, "error")
+
+        # Receives this task's agent events, plus its error log lines
+        sse_handler = SSEEventHandler(task_id)
         
         try:
             # Log the start of the task
@@ -215,20 +178,13 @@ async def run_task(task_id: str, prompt: str):
                 lambda msg: task_manager.update_task_step(task_id, 9000 + sse_handler.step_counter, msg, "log")
             )
             
-            # Use the run_flow.py functionality
-            agents = {
-                "manus": Manus(),
-            }
-            
-            flow = FlowFactory.create_flow(
-                flow_type=FlowType.PLANNING,
-                agents=agents,
-            )
-            
-            # Execute with timeout to avoid hanging
-            result = await asyncio.wait_for(
-                flow.execute(prompt),
-                timeout=3600,  # 1 hour timeout
+            # The executor runs the flow inline or in a worker process, per [server] executor
+            result = await task_executor.execute_task(
+                task_id,
+                prompt,
+                on_log=sse_handler.on_error_log,
+                on_event=sse_handler,
+                log_level="ERROR",
             )
             
             # Log the result
@@ -245,49 +201,103 @@ async def run_task(task_id: str, prompt: str):
             logger.error(error_msg)
             await task_manager.fail_task(task_id, error_msg)
             
-        finally:
-            # Remove the logger handler
-            try:
-                logger.remove(sse_handler)
-            except:
-                pass
-            
     except Exception as e:
         error_msg = f"Error in task setup: {str(e)}"
         logger.error(error_msg)
         await task_manager.fail_task(task_id, error_msg)
 
+async def report_queue_positions(queued_ids):
+    """Tell every waiting task where it now stands in the queue"""
+    for position, task_id in enumerate(queued_ids):
+        await task_manager.publish_event(task_id, {"type": "status", "status": "queued", "queue_position": position})
+
+async def report_cancelled(task_id: str):
+    await task_manager.fail_task(task_id, "cancelled")
+
+task_scheduler = TaskScheduler(
+    run_task,
+    workers=config.server.max_concurrent_tasks,
+    max_queue_size=config.server.max_queued_tasks,
+    on_cancel=report_cancelled,
+    on_queue_change=report_queue_positions,
+)
+
+@app.post("/tasks")
+async def create_task(prompt: str = Body(..., embed=True), priority: int = Body(0, embed=True)):
+    # Admission control: reject instead of queueing without bound
+    if task_scheduler.is_full:
+        raise HTTPException(status_code=429, detail="Too many tasks are waiting, please retry later")
+
+    try:
+        # Create a new task and queue it for a worker
+        task = task_manager.create_task(prompt)
+        print(f"Created task: {task.id}")
+        
+        await task_manager.set_status(task.id, "queued")
+        position = await task_scheduler.submit(task.id, prompt, priority=priority)
+        await task_manager.publish_event(task.id, {"type": "status", "status": "queued", "queue_position": position})
+        
+        # Return a simple, clean response with just the task_id as a string
+        return {"task_id": task.id}
+    except Exception as e:
+        print(f"Error creating task: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to create task: {str(e)}")
+
+def format_sse(event: dict) -> str:
+    """Encode an event as an SSE message; recorded steps carry their seq as the event id"""
+    event_id = f"id: {event['seq']}\n" if "seq" in event else ""
+    return f"{event_id}event: {event['type']}\ndata: {dumps(event)}\n\n"
+
 @app.get("/tasks/{task_id}/events")
-async def task_events(task_id: str):
-    """Stream task events as Server-Sent Events (SSE)"""
+async def task_events(
+    task_id: str,
+    last_event_id: Optional[int] = Query(None),
+    last_event_id_header: Optional[int] = Header(None, alias="Last-Event-ID"),
+):
+    """Stream task events as Server-Sent Events (SSE)
+
+    Steps are sent once each as deltas. A reconnecting client resumes after the
+    seq in its Last-Event-ID header (or `last_event_id` query parameter) and only
+    receives the steps it missed.
+    """
     
-    if task_id not in task_manager.tasks:
+    task = task_manager.get_task(task_id)
+    if task is None:
         return JSONResponse(
             status_code=404, 
             content={"detail": "Task not found"}
         )
+
+    cursor = last_event_id_header if last_event_id_header is not None else last_event_id
+    if cursor is None:
+        cursor = -1
     
     async def event_generator():
         """Generate SSE events for this task"""
-        if task_id not in task_manager.queues:
-            yield f"event: error\ndata: {{\"message\": \"Task queue not found\"}}\n\n"
-            return
-            
-        queue = task_manager.queues[task_id]
-        task = task_manager.tasks[task_id]
-        
-        # Send initial status with proper JSON escaping
+        nonlocal cursor, task
+        # Subscribe before reading the store so no event falls between the replay and the live stream
+        channel = task_manager.channels.get(task_id)
+        subscription = channel.subscribe() if channel is not None else None
+        task = task_manager.get_task(task_id) or task
+
+        # Replay the steps this client has not seen, then the current status
         try:
-            steps_json = dumps(task.steps)
-            status_data = dumps({
-                "type": "status", 
-                "status": task.status, 
-                "steps": task.steps
-            })
-            yield f"event: status\ndata: {status_data}\n\n"
+            missed = task_manager.store.get_steps(task_id, after=cursor)
+            for step in missed:
+                yield format_sse(step)
+                cursor = step["seq"]
+            yield format_sse({"type": "status", "status": task.status})
         except Exception as e:
-            print(f"Error sending initial status: {str(e)}")
-            yield f"event: error\ndata: {{\"message\": \"Error sending initial status\"}}\n\n"
+            print(f"Error replaying task steps: {str(e)}")
+            yield f"event: error\ndata: {{\"message\": \"Error replaying task steps\"}}\n\n"
+
+        if subscription is None or task.is_finished:
+            # Nothing more will happen on a finished task; the replay is complete
+            if task.status == "completed":
+                yield format_sse({"type": "complete"})
+            elif task.status.startswith("failed"):
+                yield format_sse({"type": "error", "message": task.status[len("failed: "):]})
+            return
         
         # Set up heartbeat
         heartbeat_interval = 5  # Send a heartbeat every 5 seconds
@@ -296,13 +306,19 @@ async def task_events(task_id: str):
             try:
                 # Wait for an event with timeout for heartbeat
                 try:
-                    event = await asyncio.wait_for(queue.get(), timeout=heartbeat_interval)
+                    event = await subscription.get(timeout=heartbeat_interval)
+                    if event is None:
+                        break
+
+                    # Skip steps already delivered by the replay
+                    if "seq" in event:
+                        if event["seq"] <= cursor:
+                            continue
+                        cursor = event["seq"]
                     
                     # Ensure the event is properly serializable
                     try:
-                        # Make sure we're sending valid JSON
-                        event_json = dumps(event)
-                        yield f"event: {event['type']}\ndata: {event_json}\n\n"
+                        yield format_sse(event)
                         
                         # If the event is "complete", we're done
                         if event["type"] == "complete":
@@ -322,6 +338,12 @@ async def task_events(task_id: str):
                     yield ": heartbeat\n\n"
                     continue
                     
+            except SlowConsumerError as e:
+                # The client can reconnect with its Last-Event-ID and replay what it missed from the store
+                print(f"Dropping slow SSE subscriber for task {task_id}: {str(e)}")
+                yield ": slow consumer, reconnect to resume\n\n"
+                break
+
             except asyncio.CancelledError:
                 print(f"SSE connection for task {task_id} was cancelled")
                 break
@@ -335,6 +357,9 @@ async def task_events(task_id: str):
                 except:
                     yield f"event: error\ndata: {{\"message\": \"Unknown error\"}}\n\n"
                 break
+
+        # The task no longer waits for this client when its buffer fills
+        subscription.close()
                 
     return StreamingResponse(
         event_generator(),
@@ -349,22 +374,58 @@ async def task_events(task_id: str):
     )
 
 @app.get("/tasks")
-async def get_tasks():
-    sorted_tasks = sorted(
-        task_manager.tasks.values(),
-        key=lambda task: task.created_at,
-        reverse=True
-    )
+async def get_tasks(offset: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
+    tasks = task_manager.store.list(offset=offset, limit=limit)
     return JSONResponse(
-        content=[task.model_dump() for task in sorted_tasks],
-        headers={"Content-Type": "application/json"}
+        content=[task.model_dump(exclude={"steps"}) for task in tasks],
+        headers={
+            "Content-Type": "application/json",
+            "X-Total-Count": str(task_manager.store.count()),
+        }
     )
 
 @app.get("/tasks/{task_id}")
 async def get_task(task_id: str):
-    if task_id not in task_manager.tasks:
+    task = task_manager.get_task(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return {**task.model_dump(), "queue_position": task_scheduler.position(task_id)}
+
+@app.post("/tasks/{task_id}/cancel")
+async def cancel_task(task_id: str):
+    task = task_manager.get_task(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
-    return task_manager.tasks[task_id]
+    if not await task_scheduler.cancel(task_id):
+        raise HTTPException(status_code=409, detail=f"Task is not queued or running (status: {task.status})")
+    return {"task_id": task_id, "cancelled": True}
+
+@app.on_event("startup")
+async def start_scheduler():
+    await task_executor.start()
+    task_scheduler.start()
+    if task_executor.mode == "inline":
+        # Interpreters are ready before the first python_execute call
+        get_kernel_pool().fill()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await task_scheduler.stop()
+    await task_executor.stop()
+
+@app.on_event("shutdown")
+async def close_task_store():
+    task_manager.store.close()
+
+@app.on_event("shutdown")
+async def close_connections():
+    await close_http_clients()
+    close_session_pool()
+    close_kernel_pool()
+
+@app.on_event("shutdown")
+async def flush_logger():
+    await logger.shutdown()
 
 @app.exception_handler(Exception)
 async def generic_exception_handler(request: Request, exc: Exception):
@@ -4,6 +4,8 @@ from typing import List, Literal, Optional
 
 from pydantic import BaseModel, Field, model_validator
 
+from app.agent.loop_detector import LoopDetector
+from app.event_bus import AgentEvent, EventType, event_bus
 from app.llm import LLM
 from app.logger import logger
 from app.schema import AgentState, Memory, Message
@@ -40,6 +42,9 @@ class BaseAgent(BaseModel, ABC):
     current_step: int = Field(default=0, description="Current step in execution")
 
     duplicate_threshold: int = 2
+    loop_detector: Optional[LoopDetector] = Field(
+        None, description="Incremental stuck-loop detector over assistant messages"
+    )
 
     class Config:
         arbitrary_types_allowed = True
@@ -52,6 +57,10 @@ class BaseAgent(BaseModel, ABC):
             self.llm = LLM(config_name=self.name.lower())
         if not isinstance(self.memory, Memory):
             self.memory = Memory()
+        if self.memory.max_tokens is None:
+            self.memory.max_tokens = self.llm.max_input_tokens
+        if self.loop_detector is None:
+            self.loop_detector = LoopDetector(threshold=self.duplicate_threshold)
         return self
 
     @asynccontextmanager
@@ -135,6 +144,12 @@ class BaseAgent(BaseModel, ABC):
             ):
                 self.current_step += 1
                 logger.info(f"Executing step {self.current_step}/{self.max_steps}")
+                await self.emit(
+                    EventType.STEP,
+                    f"Executing step {self.current_step}/{self.max_steps}",
+                    step=self.current_step,
+                    max_steps=self.max_steps,
+                )
                 step_result = await self.step()
 
                 # Check for stuck state
@@ -148,6 +163,12 @@ class BaseAgent(BaseModel, ABC):
 
         return "\n".join(results) if results else "No steps executed"
 
+    async def emit(self, event_type: EventType, content: str = "", **data) -> None:
+        """Publish a structured progress event from this agent on the event bus."""
+        await event_bus.emit(
+            AgentEvent(type=event_type, source=self.name, content=content, data=data)
+        )
+
     @abstractmethod
     async def step(self) -> str:
         """Execute a single step in the agent's workflow.
@@ -160,25 +181,17 @@ class BaseAgent(BaseModel, ABC):
         stuck_prompt = "\
         Observed duplicate responses. Consider new strategies and avoid repeating ineffective paths already attempted."
         self.next_step_prompt = f"{stuck_prompt}\n{self.next_step_prompt}"
-        logger.warning(f"Agent detected stuck state. Added prompt: {stuck_prompt}")
+        logger.warning(
+            f"Agent detected stuck state ({self.loop_detector.reason}). Added prompt: {stuck_prompt}"
+        )
 
     def is_stuck(self) -> bool:
-        """Check if the agent is stuck in a loop by detecting duplicate content"""
-        if len(self.memory.messages) < 2:
-            return False
-
-        last_message = self.memory.messages[-1]
-        if not last_message.content:
-            return False
-
-        # Count identical content occurrences
-        duplicate_count = sum(
-            1
-            for msg in reversed(self.memory.messages[:-1])
-            if msg.role == "assistant" and msg.content == last_message.content
-        )
+        """Check if the agent is stuck in a loop.
 
-        return duplicate_count >= self.duplicate_threshold
+        Only messages added since the previous check are examined; see
+        `LoopDetector` for the exact, near-duplicate and oscillation patterns.
+        """
+        return self.loop_detector.update(self.memory.messages)
 
     @property
     def messages(self) -> List[Message]:
@@ -189,3 +202,4 @@ class BaseAgent(BaseModel, ABC):
     def messages(self, value: List[Message]):
         """Set the list of messages in the agent's memory."""
         self.memory.messages = value
+        self.loop_detector.reset()
@@ -0,0 +1,178 @@
+import json
+import re
+import zlib
+from collections import Counter, defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.schema import Message
+
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_WORD = re.compile(r"\w+")
+
+
+def tool_call_signature(message: Message) -> str:
+    """Tool names plus normalized arguments of an assistant message's tool calls"""
+    calls = []
+    for call in message.tool_calls or []:
+        try:
+            arguments = json.dumps(
+                json.loads(call.function.arguments or "{}"), sort_keys=True
+            )
+        except (TypeError, ValueError):
+            arguments = " ".join((call.function.arguments or "").split())
+        calls.append(f"{call.function.name}({arguments})")
+    return ";".join(calls)
+
+
+class MinHash:
+    """MinHash signatures of word shingles, for estimating Jaccard similarity"""
+
+    def __init__(self, num_perm: int = 32, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        # Deterministic (a, b) pairs for the hash permutations h -> (a * h + b) mod p
+        state = seed
+        self._perms: List[Tuple[int, int]] = []
+        for _ in range(num_perm):
+            state = (state * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+            a = state % (_MERSENNE_PRIME - 1) + 1
+            state = (state * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+            self._perms.append((a, state % _MERSENNE_PRIME))
+
+    def shingles(self, text: str) -> set:
+        words = _WORD.findall(text.lower())
+        n = self.shingle_size
+        if len(words) <= n:
+            return {" ".join(words)} if words else set()
+        return {" ".join(words[i : i + n]) for i in range(len(words) - n + 1)}
+
+    def signature(self, text: str) -> Optional[Tuple[int, ...]]:
+        """Signature of the text, or None if it has no words"""
+        hashes = [zlib.crc32(s.encode()) for s in self.shingles(text)]
+        if not hashes:
+            return None
+        return tuple(
+            min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._perms
+        )
+
+    @staticmethod
+    def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+        return sum(x == y for x, y in zip(first, second)) / len(first)
+
+
+class LoopDetector:
+    """Incremental detector for agents repeating themselves.
+
+    Each assistant message is reduced to a signature (normalized content plus
+    tool-call signature) and indexed once, when it is first seen, so checking
+    a step costs the same however long the history is. Three patterns count
+    as a loop, reported in `reason`:
+
+    - exact: the same signature was seen `threshold` times before
+    - near-duplicate: `threshold` earlier messages have content whose MinHash
+      similarity is at least `similarity`, found through locality-sensitive
+      hashing buckets
+    - oscillation: the last `2 * threshold` messages alternate between two
+      signatures (A-B-A-B)
+    """
+
+    def __init__(
+        self,
+        threshold: int = 2,
+        similarity: float = 0.8,
+        num_perm: int = 32,
+        bands: int = 8,
+        min_words: int = 8,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.similarity = similarity
+        self.bands = bands
+        self.min_words = min_words
+        self.minhash = MinHash(num_perm=num_perm)
+        self.reason: Optional[str] = None
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget all observed messages"""
+        self._counts: Counter = Counter()
+        self._signatures: List[Tuple[int, ...]] = []
+        self._buckets: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        self._recent: Deque[int] = deque(maxlen=2 * self.threshold)
+        self._last_seen: Optional[Message] = None
+        self.reason = None
+
+    def update(self, messages: List[Message]) -> bool:
+        """Observe the messages added since the last call; True if the newest
+        assistant message among them continues a loop"""
+        self.reason = None
+        new = []
+        for message in reversed(messages):
+            if message is self._last_seen:
+                break
+            new.append(message)
+        if messages:
+            self._last_seen = messages[-1]
+
+        stuck = None
+        for message in reversed(new):
+            if message.role == "assistant":
+                stuck = self.observe(message)
+        return bool(stuck)
+
+    def observe(self, message: Message) -> bool:
+        """Index one assistant message; True if it continues a loop"""
+        content = " ".join((message.content or "").split())
+        tool_calls = tool_call_signature(message)
+        if not content and not tool_calls:
+            self.reason = None
+            return False
+
+        key = hash((content.lower(), tool_calls))
+        self._counts[key] += 1
+        self._recent.append(key)
+        self.reason = None
+
+        # Index the content even when the message is an exact repeat
+        near_duplicate = self._is_near_duplicate(content, tool_calls)
+        if self._counts[key] > self.threshold:
+            self.reason = "exact"
+        elif near_duplicate:
+            self.reason = "near-duplicate"
+        elif self._is_oscillating():
+            self.reason = "oscillation"
+        return self.reason is not None
+
+    def _is_near_duplicate(self, content: str, tool_calls: str) -> bool:
+        if len(content.split()) < self.min_words:
+            return False
+        signature = self.minhash.signature(f"{content} {tool_calls}")
+        index = len(self._signatures)
+        self._signatures.append(signature)
+
+        rows = len(signature) // self.bands
+        candidates = set()
+        for band in range(self.bands):
+            bucket = self._buckets[
+                (band, hash(signature[band * rows : (band + 1) * rows]))
+            ]
+            candidates.update(bucket)
+            bucket.append(index)
+
+        matches = 0
+        for candidate in candidates:
+            if MinHash.similarity(signature, self._signatures[candidate]) >= (
+                self.similarity
+            ):
+                matches += 1
+                if matches >= self.threshold:
+                    return True
+        return False
+
+    def _is_oscillating(self) -> bool:
+        recent = self._recent
+        if len(recent) < recent.maxlen or recent[-1] == recent[-2]:
+            return False
+        return all(recent[i] == recent[i % 2] for i in range(len(recent)))
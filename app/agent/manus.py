@@ -26,6 +26,10 @@ class Manus(ToolCallAgent):
     system_prompt: str = SYSTEM_PROMPT
     next_step_prompt: str = NEXT_STEP_PROMPT
 
+    # Searches and page fetches from one turn are independent network round trips
+    parallel_tool_calls: bool = True
+    stream_tool_calls: bool = True
+
     # Add general-purpose tools to the tool collection
     available_tools: ToolCollection = Field(
         default_factory=lambda: ToolCollection(
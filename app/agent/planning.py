@@ -8,6 +8,7 @@ from app.logger import logger
 from app.prompt.planning import NEXT_STEP_PROMPT, PLANNING_SYSTEM_PROMPT
 from app.schema import Message, ToolCall
 from app.tool import PlanningTool, Terminate, ToolCollection
+from app.tool.planning import Plan
 
 
 class PlanningAgent(ToolCallAgent):
@@ -51,15 +52,15 @@ class PlanningAgent(ToolCallAgent):
 
     async def think(self) -> bool:
         """Decide the next action based on plan status."""
+        # Get the current step index before thinking
+        self.current_step_index = await self._get_current_step_index()
+
         prompt = (
             f"CURRENT PLAN STATUS:\n{await self.get_plan()}\n\n{self.next_step_prompt}"
             if self.active_plan_id
             else self.next_step_prompt
         )
-        self.messages.append(Message.user_message(prompt))
-
-        # Get the current step index before thinking
-        self.current_step_index = await self._get_current_step_index()
+        self.memory.add_message(Message.user_message(prompt))
 
         result = await super().think()
 
@@ -113,6 +114,13 @@ class PlanningAgent(ToolCallAgent):
         )
         return result.output if hasattr(result, "output") else str(result)
 
+    def _get_plan_model(self) -> Optional[Plan]:
+        """The active plan as stored by the planning tool, if it exists."""
+        planning_tool = self.available_tools.get_tool("planning")
+        if not self.active_plan_id or planning_tool is None:
+            return None
+        return planning_tool.plans.get(self.active_plan_id)
+
     async def run(self, request: Optional[str] = None) -> str:
         """Run the agent with an optional initial request."""
         if request:
@@ -138,17 +146,14 @@ class PlanningAgent(ToolCallAgent):
 
         step_index = tracker["step_index"]
 
+        plan = self._get_plan_model()
+        if plan is None:
+            logger.warning(f"Plan {self.active_plan_id} not found")
+            return
+
         try:
             # Mark the step as completed
-            await self.available_tools.execute(
-                name="planning",
-                tool_input={
-                    "command": "mark_step",
-                    "plan_id": self.active_plan_id,
-                    "step_index": step_index,
-                    "step_status": "completed",
-                },
-            )
+            plan.mark(step_index, "completed")
             logger.info(
                 f"Marked step {step_index} as completed in plan {self.active_plan_id}"
             )
@@ -157,46 +162,17 @@ class PlanningAgent(ToolCallAgent):
 
     async def _get_current_step_index(self) -> Optional[int]:
         """
-        Parse the current plan to identify the first non-completed step's index.
+        Identify the next actionable step's index and mark it as in progress.
         Returns None if no active step is found.
         """
-        if not self.active_plan_id:
+        plan = self._get_plan_model()
+        if plan is None:
             return None
 
-        plan = await self.get_plan()
-
-        try:
-            plan_lines = plan.splitlines()
-            steps_index = -1
-
-            # Find the index of the "Steps:" line
-            for i, line in enumerate(plan_lines):
-                if line.strip() == "Steps:":
-                    steps_index = i
-                    break
-
-            if steps_index == -1:
-                return None
-
-            # Find the first non-completed step
-            for i, line in enumerate(plan_lines[steps_index + 1 :], start=0):
-                if "[ ]" in line or "[→]" in line:  # not_started or in_progress
-                    # Mark current step as in_progress
-                    await self.available_tools.execute(
-                        name="planning",
-                        tool_input={
-                            "command": "mark_step",
-                            "plan_id": self.active_plan_id,
-                            "step_index": i,
-                            "step_status": "in_progress",
-                        },
-                    )
-                    return i
-
-            return None  # No active step found
-        except Exception as e:
-            logger.warning(f"Error finding current step index: {e}")
-            return None
+        step_index = plan.next_step_index
+        if step_index is not None:
+            plan.mark(step_index, "in_progress")
+        return step_index
 
     async def create_initial_plan(self, request: str) -> None:
         """Create an initial plan based on the request."""
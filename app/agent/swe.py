@@ -15,22 +15,27 @@ class SWEAgent(ToolCallAgent):
 
     system_prompt: str = SYSTEM_PROMPT
     next_step_prompt: str = NEXT_STEP_TEMPLATE
+    next_step_template: str = NEXT_STEP_TEMPLATE
 
-    available_tools: ToolCollection = ToolCollection(
-        Bash(), StrReplaceEditor(), Terminate()
+    available_tools: ToolCollection = Field(
+        default_factory=lambda: ToolCollection(Bash(), StrReplaceEditor(), Terminate())
     )
     special_tool_names: List[str] = Field(default_factory=lambda: [Terminate().name])
 
     max_steps: int = 5
 
-    bash: Bash = Field(default_factory=Bash)
     working_dir: str = "."
 
+    @property
+    def bash(self) -> Bash:
+        """The shell the agent's bash tool calls run in"""
+        return self.available_tools.get_tool(Bash().name)
+
     async def think(self) -> bool:
         """Process current state and decide next action"""
-        # Update working directory
-        self.working_dir = await self.bash.execute("pwd")
-        self.next_step_prompt = self.next_step_prompt.format(
+        # The shell reports its directory after every command; no extra round trip
+        self.working_dir = self.bash.current_dir
+        self.next_step_prompt = self.next_step_template.format(
             current_dir=self.working_dir
         )
 
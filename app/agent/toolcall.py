@@ -1,9 +1,11 @@
+import asyncio
 import json
-from typing import Any, List, Literal
+from typing import Any, Dict, List, Literal, Optional, Tuple
 
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 
 from app.agent.react import ReActAgent
+from app.event_bus import EventType
 from app.logger import logger
 from app.prompt.toolcall import NEXT_STEP_PROMPT, SYSTEM_PROMPT
 from app.schema import AgentState, Message, ToolCall
@@ -30,23 +32,100 @@ class ToolCallAgent(ReActAgent):
 
     tool_calls: List[ToolCall] = Field(default_factory=list)
 
+    # Concurrent tool execution: independent calls from one turn run together,
+    # while calls to exclusive tools stay serialized in their original order.
+    parallel_tool_calls: bool = False
+    max_parallel_tool_calls: int = Field(
+        default=4, description="Maximum tool calls running at the same time"
+    )
+    # Stream the model response and start each tool call as soon as its
+    # arguments are complete, instead of waiting for the whole response
+    stream_tool_calls: bool = False
+
     max_steps: int = 5
 
-    async def think(self) -> bool:
-        """Process current state and decide next actions using tools"""
+    _tool_runs: Dict[str, asyncio.Task] = PrivateAttr(default_factory=dict)
+    _tool_semaphore: Optional[asyncio.Semaphore] = PrivateAttr(default=None)
+    _exclusive_lock: Optional[asyncio.Lock] = PrivateAttr(default=None)
+    # (request, response task) started by `speculate`, and the response the
+    # current run's first `think` uses instead of asking the LLM
+    _speculation: Optional[Tuple[str, asyncio.Task]] = PrivateAttr(default=None)
+    _pending_response: Optional[asyncio.Task] = PrivateAttr(default=None)
+
+    async def run(self, request: Optional[str] = None) -> str:
+        # A speculation for another request is left for its owner to discard
+        if self._speculation and self._speculation[0] == request:
+            self._pending_response = self._speculation[1]
+            self._speculation = None
+        try:
+            return await super().run(request)
+        finally:
+            if self._pending_response is not None:
+                self._pending_response.cancel()
+                self._pending_response = None
+
+    def speculate(self, request: str, history: List[Message]) -> None:
+        """Start the first LLM call of a later `run(request)` now.
+
+        The call sees `history` instead of the memory at the time of the run,
+        so this is only correct when the request does not depend on anything
+        that happens in between.
+        """
+        self.discard_speculation()
+        messages = history + [Message.user_message(request)]
         if self.next_step_prompt:
-            user_msg = Message.user_message(self.next_step_prompt)
-            self.messages += [user_msg]
-
-        # Get response with tool options
-        response = await self.llm.ask_tool(
-            messages=self.messages,
+            messages.append(Message.user_message(self.next_step_prompt))
+        self._speculation = (request, asyncio.create_task(self._ask(messages)))
+
+    def discard_speculation(self) -> None:
+        """Cancel a speculative call that `run` will not use"""
+        if self._speculation is not None:
+            self._speculation[1].cancel()
+            self._speculation = None
+
+    async def _ask(self, messages: List[Message], **kwargs):
+        return await self.llm.ask_tool(
+            messages=messages,
             system_msgs=[Message.system_message(self.system_prompt)]
             if self.system_prompt
             else None,
             tools=self.available_tools.to_params(),
             tool_choice=self.tool_choices,
+            **kwargs,
+        )
+
+    async def think(self) -> bool:
+        """Process current state and decide next actions using tools"""
+        if self.next_step_prompt:
+            user_msg = Message.user_message(self.next_step_prompt)
+            self.memory.add_message(user_msg)
+
+        self._reset_tool_runs()
+        stream_kwargs = (
+            {
+                "stream": True,
+                "on_token": self._on_thought_token,
+                "on_tool_call": self._on_streamed_tool_call,
+            }
+            if self.stream_tool_calls
+            else {}
         )
+
+        # Get response with tool options, unless it was started speculatively
+        response = None
+        pending, self._pending_response = self._pending_response, None
+        if pending is not None:
+            try:
+                response = await pending
+            except Exception as e:
+                logger.warning(f"Speculative LLM call failed, asking again: {e}")
+        if response is None:
+            try:
+                response = await self._ask(self.messages, **stream_kwargs)
+            except BaseException:
+                # Calls started from a stream that then failed belong to no step
+                await self._cancel_tool_runs()
+                raise
         self.tool_calls = response.tool_calls
 
         # Log response info
@@ -58,6 +137,15 @@ class ToolCallAgent(ReActAgent):
             logger.info(
                 f"🧰 Tools being prepared: {[call.function.name for call in response.tool_calls]}"
             )
+        if response.content:
+            await self.emit(EventType.THOUGHT, response.content)
+        if response.tool_calls:
+            tool_names = [call.function.name for call in response.tool_calls]
+            await self.emit(
+                EventType.TOOL_SELECTED,
+                f"{self.name} selected {len(tool_names)} tools: {', '.join(tool_names)}",
+                tools=tool_names,
+            )
 
         try:
             # Handle different tool_choices modes
@@ -107,9 +195,20 @@ class ToolCallAgent(ReActAgent):
             # Return last message content if no tool calls
             return self.messages[-1].content or "No content or commands to execute"
 
+        if (self.parallel_tool_calls and len(self.tool_calls) > 1) or self._tool_runs:
+            # Calls already started while the response was streaming are joined here
+            try:
+                outputs = await asyncio.gather(
+                    *(self._start_tool_call(command) for command in self.tool_calls)
+                )
+            finally:
+                self._reset_tool_runs()
+        else:
+            outputs = None
+
         results = []
-        for command in self.tool_calls:
-            result = await self.execute_tool(command)
+        for i, command in enumerate(self.tool_calls):
+            result = outputs[i] if outputs else await self.execute_tool(command)
             logger.info(
                 f"🎯 Tool '{command.function.name}' completed its mission! Result: {result}"
             )
@@ -123,6 +222,56 @@ class ToolCallAgent(ReActAgent):
 
         return "\n\n".join(results)
 
+    def _reset_tool_runs(self) -> None:
+        """Drop scheduling state from the previous step, cancelling stale calls."""
+        for run in self._tool_runs.values():
+            if not run.done():
+                run.cancel()
+        self._tool_runs = {}
+        self._tool_semaphore = None
+        self._exclusive_lock = None
+
+    async def _cancel_tool_runs(self) -> None:
+        """Cancel this step's started calls and wait until they have stopped."""
+        runs = list(self._tool_runs.values())
+        self._reset_tool_runs()
+        await asyncio.gather(*runs, return_exceptions=True)
+
+    def _start_tool_call(self, command: ToolCall) -> asyncio.Task:
+        """Schedule a tool call for this step, or return the already running one.
+
+        Without `parallel_tool_calls` at most one call runs at a time, in call
+        order. Otherwise at most `max_parallel_tool_calls` run at once, and calls
+        to exclusive tools share a lock so they never overlap and keep their order.
+        """
+        if command.id in self._tool_runs:
+            return self._tool_runs[command.id]
+
+        if self._tool_semaphore is None:
+            limit = self.max_parallel_tool_calls if self.parallel_tool_calls else 1
+            self._tool_semaphore = asyncio.Semaphore(max(1, limit))
+            self._exclusive_lock = asyncio.Lock()
+
+        async def run() -> str:
+            tool = self.available_tools.get_tool(command.function.name)
+            if tool is not None and tool.exclusive:
+                async with self._exclusive_lock, self._tool_semaphore:
+                    return await self.execute_tool(command)
+            async with self._tool_semaphore:
+                return await self.execute_tool(command)
+
+        self._tool_runs[command.id] = asyncio.create_task(run())
+        return self._tool_runs[command.id]
+
+    async def _on_thought_token(self, token: str) -> None:
+        """Publish a streamed content token as it arrives."""
+        await self.emit(EventType.THOUGHT_DELTA, token)
+
+    def _on_streamed_tool_call(self, command: ToolCall) -> None:
+        """Start a tool call whose arguments finished streaming."""
+        if self.tool_choices != "none":
+            self._start_tool_call(command)
+
     async def execute_tool(self, command: ToolCall) -> str:
         """Execute a single tool call with robust error handling"""
         if not command or not command.function or not command.function.name:
@@ -138,6 +287,13 @@ class ToolCallAgent(ReActAgent):
 
             # Execute the tool
             logger.info(f"🔧 Activating tool: '{name}'...")
+            await self.emit(
+                EventType.TOOL_STARTED,
+                f"Activating tool: '{name}'",
+                tool=name,
+                tool_call_id=command.id,
+                arguments=args,
+            )
             result = await self.available_tools.execute(name=name, tool_input=args)
 
             # Format result for display
@@ -150,18 +306,32 @@ class ToolCallAgent(ReActAgent):
             # Handle special tools like `finish`
             await self._handle_special_tool(name=name, result=result)
 
+            await self._emit_tool_finished(command, observation)
             return observation
         except json.JSONDecodeError:
             error_msg = f"Error parsing arguments for {name}: Invalid JSON format"
             logger.error(
                 f"📝 Oops! The arguments for '{name}' don't make sense - invalid JSON, arguments:{command.function.arguments}"
             )
+            await self._emit_tool_finished(command, f"Error: {error_msg}", error=True)
             return f"Error: {error_msg}"
         except Exception as e:
             error_msg = f"⚠️ Tool '{name}' encountered a problem: {str(e)}"
             logger.error(error_msg)
+            await self._emit_tool_finished(command, f"Error: {error_msg}", error=True)
             return f"Error: {error_msg}"
 
+    async def _emit_tool_finished(
+        self, command: ToolCall, observation: str, error: bool = False
+    ) -> None:
+        await self.emit(
+            EventType.TOOL_FINISHED,
+            observation,
+            tool=command.function.name,
+            tool_call_id=command.id,
+            error=error,
+        )
+
     async def _handle_special_tool(self, name: str, result: Any, **kwargs):
         """Handle special tool execution and state changes"""
         if not self._is_special_tool(name):
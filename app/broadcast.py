@@ -0,0 +1,127 @@
+import asyncio
+import weakref
+from typing import Any, List, Optional
+
+from app.exceptions import SlowConsumerError
+
+
+class BroadcastChannel:
+    """A bounded ring buffer of events that any number of subscribers can read.
+
+    Each event is stored once, however many subscribers there are; a subscriber
+    only holds a cursor into the ring. When the ring is full, `send` waits up to
+    `max_wait` seconds for subscribers that have not read the oldest event to
+    catch up; after that, or straight away with `publish`, the oldest event is
+    overwritten and a subscriber whose cursor falls behind it is dropped with
+    `SlowConsumerError`.
+    """
+
+    def __init__(self, capacity: int = 1024, max_wait: float = 0):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.max_wait = max_wait
+        self._ring: List[Any] = [None] * capacity
+        # Absolute positions: events [start, end) are currently buffered
+        self.start = 0
+        self.end = 0
+        self.closed = False
+        self._wakeup = asyncio.Event()
+        self._subscribers: "weakref.WeakSet[Subscription]" = weakref.WeakSet()
+        # Set by subscribers as they read, while a sender waits for room
+        self._progress: Optional[asyncio.Event] = None
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, event: Any) -> None:
+        """Publish an event, first giving lagging subscribers up to `max_wait` seconds to make room"""
+        async with self._send_lock:
+            if self.max_wait > 0 and self._blocked():
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + self.max_wait
+                while self._blocked():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    self._progress = asyncio.Event()
+                    try:
+                        await asyncio.wait_for(self._progress.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    finally:
+                        self._progress = None
+            self.publish(event)
+
+    def publish(self, event: Any) -> None:
+        """Append an event and wake up waiting subscribers"""
+        if self.closed:
+            raise RuntimeError("Cannot publish to a closed channel")
+        self._ring[self.end % self.capacity] = event
+        self.end += 1
+        if self.end - self.start > self.capacity:
+            self.start = self.end - self.capacity
+        self._notify()
+
+    def close(self) -> None:
+        """Mark the end of the stream; subscribers drain what is left and stop"""
+        self.closed = True
+        self._notify()
+
+    def subscribe(self, from_start: bool = False) -> "Subscription":
+        """Subscribe from the next published event, or from the oldest buffered one"""
+        subscription = Subscription(self, self.start if from_start else self.end)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def _blocked(self) -> bool:
+        """Whether publishing now would overwrite an event a subscriber has not read"""
+        if self.end - self.start < self.capacity:
+            return False
+        return any(sub.cursor == self.start for sub in self._subscribers)
+
+    def _notify(self) -> None:
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+
+class Subscription:
+    """A reader's position in a `BroadcastChannel`"""
+
+    def __init__(self, channel: BroadcastChannel, cursor: int):
+        self.channel = channel
+        self.cursor = cursor
+
+    def close(self) -> None:
+        """Stop reading; the channel no longer waits for this subscriber"""
+        self.channel._subscribers.discard(self)
+
+    @property
+    def lag(self) -> int:
+        """Number of buffered events this subscriber has not read yet"""
+        return self.channel.end - self.cursor
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Any]:
+        """
+        Wait for the next event.
+
+        Returns None once the channel is closed and fully drained.
+
+        Raises:
+            SlowConsumerError: If unread events were overwritten by newer ones
+            asyncio.TimeoutError: If no event arrives within `timeout` seconds
+        """
+        channel = self.channel
+        while True:
+            if self.cursor < channel.start:
+                self.close()
+                raise SlowConsumerError(
+                    f"Subscriber fell {channel.start - self.cursor} events behind"
+                )
+            if self.cursor < channel.end:
+                event = channel._ring[self.cursor % channel.capacity]
+                self.cursor += 1
+                if channel._progress is not None:
+                    channel._progress.set()
+                return event
+            if channel.closed:
+                return None
+            await asyncio.wait_for(channel._wakeup.wait(), timeout)
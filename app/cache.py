@@ -0,0 +1,130 @@
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+from app.config import PROJECT_ROOT, CacheSettings, config
+from app.logger import logger
+
+
+class ResponseCache:
+    """Content-addressed cache of LLM responses.
+
+    An in-memory LRU tier sits in front of an optional SQLite tier, so
+    responses survive restarts. Entries expire `ttl` seconds after they are
+    written. Values must be JSON-serializable.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        max_entries: int = 1000,
+        ttl: Optional[float] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expiry timestamp or None, value), least recently used first
+        self._memory: OrderedDict[str, Tuple[Optional[float], Any]] = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at < ?",
+                (time.time(),),
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(**request: Any) -> str:
+        """Hash a request; equal requests map to the same key"""
+        payload = json.dumps(
+            request, sort_keys=True, separators=(",", ":"), default=str
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or expires_at > now:
+                self._memory.move_to_end(key)
+                return value
+            del self._memory[key]
+
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = json.loads(row[0]), row[1]
+        if expires_at is not None and expires_at <= now:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+            return None
+        self._remember(key, expires_at, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        self._remember(key, expires_at, value)
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) "
+                "VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to persist cached LLM response: {e}")
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _remember(self, key: str, expires_at: Optional[float], value: Any) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def create_response_cache(settings: CacheSettings) -> ResponseCache:
+    """Create the response cache described by the config"""
+    path = None
+    if settings.path:
+        path = Path(settings.path)
+        if not path.is_absolute():
+            path = PROJECT_ROOT / path
+    return ResponseCache(path, max_entries=settings.max_entries, ttl=settings.ttl)
+
+
+def get_response_cache() -> ResponseCache:
+    """Get the process-wide response cache, creating it on first use"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = create_response_cache(config.llm_cache)
+    return _response_cache
@@ -1,7 +1,7 @@
 import threading
 import tomllib
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -23,10 +23,121 @@ class LLMSettings(BaseModel):
     temperature: float = Field(1.0, description="Sampling temperature")
     api_type: str = Field(..., description="AzureOpenai or Openai")
     api_version: str = Field(..., description="Azure Openai version if AzureOpenai")
+    max_input_tokens: Optional[int] = Field(
+        None, description="Token budget for agent memory sent with each request"
+    )
+    requests_per_minute: Optional[int] = Field(
+        None, description="Client-side request limit for this config"
+    )
+    tokens_per_minute: Optional[int] = Field(
+        None, description="Client-side token limit for this config"
+    )
+
+
+class TaskStoreSettings(BaseModel):
+    backend: Literal["memory", "sqlite"] = Field(
+        "memory", description="Where API tasks are stored"
+    )
+    path: str = Field(
+        "workspace/tasks.db", description="SQLite database path, relative to project"
+    )
+    max_tasks: int = Field(1000, description="Finished tasks kept by memory backend")
+    ttl: Optional[float] = Field(
+        86400, description="Seconds an idle finished task is kept in memory"
+    )
+    batch_size: int = Field(50, description="Step events per SQLite write batch")
+    flush_interval: float = Field(
+        1.0, description="Max seconds a step event waits before being written"
+    )
+
+
+class ServerSettings(BaseModel):
+    event_buffer_size: int = Field(
+        1024, description="Events buffered per task for SSE subscribers"
+    )
+    slow_subscriber_wait: float = Field(
+        1.0,
+        ge=0,
+        description="Seconds a task waits for a lagging SSE subscriber before dropping it",
+    )
+    max_concurrent_tasks: int = Field(
+        2, ge=1, description="Tasks that run at the same time"
+    )
+    executor: Literal["inline", "process"] = Field(
+        "inline",
+        description="Run flows on the server's event loop, or in worker processes",
+    )
+    max_queued_tasks: int = Field(
+        100, ge=0, description="Tasks that can wait to run before new ones are rejected"
+    )
+
+
+class HTTPSettings(BaseModel):
+    max_connections: int = Field(100, description="Open connections per endpoint")
+    max_keepalive_connections: int = Field(
+        20, description="Idle connections kept open per endpoint"
+    )
+    keepalive_expiry: float = Field(
+        30.0, description="Seconds an idle connection is kept open"
+    )
+    http2: bool = Field(False, description="Use HTTP/2 (requires the h2 package)")
+    connect_timeout: float = Field(10.0, description="Seconds to open a connection")
+    request_timeout: float = Field(
+        600.0, description="Seconds to wait for a response per request"
+    )
+
+
+class CacheSettings(BaseModel):
+    temperature_zero: bool = Field(
+        False, description="Cache every LLM call made with temperature 0"
+    )
+    path: Optional[str] = Field(
+        "workspace/llm_cache.db",
+        description="SQLite database path, relative to project; empty for memory only",
+    )
+    max_entries: int = Field(1000, description="Responses kept in memory")
+    ttl: Optional[float] = Field(
+        604800, description="Seconds a cached response stays valid"
+    )
+
+
+class BashSettings(BaseModel):
+    pool_size: int = Field(
+        2, ge=0, description="Idle bash shells kept started for the bash tool"
+    )
+
+
+class PythonExecuteSettings(BaseModel):
+    pool_size: int = Field(
+        2, ge=0, description="Idle Python interpreters kept started for python_execute"
+    )
+    max_memory_mb: int = Field(
+        2048, ge=0, description="Address space limit per interpreter; 0 for none"
+    )
+    timeout: float = Field(
+        120,
+        gt=0,
+        description="Seconds a call may run before its interpreter is killed",
+    )
+    max_cpu_seconds: int = Field(
+        60,
+        ge=0,
+        description="CPU seconds a single call may use; below timeout so that a busy call hits it first; 0 for none",
+    )
+    preload: List[str] = Field(
+        ["numpy", "pandas"],
+        description="Modules imported once by the template python_execute interpreters are forked from",
+    )
 
 
 class AppConfig(BaseModel):
     llm: Dict[str, LLMSettings]
+    http: HTTPSettings = Field(default_factory=HTTPSettings)
+    llm_cache: CacheSettings = Field(default_factory=CacheSettings)
+    task_store: TaskStoreSettings = Field(default_factory=TaskStoreSettings)
+    server: ServerSettings = Field(default_factory=ServerSettings)
+    bash: BashSettings = Field(default_factory=BashSettings)
+    python_execute: PythonExecuteSettings = Field(default_factory=PythonExecuteSettings)
 
 
 class Config:
@@ -80,6 +191,9 @@ class Config:
             "temperature": base_llm.get("temperature", 1.0),
             "api_type": base_llm.get("api_type", ""),
             "api_version": base_llm.get("api_version", ""),
+            "max_input_tokens": base_llm.get("max_input_tokens"),
+            "requests_per_minute": base_llm.get("requests_per_minute"),
+            "tokens_per_minute": base_llm.get("tokens_per_minute"),
         }
 
         config_dict = {
@@ -89,7 +203,13 @@ class Config:
                     name: {**default_settings, **override_config}
                     for name, override_config in llm_overrides.items()
                 },
-            }
+            },
+            "http": raw_config.get("http", {}),
+            "llm_cache": raw_config.get("llm_cache", {}),
+            "task_store": raw_config.get("task_store", {}),
+            "server": raw_config.get("server", {}),
+            "bash": raw_config.get("bash", {}),
+            "python_execute": raw_config.get("python_execute", {}),
         }
 
         self._config = AppConfig(**config_dict)
@@ -98,5 +218,29 @@ class Config:
     def llm(self) -> Dict[str, LLMSettings]:
         return self._config.llm
 
+    @property
+    def http(self) -> HTTPSettings:
+        return self._config.http
+
+    @property
+    def llm_cache(self) -> CacheSettings:
+        return self._config.llm_cache
+
+    @property
+    def task_store(self) -> TaskStoreSettings:
+        return self._config.task_store
+
+    @property
+    def server(self) -> ServerSettings:
+        return self._config.server
+
+    @property
+    def bash(self) -> BashSettings:
+        return self._config.bash
+
+    @property
+    def python_execute(self) -> PythonExecuteSettings:
+        return self._config.python_execute
+
 
 config = Config()
@@ -0,0 +1,99 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from pydantic import BaseModel, Field
+
+
+# The task whose work is running in the current context. Set by the API server
+# around each task run; copied automatically into every asyncio task it spawns.
+current_task_id: ContextVar[Optional[str]] = ContextVar("current_task_id", default=None)
+
+
+@contextmanager
+def task_scope(task_id: Optional[str]):
+    """Attribute events emitted inside this block to the given task"""
+    token = current_task_id.set(task_id)
+    try:
+        yield
+    finally:
+        current_task_id.reset(token)
+
+
+class EventType(str, Enum):
+    """Kinds of events emitted by agents and flows"""
+
+    STEP = "step"
+    THOUGHT = "thought"
+    THOUGHT_DELTA = "thought_delta"
+    TOOL_SELECTED = "tool_selected"
+    TOOL_STARTED = "tool_started"
+    TOOL_FINISHED = "tool_finished"
+    TOOL_OUTPUT = "tool_output"
+    PLAN_UPDATED = "plan_updated"
+
+
+class AgentEvent(BaseModel):
+    """A structured event describing agent or flow progress"""
+
+    type: EventType
+    source: str = Field(..., description="Name of the emitting agent or flow")
+    content: str = Field("", description="Human-readable summary")
+    data: Dict[str, Any] = Field(default_factory=dict)
+    task_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+EventHandler = Callable[[AgentEvent], Union[None, Awaitable[None]]]
+
+
+class EventBus:
+    """In-process publish/subscribe bus for `AgentEvent`s.
+
+    Handlers subscribe either to one task or globally (task_id=None). An event
+    is delivered to the global handlers and to the handlers of the task in whose
+    scope it was emitted, so dispatch cost does not grow with the number of
+    concurrently running tasks.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[Optional[str], List[EventHandler]] = {}
+
+    def subscribe(
+        self, handler: EventHandler, task_id: Optional[str] = None
+    ) -> EventHandler:
+        """Register a handler for one task's events, or for all events"""
+        self._handlers.setdefault(task_id, []).append(handler)
+        return handler
+
+    def unsubscribe(self, handler: EventHandler, task_id: Optional[str] = None):
+        """Remove a previously registered handler"""
+        handlers = self._handlers.get(task_id)
+        if handlers and handler in handlers:
+            handlers.remove(handler)
+            if not handlers:
+                del self._handlers[task_id]
+
+    async def emit(self, event: AgentEvent) -> None:
+        """Deliver an event to its subscribers, in subscription order"""
+        if event.task_id is None:
+            event.task_id = current_task_id.get()
+
+        handlers = self._handlers.get(None, [])
+        if event.task_id is not None:
+            handlers = handlers + self._handlers.get(event.task_id, [])
+
+        for handler in handlers:
+            try:
+                result = handler(event)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                print(f"Error in event handler: {e}")
+
+
+# Process-wide bus shared by agents, flows and the API server
+event_bus = EventBus()
@@ -3,3 +3,20 @@ class ToolError(Exception):
 
     def __init__(self, message):
         self.message = message
+
+
+class SlowConsumerError(Exception):
+    """Raised when an event subscriber falls too far behind the publisher."""
+
+
+class QueueFullError(Exception):
+    """Raised when a task is submitted to a scheduler whose queue is full."""
+
+
+class WorkerError(Exception):
+    """Raised when a task fails inside a worker process."""
+
+
+class StreamInterruptedError(Exception):
+    """Raised when a streamed LLM response fails after some of its tool calls
+    were already started; retrying would start them a second time."""
@@ -1,15 +1,19 @@
+import asyncio
 import json
+import re
 import time
 from typing import Dict, List, Optional, Union
 
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 
 from app.agent.base import BaseAgent
+from app.event_bus import AgentEvent, EventType, event_bus
 from app.flow.base import BaseFlow
 from app.llm import LLM
 from app.logger import logger
 from app.schema import AgentState, Message
 from app.tool import PlanningTool
+from app.tool.planning import Plan
 
 
 class PlanningFlow(BaseFlow):
@@ -20,6 +24,21 @@ class PlanningFlow(BaseFlow):
     executor_keys: List[str] = Field(default_factory=list)
     active_plan_id: str = Field(default_factory=lambda: f"plan_{int(time.time())}")
     current_step_index: Optional[int] = None
+    # Reuse cached responses for plan creation and the final summary;
+    # None leaves it to [llm_cache] temperature_zero
+    cache_plans: Optional[bool] = None
+    # Pipelining: while a step runs, build the next step's prompt against the
+    # plan as it will look once the step completes
+    pipeline_steps: bool = False
+    # With pipelining, also start the next step's first LLM call early when
+    # that step does not depend on the current one (see `_step_is_independent`)
+    speculative_steps: bool = False
+
+    # Steps whose dependencies are completed run concurrently, each on its own
+    # idle executor agent, up to this many at a time
+    max_parallel_steps: int = 1
+
+    _prefetch: Optional[dict] = PrivateAttr(default=None)
 
     def __init__(
         self, agents: Union[BaseAgent, List[BaseAgent], Dict[str, BaseAgent]], **data
@@ -78,6 +97,9 @@ class PlanningFlow(BaseFlow):
                     )
                     return f"Failed to create plan for: {input_text}"
 
+            if self.max_parallel_steps > 1:
+                return await self._execute_parallel()
+
             result = ""
             while True:
                 # Get current step to execute
@@ -91,7 +113,10 @@ class PlanningFlow(BaseFlow):
                 # Execute current step with appropriate agent
                 step_type = step_info.get("type") if step_info else None
                 executor = self.get_executor(step_type)
-                step_result = await self._execute_step(executor, step_info)
+                step_prompt = self._take_prefetched_prompt(self.current_step_index)
+                if self.pipeline_steps:
+                    self._prefetch_next_step(self.current_step_index)
+                step_result = await self._execute_step(executor, step_info, step_prompt)
                 result += step_result + "\n"
 
                 # Check if agent wants to terminate
@@ -102,17 +127,25 @@ class PlanningFlow(BaseFlow):
         except Exception as e:
             logger.error(f"Error in PlanningFlow: {str(e)}")
             return f"Execution failed: {str(e)}"
+        finally:
+            self._discard_prefetch()
 
     async def _create_initial_plan(self, request: str) -> None:
         """Create an initial plan based on the request using the flow's LLM and PlanningTool."""
         logger.info(f"Creating initial plan with ID: {self.active_plan_id}")
 
         # Create a system message for plan creation
-        system_message = Message.system_message(
+        system_prompt = (
             "You are a planning assistant. Create a concise, actionable plan with clear steps. "
             "Focus on key milestones rather than detailed sub-steps. "
             "Optimize for clarity and efficiency."
         )
+        if self.max_parallel_steps > 1:
+            system_prompt += (
+                " Declare step dependencies so that steps which do not need each "
+                "other's results can run in parallel."
+            )
+        system_message = Message.system_message(system_prompt)
 
         # Create a user message with the request
         user_message = Message.user_message(
@@ -125,6 +158,7 @@ class PlanningFlow(BaseFlow):
             system_msgs=[system_message],
             tools=[self.planning_tool.to_param()],
             tool_choice="required",
+            cache=self.cache_plans,
         )
 
         # Process tool calls if present
@@ -147,6 +181,7 @@ class PlanningFlow(BaseFlow):
                     result = await self.planning_tool.execute(**args)
 
                     logger.info(f"Plan creation result: {str(result)}")
+                    await self._emit_plan_updated()
                     return
 
         # If execution reached here, create a default plan
@@ -161,10 +196,11 @@ class PlanningFlow(BaseFlow):
                 "steps": ["Analyze request", "Execute task", "Verify results"],
             }
         )
+        await self._emit_plan_updated()
 
     async def _get_current_step_info(self) -> tuple[Optional[int], Optional[dict]]:
         """
-        Parse the current plan to identify the first non-completed step's index and info.
+        Identify the next actionable step's index and info from the plan model.
         Returns (None, None) if no active step is found.
         """
         if (
@@ -176,195 +212,285 @@ class PlanningFlow(BaseFlow):
 
         try:
             # Direct access to plan data from planning tool storage
-            plan_data = self.planning_tool.plans[self.active_plan_id]
-            steps = plan_data.get("steps", [])
-            step_statuses = plan_data.get("step_statuses", [])
-
-            # Find first non-completed step
-            for i, step in enumerate(steps):
-                if i >= len(step_statuses):
-                    status = "not_started"
-                else:
-                    status = step_statuses[i]
-
-                if status in ["not_started", "in_progress"]:
-                    # Extract step type/category if available
-                    step_info = {"text": step}
-
-                    # Try to extract step type from the text (e.g., [SEARCH] or [CODE])
-                    import re
-
-                    type_match = re.search(r"\[([A-Z_]+)\]", step)
-                    if type_match:
-                        step_info["type"] = type_match.group(1).lower()
-
-                    # Mark current step as in_progress
-                    try:
-                        await self.planning_tool.execute(
-                            command="mark_step",
-                            plan_id=self.active_plan_id,
-                            step_index=i,
-                            step_status="in_progress",
-                        )
-                    except Exception as e:
-                        logger.warning(f"Error marking step as in_progress: {e}")
-                        # Update step status directly if needed
-                        if i < len(step_statuses):
-                            step_statuses[i] = "in_progress"
-                        else:
-                            while len(step_statuses) < i:
-                                step_statuses.append("not_started")
-                            step_statuses.append("in_progress")
-
-                        plan_data["step_statuses"] = step_statuses
-
-                    return i, step_info
-
-            return None, None  # No active step found
+            plan = self.planning_tool.plans[self.active_plan_id]
+            i = plan.next_step_index
+            if i is None:
+                return None, None  # No active step found
+
+            # Extract step type/category if available
+            step_info = self._parse_step(plan.steps[i])
+
+            await self._mark_step(i, "in_progress")
+            return i, step_info
 
         except Exception as e:
             logger.warning(f"Error finding current step index: {e}")
             return None, None
 
-    async def _execute_step(self, executor: BaseAgent, step_info: dict) -> str:
-        """Execute the current step with the specified agent using agent.run()."""
-        # Prepare context for the agent with current plan status
-        plan_status = await self._get_plan_text()
-        step_text = step_info.get("text", f"Step {self.current_step_index}")
-
-        # Create a prompt for the agent to execute the current step
-        step_prompt = f"""
-        CURRENT PLAN STATUS:
-        {plan_status}
+    async def _execute_parallel(self) -> str:
+        """Run ready steps concurrently, each on an idle executor, until none are left."""
+        running: Dict[asyncio.Task, int] = {}
+        executors: Dict[int, BaseAgent] = {}
+        results: Dict[int, str] = {}
+        finished = False
+        try:
+            while not finished:
+                plan = self.planning_tool.plans[self.active_plan_id]
+                for index in plan.ready_steps():
+                    if len(running) >= self.max_parallel_steps:
+                        break
+                    if index in executors:
+                        continue
+                    step_info = self._parse_step(plan.steps[index])
+                    executor = self._get_idle_executor(
+                        step_info.get("type"), executors.values()
+                    )
+                    if executor is None:
+                        break
+                    await self._mark_step(index, "in_progress")
+                    executors[index] = executor
+                    job = asyncio.create_task(
+                        self._execute_step(executor, step_info, step_index=index)
+                    )
+                    running[job] = index
 
-        YOUR CURRENT TASK:
-        You are now working on step {self.current_step_index}: "{step_text}"
+                if not running:
+                    break
 
-        Please execute this step using the appropriate tools. When you're done, provide a summary of what you accomplished.
-        """
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for job in done:
+                    index = running.pop(job)
+                    executor = executors.pop(index)
+                    results[index] = job.result()
+                    if plan.step_statuses[index] != "completed":
+                        # Keep its dependents from running on a failed step
+                        await self._mark_step(index, "blocked")
+                    if executor.state == AgentState.FINISHED:
+                        finished = True
+        finally:
+            for job in running:
+                job.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+        result = "".join(f"{results[index]}\n" for index in sorted(results))
+        if not finished:
+            result += await self._finalize_plan()
+        return result
+
+    def _get_idle_executor(self, step_type: Optional[str], busy) -> Optional[BaseAgent]:
+        """An executor agent not running another step, preferring one matching the step type."""
+        busy_ids = {id(agent) for agent in busy}
+        if step_type in self.agents and id(self.agents[step_type]) not in busy_ids:
+            return self.agents[step_type]
+        for key in self.executor_keys:
+            agent = self.agents.get(key)
+            if agent is not None and id(agent) not in busy_ids:
+                return agent
+        return None
+
+    @staticmethod
+    def _parse_step(step: str) -> dict:
+        step_info = {"text": step}
+
+        # Try to extract step type from the text (e.g., [SEARCH] or [CODE])
+        type_match = re.search(r"\[([A-Z_]+)\]", step)
+        if type_match:
+            step_info["type"] = type_match.group(1).lower()
+        return step_info
+
+    async def _execute_step(
+        self,
+        executor: BaseAgent,
+        step_info: dict,
+        step_prompt: Optional[str] = None,
+        step_index: Optional[int] = None,
+    ) -> str:
+        """Execute a step (the current one by default) with the specified agent using agent.run()."""
+        if step_index is None:
+            step_index = self.current_step_index
+        if step_prompt is None:
+            # Prepare context for the agent with current plan status
+            plan_status = await self._get_plan_text()
+            step_prompt = self._build_step_prompt(step_index, step_info, plan_status)
 
         # Use agent.run() to execute the step
         try:
             step_result = await executor.run(step_prompt)
 
             # Mark the step as completed after successful execution
-            await self._mark_step_completed()
+            await self._mark_step_completed(step_index)
 
             return step_result
         except Exception as e:
-            logger.error(f"Error executing step {self.current_step_index}: {e}")
-            return f"Error executing step {self.current_step_index}: {str(e)}"
+            logger.error(f"Error executing step {step_index}: {e}")
+            return f"Error executing step {step_index}: {str(e)}"
+
+    @staticmethod
+    def _build_step_prompt(step_index: int, step_info: dict, plan_status: str) -> str:
+        """Create a prompt for the agent to execute a step"""
+        step_text = step_info.get("text", f"Step {step_index}")
+        return f"""
+        CURRENT PLAN STATUS:
+        {plan_status}
 
-    async def _mark_step_completed(self) -> None:
-        """Mark the current step as completed."""
-        if self.current_step_index is None:
+        YOUR CURRENT TASK:
+        You are now working on step {step_index}: "{step_text}"
+
+        Please execute this step using the appropriate tools. When you're done, provide a summary of what you accomplished.
+        """
+
+    def _step_is_independent(self, step_index: int, next_index: int) -> bool:
+        """Whether step `next_index` can start without the result of `step_index`,
+        i.e. it does not depend on it directly or transitively."""
+        plan = self.planning_tool.plans.get(self.active_plan_id)
+        if not plan:
+            return False
+        dependencies = plan.dependencies()
+        pending, seen = [next_index], set()
+        while pending:
+            for dep in dependencies[pending.pop()]:
+                if dep == step_index:
+                    return False
+                if dep not in seen:
+                    seen.add(dep)
+                    pending.append(dep)
+        return True
+
+    def _prefetch_next_step(self, step_index: int) -> None:
+        """Prepare the step expected to run after `step_index`, assuming it completes.
+
+        The prompt is rendered against the predicted plan, and if the next step
+        is independent its first LLM call is started on the executor's history
+        as it is now. `_take_prefetched_prompt` only uses the result if the plan
+        turns out exactly as predicted.
+        """
+        self._discard_prefetch()
+        plan = self.planning_tool.plans.get(self.active_plan_id)
+        if not plan:
             return
 
+        predicted = plan.model_copy(deep=True)
+        predicted.mark(step_index, "completed")
+        next_index = predicted.next_step_index
+        if next_index is None:
+            return
+        predicted.mark(next_index, "in_progress")
+
+        step_info = self._parse_step(predicted.steps[next_index])
+        prompt = self._build_step_prompt(next_index, step_info, predicted.render())
+        executor = self.get_executor(step_info.get("type"))
+        self._prefetch = {
+            "step_index": next_index,
+            "snapshot": self._plan_snapshot(predicted),
+            "prompt": prompt,
+            "executor": executor,
+        }
+
+        if (
+            self.speculative_steps
+            and hasattr(executor, "speculate")
+            and self._step_is_independent(step_index, next_index)
+        ):
+            logger.info(f"Speculatively starting step {next_index}")
+            executor.speculate(prompt, history=list(executor.memory.messages))
+
+    def _take_prefetched_prompt(self, step_index: int) -> Optional[str]:
+        """The prefetched prompt for this step, or None if the plan changed since"""
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch is None:
+            return None
+        plan = self.planning_tool.plans.get(self.active_plan_id)
+        if (
+            prefetch["step_index"] == step_index
+            and plan
+            and self._plan_snapshot(plan) == prefetch["snapshot"]
+        ):
+            return prefetch["prompt"]
+
+        logger.info(
+            f"Plan changed; discarding prefetched step {prefetch['step_index']}"
+        )
+        self._cancel_speculation(prefetch)
+        return None
+
+    def _discard_prefetch(self) -> None:
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch:
+            self._cancel_speculation(prefetch)
+
+    @staticmethod
+    def _cancel_speculation(prefetch: dict) -> None:
+        if hasattr(prefetch["executor"], "discard_speculation"):
+            prefetch["executor"].discard_speculation()
+
+    @staticmethod
+    def _plan_snapshot(plan: Plan) -> tuple:
+        return (
+            plan.title,
+            tuple(plan.steps),
+            tuple(plan.step_statuses),
+            tuple(plan.step_notes),
+        )
+
+    async def _mark_step_completed(self, step_index: Optional[int] = None) -> None:
+        """Mark a step (the current one by default) as completed."""
+        if step_index is None:
+            step_index = self.current_step_index
+        if step_index is None:
+            return
+        await self._mark_step(step_index, "completed")
+
+    async def _mark_step(self, step_index: int, status: str) -> None:
+        """Set a step's status and publish the updated plan."""
         try:
-            # Mark the step as completed
             await self.planning_tool.execute(
                 command="mark_step",
                 plan_id=self.active_plan_id,
-                step_index=self.current_step_index,
-                step_status="completed",
+                step_index=step_index,
+                step_status=status,
             )
             logger.info(
-                f"Marked step {self.current_step_index} as completed in plan {self.active_plan_id}"
+                f"Marked step {step_index} as {status} in plan {self.active_plan_id}"
             )
         except Exception as e:
             logger.warning(f"Failed to update plan status: {e}")
             # Update step status directly in planning tool storage
-            if self.active_plan_id in self.planning_tool.plans:
-                plan_data = self.planning_tool.plans[self.active_plan_id]
-                step_statuses = plan_data.get("step_statuses", [])
-
-                # Ensure the step_statuses list is long enough
-                while len(step_statuses) <= self.current_step_index:
-                    step_statuses.append("not_started")
-
-                # Update the status
-                step_statuses[self.current_step_index] = "completed"
-                plan_data["step_statuses"] = step_statuses
-
-    async def _get_plan_text(self) -> str:
-        """Get the current plan as formatted text."""
-        try:
-            result = await self.planning_tool.execute(
-                command="get", plan_id=self.active_plan_id
+            plan = self.planning_tool.plans.get(self.active_plan_id)
+            if plan and 0 <= step_index < len(plan.steps):
+                plan.mark(step_index, status)
+
+        await self._emit_plan_updated(step_index=step_index, status=status)
+
+    async def _emit_plan_updated(
+        self, step_index: Optional[int] = None, status: Optional[str] = None
+    ) -> None:
+        """Publish the current plan after it was created or a step changed status."""
+        data = {"plan_id": self.active_plan_id}
+        if step_index is not None:
+            data.update(step_index=step_index, status=status)
+        await event_bus.emit(
+            AgentEvent(
+                type=EventType.PLAN_UPDATED,
+                source="planning_flow",
+                content=await self._get_plan_text(),
+                data=data,
             )
-            return result.output if hasattr(result, "output") else str(result)
-        except Exception as e:
-            logger.error(f"Error getting plan: {e}")
-            return self._generate_plan_text_from_storage()
-
-    def _generate_plan_text_from_storage(self) -> str:
-        """Generate plan text directly from storage if the planning tool fails."""
-        try:
-            if self.active_plan_id not in self.planning_tool.plans:
-                return f"Error: Plan with ID {self.active_plan_id} not found"
-
-            plan_data = self.planning_tool.plans[self.active_plan_id]
-            title = plan_data.get("title", "Untitled Plan")
-            steps = plan_data.get("steps", [])
-            step_statuses = plan_data.get("step_statuses", [])
-            step_notes = plan_data.get("step_notes", [])
-
-            # Ensure step_statuses and step_notes match the number of steps
-            while len(step_statuses) < len(steps):
-                step_statuses.append("not_started")
-            while len(step_notes) < len(steps):
-                step_notes.append("")
-
-            # Count steps by status
-            status_counts = {
-                "completed": 0,
-                "in_progress": 0,
-                "blocked": 0,
-                "not_started": 0,
-            }
-
-            for status in step_statuses:
-                if status in status_counts:
-                    status_counts[status] += 1
-
-            completed = status_counts["completed"]
-            total = len(steps)
-            progress = (completed / total) * 100 if total > 0 else 0
-
-            plan_text = f"Plan: {title} (ID: {self.active_plan_id})\n"
-            plan_text += "=" * len(plan_text) + "\n\n"
+        )
 
-            plan_text += (
-                f"Progress: {completed}/{total} steps completed ({progress:.1f}%)\n"
-            )
-            plan_text += f"Status: {status_counts['completed']} completed, {status_counts['in_progress']} in progress, "
-            plan_text += f"{status_counts['blocked']} blocked, {status_counts['not_started']} not started\n\n"
-            plan_text += "Steps:\n"
-
-            for i, (step, status, notes) in enumerate(
-                zip(steps, step_statuses, step_notes)
-            ):
-                if status == "completed":
-                    status_mark = "[✓]"
-                elif status == "in_progress":
-                    status_mark = "[→]"
-                elif status == "blocked":
-                    status_mark = "[!]"
-                else:  # not_started
-                    status_mark = "[ ]"
-
-                plan_text += f"{i}. {status_mark} {step}\n"
-                if notes:
-                    plan_text += f"   Notes: {notes}\n"
-
-            return plan_text
-        except Exception as e:
-            logger.error(f"Error generating plan text from storage: {e}")
-            return f"Error: Unable to retrieve plan with ID {self.active_plan_id}"
+    async def _get_plan_text(self, with_id: bool = True) -> str:
+        """Get the current plan as formatted text."""
+        plan = self.planning_tool.plans.get(self.active_plan_id)
+        if plan is None:
+            logger.error(f"Plan with ID {self.active_plan_id} not found")
+            return f"Error: Plan with ID {self.active_plan_id} not found"
+        return plan.render(with_id)
 
     async def _finalize_plan(self) -> str:
         """Finalize the plan and provide a summary using the flow's LLM directly."""
-        plan_text = await self._get_plan_text()
+        # The plan ID is time-based; leaving it out lets the summary be cached
+        plan_text = await self._get_plan_text(with_id=False)
 
         # Create a summary using the flow's LLM directly
         try:
@@ -377,7 +503,9 @@ class PlanningFlow(BaseFlow):
             )
 
             response = await self.llm.ask(
-                messages=[user_message], system_msgs=[system_message]
+                messages=[user_message],
+                system_msgs=[system_message],
+                cache=self.cache_plans,
             )
 
             return f"Plan completed:\n\n{response}"
@@ -0,0 +1,56 @@
+import importlib.util
+from typing import Dict
+
+import httpx
+
+from app.config import HTTPSettings
+from app.logger import logger
+
+
+# One pooled client per API base URL, shared by every LLM config that uses it
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def get_http_client(base_url: str, settings: HTTPSettings) -> httpx.AsyncClient:
+    """Get the shared client for an API base URL, creating it on first use.
+
+    Settings only apply when the client is created; later callers with the
+    same base URL reuse it as is.
+    """
+    key = base_url.rstrip("/")
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        client = _clients[key] = _create_client(settings)
+    return client
+
+
+def timeout_from_settings(settings: HTTPSettings) -> httpx.Timeout:
+    return httpx.Timeout(settings.request_timeout, connect=settings.connect_timeout)
+
+
+def _create_client(settings: HTTPSettings) -> httpx.AsyncClient:
+    http2 = settings.http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning(
+            "HTTP/2 is enabled but the h2 package is not installed, using HTTP/1.1"
+        )
+        http2 = False
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.max_connections,
+            max_keepalive_connections=settings.max_keepalive_connections,
+            keepalive_expiry=settings.keepalive_expiry,
+        ),
+        timeout=timeout_from_settings(settings),
+        http2=http2,
+        follow_redirects=True,
+    )
+
+
+async def close_http_clients() -> None:
+    """Close every shared client and its pooled connections"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
@@ -1,4 +1,6 @@
-from typing import Dict, List, Literal, Optional, Union
+import inspect
+import json
+from typing import Any, Callable, Dict, List, Literal, Optional, Union
 
 from openai import (
     APIError,
@@ -8,11 +10,21 @@ from openai import (
     OpenAIError,
     RateLimitError,
 )
-from tenacity import retry, stop_after_attempt, wait_random_exponential
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+from tenacity import (
+    retry,
+    retry_if_not_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
 
+from app.cache import ResponseCache, get_response_cache
 from app.config import LLMSettings, config
+from app.exceptions import StreamInterruptedError
+from app.http_client import get_http_client, timeout_from_settings
 from app.logger import logger  # Assuming a logger is set up in your app
-from app.schema import Message
+from app.rate_limit import estimate_tokens, get_rate_limiter, usage_tokens
+from app.schema import Message, wire_format_error
 
 
 class LLM:
@@ -31,23 +43,40 @@ class LLM:
         self, config_name: str = "default", llm_config: Optional[LLMSettings] = None
     ):
         if not hasattr(self, "client"):  # Only initialize if not already initialized
-            llm_config = llm_config or config.llm
-            llm_config = llm_config.get(config_name, llm_config["default"])
+            llm_configs = llm_config or config.llm
+            # Names without their own section (e.g. agent names) use the default
+            if config_name not in llm_configs:
+                config_name = "default"
+            llm_config = llm_configs[config_name]
             self.model = llm_config.model
             self.max_tokens = llm_config.max_tokens
+            self.max_input_tokens = llm_config.max_input_tokens
             self.temperature = llm_config.temperature
             self.api_type = llm_config.api_type
             self.api_key = llm_config.api_key
             self.api_version = llm_config.api_version
             self.base_url = llm_config.base_url
+            # Every LLM resolving to the same config shares its rate limits
+            self.rate_limiter = get_rate_limiter(config_name, llm_config)
+
+            # Configs that share a base URL share one pool of connections
+            http_client = get_http_client(self.base_url, config.http)
+            timeout = timeout_from_settings(config.http)
             if self.api_type == "azure":
                 self.client = AsyncAzureOpenAI(
                     base_url=self.base_url,
                     api_key=self.api_key,
                     api_version=self.api_version,
+                    http_client=http_client,
+                    timeout=timeout,
                 )
             else:
-                self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+                self.client = AsyncOpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    http_client=http_client,
+                    timeout=timeout,
+                )
 
     @staticmethod
     def format_messages(messages: List[Union[dict, Message]]) -> List[dict]:
@@ -75,26 +104,21 @@ class LLM:
         formatted_messages = []
 
         for message in messages:
-            if isinstance(message, dict):
+            if isinstance(message, Message):
+                # Frozen messages (those in memory) return a memoized dict that
+                # was validated once, when they were frozen
+                formatted_messages.append(message.to_checked_dict())
+            elif isinstance(message, dict):
                 # If message is already a dict, ensure it has required fields
                 if "role" not in message:
                     raise ValueError("Message dict must contain 'role' field")
+                error = wire_format_error(message)
+                if error:
+                    raise ValueError(error)
                 formatted_messages.append(message)
-            elif isinstance(message, Message):
-                # If message is a Message object, convert it to dict
-                formatted_messages.append(message.to_dict())
             else:
                 raise TypeError(f"Unsupported message type: {type(message)}")
 
-        # Validate all messages have required fields
-        for msg in formatted_messages:
-            if msg["role"] not in ["system", "user", "assistant", "tool"]:
-                raise ValueError(f"Invalid role: {msg['role']}")
-            if "content" not in msg and "tool_calls" not in msg:
-                raise ValueError(
-                    "Message must contain either 'content' or 'tool_calls'"
-                )
-
         return formatted_messages
 
     @retry(
@@ -107,6 +131,7 @@ class LLM:
         system_msgs: Optional[List[Union[dict, Message]]] = None,
         stream: bool = True,
         temperature: Optional[float] = None,
+        cache: Optional[bool] = None,
     ) -> str:
         """
         Send a prompt to the LLM and get the response.
@@ -116,6 +141,9 @@ class LLM:
             system_msgs: Optional system messages to prepend
             stream (bool): Whether to stream the response
             temperature (float): Sampling temperature for the response
+            cache (bool): Reuse a cached response for an identical request and
+                cache this one; None caches only temperature-0 calls when
+                [llm_cache] temperature_zero is set
 
         Returns:
             str: The generated response
@@ -133,38 +161,75 @@ class LLM:
             else:
                 messages = self.format_messages(messages)
 
+            cache_key = self._cache_key(
+                cache, messages=messages, temperature=temperature or self.temperature
+            )
+            if cache_key:
+                cached = get_response_cache().get(cache_key)
+                if cached is not None:
+                    return cached
+
+            estimated_tokens = estimate_tokens(messages, max_tokens=self.max_tokens)
+            if self.rate_limiter:
+                await self.rate_limiter.acquire(estimated_tokens)
+
             if not stream:
                 # Non-streaming request
-                response = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    max_tokens=self.max_tokens,
-                    temperature=temperature or self.temperature,
-                    stream=False,
-                )
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=self.max_tokens,
+                        temperature=temperature or self.temperature,
+                        stream=False,
+                    )
+                except BaseException:
+                    self._return_reservation(estimated_tokens)
+                    raise
+                if self.rate_limiter:
+                    self.rate_limiter.record_usage(
+                        estimated_tokens, usage_tokens(response)
+                    )
                 if not response.choices or not response.choices[0].message.content:
                     raise ValueError("Empty or invalid response from LLM")
+                if cache_key:
+                    get_response_cache().set(
+                        cache_key, response.choices[0].message.content
+                    )
                 return response.choices[0].message.content
 
             # Streaming request
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=self.max_tokens,
-                temperature=temperature or self.temperature,
-                stream=True,
-            )
-
             collected_messages = []
-            async for chunk in response:
-                chunk_message = chunk.choices[0].delta.content or ""
-                collected_messages.append(chunk_message)
-                print(chunk_message, end="", flush=True)
+            actual_tokens = None
+            try:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                    temperature=temperature or self.temperature,
+                    stream=True,
+                    **self._stream_usage_params(),
+                )
+                async for chunk in response:
+                    # Usage arrives in a final chunk without choices
+                    actual_tokens = usage_tokens(chunk) or actual_tokens
+                    if not chunk.choices:
+                        continue
+                    chunk_message = chunk.choices[0].delta.content or ""
+                    collected_messages.append(chunk_message)
+                    print(chunk_message, end="", flush=True)
+            except BaseException:
+                self._return_reservation(estimated_tokens)
+                raise
 
             print()  # Newline after streaming
+            if self.rate_limiter:
+                self.rate_limiter.record_usage(estimated_tokens, actual_tokens)
             full_response = "".join(collected_messages).strip()
             if not full_response:
                 raise ValueError("Empty response from streaming LLM")
+            if cache_key:
+                get_response_cache().set(cache_key, full_response)
             return full_response
 
         except ValueError as ve:
@@ -180,15 +245,20 @@ class LLM:
     @retry(
         wait=wait_random_exponential(min=1, max=60),
         stop=stop_after_attempt(6),
+        retry=retry_if_not_exception_type(StreamInterruptedError),
     )
     async def ask_tool(
         self,
         messages: List[Union[dict, Message]],
         system_msgs: Optional[List[Union[dict, Message]]] = None,
-        timeout: int = 60,
+        timeout: Optional[float] = None,
         tools: Optional[List[dict]] = None,
         tool_choice: Literal["none", "auto", "required"] = "auto",
         temperature: Optional[float] = None,
+        stream: bool = False,
+        on_token: Optional[Callable[[str], Any]] = None,
+        on_tool_call: Optional[Callable[[ChatCompletionMessageToolCall], Any]] = None,
+        cache: Optional[bool] = None,
         **kwargs,
     ):
         """
@@ -197,10 +267,17 @@ class LLM:
         Args:
             messages: List of conversation messages
             system_msgs: Optional system messages to prepend
-            timeout: Request timeout in seconds
+            timeout: Request timeout in seconds; None uses [http] request_timeout
             tools: List of tools to use
             tool_choice: Tool choice strategy
             temperature: Sampling temperature for the response
+            stream: Whether to stream the response and assemble tool calls incrementally
+            on_token: Called with each content token as it arrives (streaming only)
+            on_tool_call: Called with each tool call as soon as its arguments are
+                complete, before the rest of the response has arrived (streaming only)
+            cache: Reuse a cached response for an identical request and cache this
+                one; None caches only temperature-0 calls when [llm_cache]
+                temperature_zero is set
             **kwargs: Additional completion arguments
 
         Returns:
@@ -230,23 +307,69 @@ class LLM:
                         raise ValueError("Each tool must be a dict with 'type' field")
 
             # Set up the completion request
-            response = await self.client.chat.completions.create(
+            params = dict(
                 model=self.model,
                 messages=messages,
                 temperature=temperature or self.temperature,
                 max_tokens=self.max_tokens,
                 tools=tools,
                 tool_choice=tool_choice,
-                timeout=timeout,
                 **kwargs,
             )
+            if timeout is not None:
+                params["timeout"] = timeout
 
-            # Check if response is valid
-            if not response.choices or not response.choices[0].message:
-                print(response)
-                raise ValueError("Invalid or empty response from LLM")
-
-            return response.choices[0].message
+            cache_key = self._cache_key(
+                cache,
+                messages=messages,
+                temperature=params["temperature"],
+                tools=tools,
+                tool_choice=tool_choice,
+                **kwargs,
+            )
+            if cache_key:
+                cached = get_response_cache().get(cache_key)
+                if cached is not None:
+                    message = ChatCompletionMessage.model_validate(cached)
+                    if stream:
+                        await self._replay_streamed_message(
+                            message, on_token=on_token, on_tool_call=on_tool_call
+                        )
+                    return message
+
+            estimated_tokens = estimate_tokens(messages, tools, self.max_tokens)
+            if self.rate_limiter:
+                await self.rate_limiter.acquire(estimated_tokens)
+
+            if stream:
+                message = await self._stream_tool_response(
+                    params,
+                    on_token=on_token,
+                    on_tool_call=on_tool_call,
+                    estimated_tokens=estimated_tokens,
+                )
+            else:
+                try:
+                    response = await self.client.chat.completions.create(**params)
+                except BaseException:
+                    self._return_reservation(estimated_tokens)
+                    raise
+                if self.rate_limiter:
+                    self.rate_limiter.record_usage(
+                        estimated_tokens, usage_tokens(response)
+                    )
+
+                # Check if response is valid
+                if not response.choices or not response.choices[0].message:
+                    print(response)
+                    raise ValueError("Invalid or empty response from LLM")
+                message = response.choices[0].message
+
+            if cache_key:
+                get_response_cache().set(
+                    cache_key, message.model_dump(mode="json", exclude_none=True)
+                )
+            return message
 
         except ValueError as ve:
             logger.error(f"Validation error in ask_tool: {ve}")
@@ -262,3 +385,148 @@ class LLM:
         except Exception as e:
             logger.error(f"Unexpected error in ask_tool: {e}")
             raise
+
+    def _return_reservation(self, estimated_tokens: int) -> None:
+        """Give back the tokens reserved for a request that failed, so that a
+        retry is not charged twice"""
+        if self.rate_limiter:
+            self.rate_limiter.record_usage(estimated_tokens, 0)
+
+    def _stream_usage_params(self) -> dict:
+        """Ask for token usage at the end of a stream when the rate limiter needs it"""
+        if self.rate_limiter and self.rate_limiter.tokens:
+            return {"stream_options": {"include_usage": True}}
+        return {}
+
+    def _cache_key(self, cache: Optional[bool], **request: Any) -> Optional[str]:
+        """Cache key for a request, or None if the call should not be cached."""
+        if cache is None:
+            cache = config.llm_cache.temperature_zero and request["temperature"] == 0
+        if not cache:
+            return None
+        return ResponseCache.make_key(model=self.model, **request)
+
+    @staticmethod
+    async def _replay_streamed_message(
+        message: ChatCompletionMessage,
+        on_token: Optional[Callable[[str], Any]] = None,
+        on_tool_call: Optional[Callable[[ChatCompletionMessageToolCall], Any]] = None,
+    ) -> None:
+        """Feed a cached response to streaming callbacks as if it had streamed."""
+        if message.content and on_token:
+            await _maybe_await(on_token(message.content))
+        for tool_call in message.tool_calls or []:
+            if on_tool_call:
+                await _maybe_await(on_tool_call(tool_call))
+
+    async def _stream_tool_response(
+        self,
+        params: dict,
+        on_token: Optional[Callable[[str], Any]] = None,
+        on_tool_call: Optional[Callable[[ChatCompletionMessageToolCall], Any]] = None,
+        estimated_tokens: int = 0,
+    ) -> ChatCompletionMessage:
+        """
+        Stream a tool-enabled completion and assemble it into a single message.
+
+        Tool call deltas are merged by index. A call is handed to `on_tool_call`
+        as soon as its arguments parse as JSON, or when the model moves on to the
+        next call, so the caller can start executing it while generation continues.
+        If the stream fails after a call was handed over, the failure is raised as
+        StreamInterruptedError so that it is not retried. Usage reported at the
+        end of the stream corrects the rate limiter's `estimated_tokens`.
+        """
+        content_parts: List[str] = []
+        calls: Dict[int, dict] = {}
+        dispatched: set = set()
+        actual_tokens = None
+
+        async def dispatch(index: int) -> None:
+            call = calls[index]
+            if index in dispatched or not call["id"] or not call["name"]:
+                return
+            dispatched.add(index)
+            if on_tool_call:
+                await _maybe_await(on_tool_call(_build_tool_call(call)))
+
+        try:
+            response = await self.client.chat.completions.create(
+                **params, stream=True, **self._stream_usage_params()
+            )
+            async for chunk in response:
+                # Usage arrives in a final chunk without choices
+                actual_tokens = usage_tokens(chunk) or actual_tokens
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+
+                if delta.content:
+                    content_parts.append(delta.content)
+                    if on_token:
+                        await _maybe_await(on_token(delta.content))
+
+                for tool_delta in delta.tool_calls or []:
+                    # A new index means every earlier call has finished streaming
+                    for index in sorted(calls):
+                        if index < tool_delta.index:
+                            await dispatch(index)
+
+                    call = calls.setdefault(
+                        tool_delta.index, {"id": "", "name": "", "arguments": ""}
+                    )
+                    if tool_delta.id:
+                        call["id"] = tool_delta.id
+                    if tool_delta.function:
+                        call["name"] += tool_delta.function.name or ""
+                        call["arguments"] += tool_delta.function.arguments or ""
+
+                    if _is_complete_json(call["arguments"]):
+                        await dispatch(tool_delta.index)
+
+            for index in sorted(calls):
+                await dispatch(index)
+        except BaseException as e:
+            self._return_reservation(estimated_tokens)
+            if dispatched and isinstance(e, Exception):
+                raise StreamInterruptedError(
+                    f"Response stream failed after {len(dispatched)} tool calls were started: {e}"
+                ) from e
+            raise
+
+        if self.rate_limiter:
+            self.rate_limiter.record_usage(estimated_tokens, actual_tokens)
+
+        content = "".join(content_parts)
+        tool_calls = [_build_tool_call(calls[index]) for index in sorted(calls)]
+        if not content and not tool_calls:
+            raise ValueError("Invalid or empty response from LLM")
+
+        return ChatCompletionMessage(
+            role="assistant", content=content or None, tool_calls=tool_calls or None
+        )
+
+
+def _build_tool_call(call: dict) -> ChatCompletionMessageToolCall:
+    return ChatCompletionMessageToolCall(
+        id=call["id"],
+        type="function",
+        function={"name": call["name"], "arguments": call["arguments"]},
+    )
+
+
+def _is_complete_json(arguments: str) -> bool:
+    """Check whether streamed tool arguments form a complete JSON object."""
+    # Only attempt a parse once the text could plausibly be closed
+    if not arguments.rstrip().endswith("}"):
+        return False
+    try:
+        json.loads(arguments)
+        return True
+    except json.JSONDecodeError:
+        return False
+
+
+async def _maybe_await(result: Any) -> Any:
+    if inspect.isawaitable(result):
+        return await result
+    return result
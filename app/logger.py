@@ -1,11 +1,13 @@
 import sys
 import asyncio
+from collections import deque
 from typing import Callable, Any, Optional, Dict, List, Union
 from datetime import datetime
 
 from loguru import logger as loguru_logger
 
 from app.config import PROJECT_ROOT
+from app.event_bus import current_task_id
 
 # Configure loguru
 loguru_logger.remove()  # Remove default handler
@@ -17,79 +19,158 @@ loguru_logger.add(
 
 # Create a wrapper class for logger to handle async handlers
 class AsyncLogger:
-    def __init__(self, logger_instance):
+    """Wraps loguru and forwards records to async handlers.
+
+    Handlers are registered either globally or for one task. A single loguru
+    sink routes each record to the global handlers and to the handlers of the
+    task in whose `task_scope` it was logged, so the cost of a log line does
+    not grow with the number of concurrently running tasks.
+
+    Routed records go into a bounded queue that a single background task
+    drains in batches. Logging never blocks and never spawns a task per line;
+    when the queue is full new records are dropped and counted in `dropped`.
+    Handlers that define `handle_batch(messages)` receive a whole batch at once.
+    """
+
+    def __init__(self, logger_instance, max_queue_size: int = 10000, batch_size: int = 100):
         self._logger = logger_instance
-        self._async_handlers = []
-        self._handler_ids = {}
+        # task_id (None for global) -> list of (handler, minimum level number)
+        self._handlers: Dict[Optional[str], List[tuple]] = {}
+        self._sink_id = None
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._reported_dropped = 0
+        # (handlers, message) pairs waiting for the drain task
+        self._queue: deque = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._drain_task: Optional[asyncio.Task] = None
 
     def info(self, message):
-        self._logger.info(message)
-        asyncio.create_task(self._notify_async_handlers(message))
+        self._logger.opt(depth=1).info(message)
         
     def warning(self, message):
-        self._logger.warning(message)
-        asyncio.create_task(self._notify_async_handlers(message))
+        self._logger.opt(depth=1).warning(message)
         
     def error(self, message):
-        self._logger.error(message)
-        asyncio.create_task(self._notify_async_handlers(message))
+        self._logger.opt(depth=1).error(message)
         
     def debug(self, message):
-        self._logger.debug(message)
-        asyncio.create_task(self._notify_async_handlers(message))
+        self._logger.opt(depth=1).debug(message)
 
     def critical(self, message):
-        self._logger.critical(message)
-        asyncio.create_task(self._notify_async_handlers(message))
+        self._logger.opt(depth=1).critical(message)
+
+    def exception(self, message):
+        self._logger.opt(depth=1).exception(message)
         
-    def add(self, handler, level="INFO"):
-        """Add an async handler to the logger"""
-        if callable(handler) and handler not in self._async_handlers:
-            self._async_handlers.append(handler)
-            
-            # Also add to the underlying logger to catch direct logs
-            handler_id = self._logger.add(
-                lambda msg: asyncio.create_task(self._handle_original_log(handler, msg)),
-                level=level
-            )
-            self._handler_ids[handler] = handler_id
-            
+    def add(self, handler, level="INFO", task_id: Optional[str] = None):
+        """Add an async handler for one task's log records, or for all records"""
+        if not callable(handler):
+            return handler
+        handlers = self._handlers.setdefault(task_id, [])
+        if all(existing is not handler for existing, _ in handlers):
+            handlers.append((handler, self._logger.level(level).no))
+        if self._sink_id is None:
+            # One routing sink for all handlers; loguru calls it in the logging context
+            self._sink_id = self._logger.add(self._route, level=0)
         return handler
         
-    def remove(self, handler):
+    def remove(self, handler, task_id: Optional[str] = None):
         """Remove a handler from the logger"""
-        if handler in self._async_handlers:
-            self._async_handlers.remove(handler)
-            
-            # Also remove from the underlying logger
-            if handler in self._handler_ids:
-                try:
-                    self._logger.remove(self._handler_ids[handler])
-                    del self._handler_ids[handler]
-                except:
-                    pass
-                
-    async def _handle_original_log(self, handler, record):
-        """Format and handle a raw loguru record"""
+        handlers = self._handlers.get(task_id)
+        if not handlers:
+            return
+        handlers[:] = [entry for entry in handlers if entry[0] is not handler]
+        if not handlers:
+            del self._handlers[task_id]
+
+    def _route(self, message):
+        """Loguru sink: pick the handlers for the record's task and level"""
+        record = message.record
+        level_no = record["level"].no
+        task_id = current_task_id.get()
+
+        targets = [handler for handler, min_level in self._handlers.get(None, ()) if level_no >= min_level]
+        if task_id is not None:
+            targets += [handler for handler, min_level in self._handlers.get(task_id, ()) if level_no >= min_level]
+        if not targets:
+            return
+
+        if len(self._queue) >= self.max_queue_size:
+            self.dropped += 1
+            return
+        self._queue.append((targets, record["message"]))
+        self._wake_drain_task()
+
+    def _wake_drain_task(self):
+        """Start the drain task if needed and wake it up; safe to call from any thread"""
         try:
-            # Extract message from record
-            if hasattr(record, "message"):
-                message = record["message"]
-            else:
-                message = str(record)
-                
-            await handler(message)
-        except Exception as e:
-            print(f"Error in async log handler: {e}")
-        
-    async def _notify_async_handlers(self, message):
-        """Notify all async handlers of a new log message"""
-        for handler in self._async_handlers:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        if loop is not None and (self._drain_task is None or self._drain_task.done()):
+            # First record on this loop, or the previous loop has gone away
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._drain_task = loop.create_task(self._drain())
+
+        if self._loop is None or self._loop.is_closed():
+            # No loop yet; records wait in the queue until one logs
+            return
+        if loop is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _drain(self):
+        """Background task: deliver queued records to their handlers in batches"""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue:
+                await self._deliver_batch()
+
+    async def _deliver_batch(self):
+        """Take up to `batch_size` queued records and hand them to their handlers"""
+        batch: Dict[Callable, List[str]] = {}
+        for _ in range(min(self.batch_size, len(self._queue))):
+            handlers, message = self._queue.popleft()
+            for handler in handlers:
+                batch.setdefault(handler, []).append(message)
+
+        if self.dropped > self._reported_dropped:
+            print(f"Log queue full: dropped {self.dropped - self._reported_dropped} records")
+            self._reported_dropped = self.dropped
+
+        for handler, messages in batch.items():
             try:
-                await handler(message)
+                if hasattr(handler, "handle_batch"):
+                    await handler.handle_batch(messages)
+                else:
+                    for message in messages:
+                        await handler(message)
             except Exception as e:
                 print(f"Error notifying async handler: {e}")
 
+    async def flush(self):
+        """Deliver every queued record now"""
+        while self._queue:
+            await self._deliver_batch()
+
+    async def shutdown(self):
+        """Flush queued records and stop the drain task"""
+        await self.flush()
+        if self._drain_task is not None:
+            self._drain_task.cancel()
+            try:
+                await self._drain_task
+            except (asyncio.CancelledError, RuntimeError):
+                pass
+            self._drain_task = None
+
 # Create the logger instance
 logger = AsyncLogger(loguru_logger)
 
@@ -23,6 +23,6 @@ Note that the environment does NOT support interactive session commands (e.g. py
 
 NEXT_STEP_TEMPLATE = """{{observation}}
 (Open file: {{open_file}})
-(Current directory: {{working_dir}})
+(Current directory: {current_dir})
 bash-$
 """
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from app.config import LLMSettings
+from app.logger import logger
+
+
+class TokenBucket:
+    """Allows `per_minute` units per minute, refilled continuously"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available"""
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        """Return units (or take more, if negative) after the real cost is known"""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class RateLimiter:
+    """Client-side limit on requests and tokens per minute for one LLM config.
+
+    Callers wait in FIFO order until both buckets can cover their request, so
+    concurrent tasks are spread out under the provider's limits instead of all
+    hitting them at once and backing off at random.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+    ):
+        self.name = name
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        # asyncio.Lock wakes waiters in arrival order, which makes the queue fair
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Wait until one request using about `tokens` tokens may be sent"""
+        async with self._lock:
+            while True:
+                wait = 0.0
+                if self.requests:
+                    wait = max(wait, self.requests.wait_time(1))
+                if self.tokens:
+                    wait = max(wait, self.tokens.wait_time(tokens))
+                if wait <= 0:
+                    break
+                if wait >= 1:
+                    logger.info(f"Rate limit for '{self.name}': waiting {wait:.1f}s")
+                await asyncio.sleep(wait)
+
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+
+    def record_usage(self, estimated: int, actual: Optional[int]) -> None:
+        """Correct the token bucket once the response reports real usage"""
+        if self.tokens and actual is not None:
+            self.tokens.give_back(estimated - actual)
+
+
+def estimate_tokens(
+    messages: List[dict], tools: Optional[List[dict]] = None, max_tokens: int = 0
+) -> int:
+    """Rough upper estimate of a request's token usage: ~4 characters per token
+    for the prompt, plus the completion budget"""
+    chars = len(json.dumps(messages, default=str))
+    if tools:
+        chars += len(json.dumps(tools, default=str))
+    return chars // 4 + max_tokens
+
+
+_limiters: Dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(name: str, settings: LLMSettings) -> Optional[RateLimiter]:
+    """Shared limiter for an LLM config, or None if the config sets no limits"""
+    if not settings.requests_per_minute and not settings.tokens_per_minute:
+        return None
+    if name not in _limiters:
+        _limiters[name] = RateLimiter(
+            name, settings.requests_per_minute, settings.tokens_per_minute
+        )
+    return _limiters[name]
+
+
+def usage_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None)
@@ -0,0 +1,135 @@
+import asyncio
+from bisect import insort
+from itertools import count
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.exceptions import QueueFullError
+from app.logger import logger
+
+
+TaskRunner = Callable[[str, str], Awaitable[None]]
+
+
+class TaskScheduler:
+    """Runs submitted tasks on a fixed number of workers.
+
+    Tasks wait in a bounded queue ordered by priority (higher first), then by
+    submission order. Submitting to a full queue raises `QueueFullError`.
+    Queued and running tasks can be cancelled.
+    """
+
+    def __init__(
+        self,
+        runner: TaskRunner,
+        workers: int = 2,
+        max_queue_size: int = 100,
+        on_cancel: Optional[Callable[[str], Awaitable[None]]] = None,
+        on_queue_change: Optional[Callable[[List[str]], Awaitable[None]]] = None,
+    ):
+        self.runner = runner
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.on_cancel = on_cancel
+        self.on_queue_change = on_queue_change
+        # Sorted (-priority, submission number, task_id, prompt) entries
+        self._queue: List[tuple] = []
+        self._counter = count()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._workers: List[asyncio.Task] = []
+        self._not_empty: Optional[asyncio.Condition] = None
+
+    @property
+    def is_full(self) -> bool:
+        return len(self._queue) >= self.max_queue_size
+
+    def start(self) -> None:
+        """Start the worker tasks on the running event loop, if not started yet"""
+        if self._workers:
+            return
+        self._not_empty = asyncio.Condition()
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        """Stop the workers and cancel running tasks; queued tasks are dropped"""
+        jobs = list(self._running.values())
+        for job in jobs:
+            job.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*jobs, *self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue.clear()
+
+    async def submit(self, task_id: str, prompt: str, priority: int = 0) -> int:
+        """
+        Queue a task and return its position in the queue (0 is next to run).
+
+        Raises:
+            QueueFullError: If `max_queue_size` tasks are already waiting
+        """
+        self.start()
+        if self.is_full:
+            raise QueueFullError(f"Task queue is full ({self.max_queue_size} waiting)")
+        entry = (-priority, next(self._counter), task_id, prompt)
+        insort(self._queue, entry)
+        async with self._not_empty:
+            self._not_empty.notify()
+        return self._queue.index(entry)
+
+    def position(self, task_id: str) -> Optional[int]:
+        """Position of a queued task (0 is next to run), or None if it is not queued"""
+        for index, entry in enumerate(self._queue):
+            if entry[2] == task_id:
+                return index
+        return None
+
+    def is_running(self, task_id: str) -> bool:
+        return task_id in self._running
+
+    async def cancel(self, task_id: str) -> bool:
+        """Cancel a queued or running task; returns False if it is neither"""
+        index = self.position(task_id)
+        if index is not None:
+            del self._queue[index]
+            if self.on_cancel:
+                await self.on_cancel(task_id)
+            await self._queue_changed()
+            return True
+
+        job = self._running.get(task_id)
+        if job is not None:
+            # The worker reports the cancellation once the task has unwound
+            job.cancel()
+            return True
+        return False
+
+    async def _worker(self) -> None:
+        while True:
+            async with self._not_empty:
+                await self._not_empty.wait_for(lambda: self._queue)
+                _, _, task_id, prompt = self._queue.pop(0)
+            await self._queue_changed()
+
+            job = asyncio.create_task(self.runner(task_id, prompt))
+            self._running[task_id] = job
+            try:
+                # wait() does not propagate the job's outcome, only our own cancellation
+                await asyncio.wait([job])
+            finally:
+                del self._running[task_id]
+
+            if job.cancelled():
+                logger.info(f"Task {task_id} was cancelled while running")
+                if self.on_cancel:
+                    await self.on_cancel(task_id)
+            elif job.exception() is not None:
+                logger.error(f"Task {task_id} failed: {job.exception()}")
+
+    async def _queue_changed(self) -> None:
+        if self.on_queue_change:
+            try:
+                await self.on_queue_change([entry[2] for entry in self._queue])
+            except Exception as e:
+                logger.error(f"Error reporting queue positions: {e}")
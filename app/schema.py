@@ -1,7 +1,7 @@
 from enum import Enum
 from typing import Any, List, Literal, Optional, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 
 class AgentState(str, Enum):
@@ -26,8 +26,22 @@ class ToolCall(BaseModel):
     function: Function
 
 
+def wire_format_error(message: dict) -> Optional[str]:
+    """Why a message dict cannot be sent to the LLM, or None if it can"""
+    if message["role"] not in ("system", "user", "assistant", "tool"):
+        return f"Invalid role: {message['role']}"
+    if "content" not in message and "tool_calls" not in message:
+        return "Message must contain either 'content' or 'tool_calls'"
+    return None
+
+
 class Message(BaseModel):
-    """Represents a chat message in the conversation"""
+    """Represents a chat message in the conversation
+
+    A message is frozen when it is added to `Memory`; after that its fields
+    cannot be reassigned and `to_dict` returns the same memoized dict on every
+    call, so the history is not re-serialized for each request.
+    """
 
     role: Literal["system", "user", "assistant", "tool"] = Field(...)
     content: Optional[str] = Field(default=None)
@@ -35,6 +49,30 @@ class Message(BaseModel):
     name: Optional[str] = Field(default=None)
     tool_call_id: Optional[str] = Field(default=None)
 
+    _frozen: bool = PrivateAttr(default=False)
+    _wire: Optional[dict] = PrivateAttr(default=None)
+    _wire_error: Optional[str] = PrivateAttr(default=None)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        private = self.__pydantic_private__
+        if not name.startswith("_") and private and private.get("_frozen"):
+            raise TypeError(
+                f"Cannot set '{name}': messages are immutable once added to memory"
+            )
+        super().__setattr__(name, value)
+
+    @property
+    def frozen(self) -> bool:
+        return self._frozen
+
+    def freeze(self) -> "Message":
+        """Make the message immutable and memoize its wire format"""
+        if not self._frozen:
+            self._wire = self._build_dict()
+            self._wire_error = wire_format_error(self._wire)
+            self._frozen = True
+        return self
+
     def __add__(self, other) -> List["Message"]:
         """支持 Message + list 或 Message + Message 的操作"""
         if isinstance(other, list):
@@ -56,12 +94,41 @@ class Message(BaseModel):
             )
 
     def to_dict(self) -> dict:
-        """Convert message to dictionary format"""
+        """Convert message to dictionary format
+
+        Frozen messages return a shared memoized dict, which must not be modified.
+        """
+        # Read pydantic's private storage directly; attribute access to private
+        # attributes goes through BaseModel.__getattr__, which is comparatively slow
+        wire = self.__pydantic_private__.get("_wire")
+        if wire is not None:
+            return wire
+        return self._build_dict()
+
+    def to_checked_dict(self) -> dict:
+        """`to_dict`, raising ValueError if the message cannot be sent to the LLM
+
+        Frozen messages were checked once when they were frozen.
+        """
+        private = self.__pydantic_private__
+        wire = private.get("_wire")
+        if wire is None:
+            wire = self._build_dict()
+            error = wire_format_error(wire)
+        else:
+            error = private.get("_wire_error")
+        if error:
+            raise ValueError(error)
+        return wire
+
+    def _build_dict(self) -> dict:
         message = {"role": self.role}
         if self.content is not None:
             message["content"] = self.content
         if self.tool_calls is not None:
-            message["tool_calls"] = [tool_call.dict() for tool_call in self.tool_calls]
+            message["tool_calls"] = [
+                tool_call.model_dump() for tool_call in self.tool_calls
+            ]
         if self.name is not None:
             message["name"] = self.name
         if self.tool_call_id is not None:
@@ -107,24 +174,68 @@ class Message(BaseModel):
         )
 
 
+def approx_tokens(message: Message) -> int:
+    """Cheap token estimate for a message: ~4 characters per token plus overhead"""
+    chars = len(message.content or "")
+    for tool_call in message.tool_calls or []:
+        chars += len(tool_call.function.name) + len(tool_call.function.arguments)
+    return chars // 4 + 4
+
+
+# Evictions take the history this fraction (1/n) of the exceeded limit below it
+LOW_WATER_DIVISOR = 10
+
+
 class Memory(BaseModel):
+    """Conversation history bounded by message count and an approximate token budget.
+
+    Token counts are kept per message and updated as messages are added, so
+    enforcing the budget never re-counts the whole history. When a limit is
+    exceeded the oldest messages are evicted until the history is a tenth of
+    the limit below it, so the appends that follow do not each evict. System
+    messages and the first user message are pinned. An assistant message with
+    tool calls is evicted together with the tool results that answer it, so the
+    history never holds a tool result without the call it belongs to.
+    """
+
     messages: List[Message] = Field(default_factory=list)
     max_messages: int = Field(default=100)
+    max_tokens: Optional[int] = Field(
+        default=None, description="Approximate token budget; None for no limit"
+    )
+
+    # Token count of each message, aligned with `messages`
+    _token_counts: List[int] = PrivateAttr(default_factory=list)
+    _total_tokens: int = PrivateAttr(default=0)
+    # The list the counts belong to; replaced lists are counted again
+    _counted_list_id: Optional[int] = PrivateAttr(default=None)
+
+    @property
+    def token_count(self) -> int:
+        """Approximate number of tokens in the history"""
+        self._sync_token_counts()
+        return self._total_tokens
 
     def add_message(self, message: Message) -> None:
         """Add a message to memory"""
-        self.messages.append(message)
-        # Optional: Implement message limit
-        if len(self.messages) > self.max_messages:
-            self.messages = self.messages[-self.max_messages :]
+        self.add_messages([message])
 
     def add_messages(self, messages: List[Message]) -> None:
         """Add multiple messages to memory"""
-        self.messages.extend(messages)
+        self._sync_token_counts()
+        for message in messages:
+            message.freeze()
+            count = approx_tokens(message)
+            self.messages.append(message)
+            self._token_counts.append(count)
+            self._total_tokens += count
+        self._enforce_limits()
 
     def clear(self) -> None:
         """Clear all messages"""
         self.messages.clear()
+        self._token_counts.clear()
+        self._total_tokens = 0
 
     def get_recent_messages(self, n: int) -> List[Message]:
         """Get n most recent messages"""
@@ -133,3 +244,71 @@ class Memory(BaseModel):
     def to_dict_list(self) -> List[dict]:
         """Convert messages to list of dicts"""
         return [msg.to_dict() for msg in self.messages]
+
+    def _sync_token_counts(self) -> None:
+        """Recount if `messages` was replaced or changed without going through Memory"""
+        if id(self.messages) == self._counted_list_id and len(
+            self._token_counts
+        ) == len(self.messages):
+            return
+        self._token_counts = [approx_tokens(message) for message in self.messages]
+        self._total_tokens = sum(self._token_counts)
+        self._counted_list_id = id(self.messages)
+
+    def _enforce_limits(self) -> None:
+        excess_messages = len(self.messages) - self.max_messages
+        excess_tokens = (
+            self._total_tokens - self.max_tokens if self.max_tokens is not None else 0
+        )
+        if excess_messages <= 0 and excess_tokens <= 0:
+            return
+        # Evict down to a low-water mark
+        if excess_messages > 0:
+            excess_messages += self.max_messages // LOW_WATER_DIVISOR
+        if excess_tokens > 0:
+            excess_tokens += self.max_tokens // LOW_WATER_DIVISOR
+
+        # Pinned messages sit at the front once older ones are gone, so a
+        # single pass from the front finds everything to evict
+        pinned = []
+        first_user_found = False
+        evicted_tokens = 0
+        index = 0
+        while excess_messages > 0 or excess_tokens > 0:
+            end = self._group_end(index)
+            if end == len(self.messages):
+                # Never evict the newest group, even if it alone is over budget
+                break
+            message = self.messages[index]
+            if message.role == "system":
+                pinned.append(index)
+            elif message.role == "user" and not first_user_found:
+                first_user_found = True
+                pinned.append(index)
+            else:
+                group_tokens = sum(self._token_counts[index:end])
+                evicted_tokens += group_tokens
+                excess_messages -= end - index
+                excess_tokens -= group_tokens
+            index = end
+
+        if len(pinned) == index:
+            return
+        # Update in place so references to the list stay valid
+        self.messages[:index] = [self.messages[i] for i in pinned]
+        self._token_counts[:index] = [self._token_counts[i] for i in pinned]
+        self._total_tokens -= evicted_tokens
+
+    def _group_end(self, index: int) -> int:
+        """End of the range of messages from `index` that must be evicted together"""
+        end = index + 1
+        message = self.messages[index]
+        if message.role == "assistant" and message.tool_calls:
+            call_ids = {tool_call.id for tool_call in message.tool_calls}
+            while (
+                end < len(self.messages)
+                and self.messages[end].role == "tool"
+                and self.messages[end].tool_call_id in call_ids
+            ):
+                end += 1
+        return end
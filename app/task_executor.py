@@ -1,65 +1,285 @@
 import asyncio
-from typing import Dict, Any, Optional
+import json
+import socket
+import sys
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
 
 from app.agent.manus import Manus
+from app.config import PROJECT_ROOT, config
+from app.event_bus import AgentEvent, event_bus, task_scope
+from app.exceptions import WorkerError
 from app.flow.base import FlowType
 from app.flow.flow_factory import FlowFactory
 from app.logger import logger
 
 
-class TaskExecutor:
-    """Executes tasks using the MetaGPT flow system"""
-    
+EventCallback = Callable[[AgentEvent], Awaitable[None]]
+LogCallback = Callable[[str], Awaitable[None]]
+
+
+async def write_message(writer: asyncio.StreamWriter, message: dict):
+    """Send one length-prefixed JSON message"""
+    data = json.dumps(message).encode()
+    writer.write(len(data).to_bytes(4, "big") + data)
+    await writer.drain()
+
+
+async def read_message(reader: asyncio.StreamReader) -> Optional[dict]:
+    """Receive one length-prefixed JSON message, or None once the peer has gone"""
+    try:
+        header = await reader.readexactly(4)
+        return json.loads(await reader.readexactly(int.from_bytes(header, "big")))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+async def close_agents(agents: Dict[str, Any]):
+    """Release browsers and other tool resources held by the agents"""
+    for agent in agents.values():
+        for tool in getattr(agent, "available_tools", []):
+            if hasattr(tool, "cleanup"):
+                try:
+                    await tool.cleanup()
+                except Exception as e:
+                    print(f"Error cleaning up tool {tool.name}: {str(e)}")
+
+
+class WorkerProcess:
+    """A worker process running one task at a time, connected over a socket pair"""
+
     def __init__(self):
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def start(self):
+        parent_sock, child_sock = socket.socketpair()
+        fd = child_sock.fileno()
+        # A fresh interpreter rather than a fork: nothing of the API server's loop or state is inherited
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "app.task_worker", str(fd),
+            pass_fds=(fd,),
+            cwd=str(PROJECT_ROOT),
+        )
+        child_sock.close()
+        self.reader, self.writer = await asyncio.open_connection(sock=parent_sock)
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None and not self.reader.at_eof()
+
+    async def send(self, message: dict):
+        await write_message(self.writer, message)
+
+    async def receive(self) -> Optional[dict]:
+        return await read_message(self.reader)
+
+    async def stop(self, timeout: float = 10):
+        """Ask the worker to exit, and kill it if it does not"""
+        if self.process is None:
+            return
+        try:
+            if self.alive:
+                await self.send({"type": "stop"})
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            if self.process.returncode is None:
+                self.process.kill()
+                await self.process.wait()
+        finally:
+            self.writer.close()
+
+
+class TaskExecutor:
+    """Executes tasks using the MetaGPT flow system
+
+    In "inline" mode flows run on the caller's event loop. In "process" mode
+    each task is sent to one of `workers` worker processes, which owns the
+    task's agents and browser; its events and log lines stream back over a
+    local socket, so heavy agent work never blocks the API server's loop.
+    """
+
+    TERMINAL_MESSAGES = ("result", "error", "timeout", "cancelled")
+
+    def __init__(self, mode: str = "inline", workers: int = 2, timeout: float = 3600):
         """Initialize the task executor"""
-        # Set up shared resources
-        self._agents = None
-        
-    async def _init_agents(self):
-        """Initialize agents if not already done"""
-        if self._agents is None:
-            self._agents = {
-                "manus": Manus(),
-            }
-        return self._agents
-        
-    async def execute_task(self, task_id: str, prompt: str, on_log=None) -> str:
-        """Execute a task with the given prompt"""
-        # Initialize agents if needed
-        agents = await self._init_agents()
-        
-        # Create a message handler for the logger if provided
+        if mode not in ("inline", "process"):
+            raise ValueError(f"Unknown executor mode: {mode}")
+        self.mode = mode
+        self.workers = workers
+        self.timeout = timeout
+        self._idle: Optional[asyncio.Queue] = None
+        self._pool: List[WorkerProcess] = []
+        self._start_lock = asyncio.Lock()
+        # Cancellations still unwinding in workers, kept until they finish
+        self._cancels: Set[asyncio.Task] = set()
+
+    async def execute_task(
+        self,
+        task_id: str,
+        prompt: str,
+        on_log: Optional[LogCallback] = None,
+        on_event: Optional[EventCallback] = None,
+        log_level: str = "INFO",
+    ) -> str:
+        """Execute a task with the given prompt
+
+        `on_event` receives the task's agent events and `on_log` its log lines
+        at or above `log_level`, in the order they were produced.
+        """
+        if self.mode == "process":
+            return await self._execute_in_worker(task_id, prompt, on_log, on_event, log_level)
+        return await self._execute_inline(task_id, prompt, on_log, on_event, log_level)
+
+    async def _execute_inline(self, task_id, prompt, on_log, on_event, log_level) -> str:
+        # Every task gets its own agents; they hold per-task memory and a browser
+        agents = {
+            "manus": Manus(),
+        }
+
+        # Forward only this task's events and log lines
+        if on_event:
+            event_bus.subscribe(on_event, task_id=task_id)
         if on_log:
-            # Create a log handler that forwards to the on_log callback
-            async def log_handler(message):
-                if isinstance(on_log, callable):
-                    await on_log(message)
-                    
-            # Add the handler to the logger
-            logger.add(log_handler)
-        
+            logger.add(on_log, level=log_level, task_id=task_id)
+
         # Create and execute the flow
         flow = FlowFactory.create_flow(
             flow_type=FlowType.PLANNING,
             agents=agents,
         )
-        
-        # Execute with timeout to avoid hanging
+
+        # Execute with timeout to avoid hanging; events emitted inside the scope belong to this task
+        with task_scope(task_id):
+            try:
+                logger.info(f"Starting task execution: {prompt}")
+                result = await asyncio.wait_for(
+                    flow.execute(prompt),
+                    timeout=self.timeout,
+                )
+                logger.info(f"Task execution completed successfully")
+                return result
+            except asyncio.TimeoutError:
+                logger.error("Task execution timed out after 1 hour")
+                raise
+            except Exception as e:
+                logger.error(f"Task execution failed: {str(e)}")
+                raise
+            finally:
+                if on_event:
+                    event_bus.unsubscribe(on_event, task_id=task_id)
+                if on_log:
+                    logger.remove(on_log, task_id=task_id)
+                await close_agents(agents)
+
+    async def _execute_in_worker(self, task_id, prompt, on_log, on_event, log_level) -> str:
+        worker = await self._acquire_worker()
         try:
-            logger.info(f"Starting task execution: {prompt}")
-            result = await asyncio.wait_for(
-                flow.execute(prompt),
-                timeout=3600,  # 1 hour timeout
-            )
-            logger.info(f"Task execution completed successfully")
-            return result
-        except asyncio.TimeoutError:
-            logger.error("Task execution timed out after 1 hour")
-            raise
-        except Exception as e:
-            logger.error(f"Task execution failed: {str(e)}")
+            await worker.send({
+                "type": "run",
+                "task_id": task_id,
+                "prompt": prompt,
+                "log_level": log_level if on_log else None,
+            })
+            while True:
+                message = await worker.receive()
+                if message is None:
+                    raise WorkerError(f"Worker process exited while running task {task_id}")
+
+                if message.get("task_id") != task_id:
+                    # Left over from a task this worker ran before
+                    continue
+
+                kind = message["type"]
+                try:
+                    if kind == "event" and on_event:
+                        await on_event(AgentEvent.model_validate(message["event"]))
+                    elif kind == "log" and on_log:
+                        await on_log(message["message"])
+                except Exception as e:
+                    print(f"Error handling worker message: {e}")
+
+                if kind == "result":
+                    return message["result"]
+                elif kind == "timeout":
+                    raise asyncio.TimeoutError()
+                elif kind == "error":
+                    raise WorkerError(message["message"])
+
+        except asyncio.CancelledError:
+            # The worker unwinds the task in the background before taking another one
+            cancel = asyncio.create_task(self._cancel_in_worker(worker, task_id))
+            self._cancels.add(cancel)
+            cancel.add_done_callback(self._cancel_done)
+            worker = None
             raise
+        finally:
+            if worker is not None:
+                await self._release_worker(worker)
+
+    async def _cancel_in_worker(self, worker: WorkerProcess, task_id: str, timeout: float = 30):
+        try:
+            await worker.send({"type": "cancel", "task_id": task_id})
+
+            async def drain():
+                while True:
+                    message = await worker.receive()
+                    if message is None or message["type"] in self.TERMINAL_MESSAGES:
+                        return
+
+            await asyncio.wait_for(drain(), timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            # A worker that does not unwind in time is replaced
+            await worker.stop(timeout=0)
+        await self._release_worker(worker)
+
+    def _cancel_done(self, cancel: asyncio.Task):
+        self._cancels.discard(cancel)
+        if not cancel.cancelled() and cancel.exception() is not None:
+            logger.error(f"Error cancelling task in worker: {cancel.exception()}")
+
+    async def start(self):
+        """Start the worker processes (process mode only)"""
+        async with self._start_lock:
+            if self.mode != "process" or self._idle is not None:
+                return
+            self._idle = asyncio.Queue()
+            for _ in range(self.workers):
+                await self._add_worker()
+
+    async def stop(self):
+        """Stop all worker processes, once pending cancellations have finished"""
+        if self._cancels:
+            await asyncio.gather(*self._cancels, return_exceptions=True)
+        pool, self._pool = self._pool, []
+        await asyncio.gather(*(worker.stop() for worker in pool), return_exceptions=True)
+        self._idle = None
+
+    async def _add_worker(self):
+        worker = WorkerProcess()
+        await worker.start()
+        self._pool.append(worker)
+        self._idle.put_nowait(worker)
+
+    async def _acquire_worker(self) -> WorkerProcess:
+        await self.start()
+        return await self._idle.get()
+
+    async def _release_worker(self, worker: WorkerProcess):
+        if worker not in self._pool:
+            # The pool was stopped while the task ran
+            return
+        if worker.alive:
+            self._idle.put_nowait(worker)
+            return
+        logger.warning("Replacing a worker process that exited")
+        self._pool.remove(worker)
+        await worker.stop(timeout=0)
+        await self._add_worker()
 
 
 # Create a singleton instance
-task_executor = TaskExecutor()
+task_executor = TaskExecutor(
+    mode=config.server.executor,
+    workers=config.server.max_concurrent_tasks,
+)
@@ -0,0 +1,312 @@
+import asyncio
+import json
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from app.config import PROJECT_ROOT, TaskStoreSettings
+from app.logger import logger
+
+
+class Task(BaseModel):
+    id: str
+    prompt: str
+    created_at: datetime
+    status: str
+    steps: list = []
+
+    @property
+    def is_finished(self) -> bool:
+        """Whether the task has reached a terminal status"""
+        return self.status == "completed" or self.status.startswith("failed")
+
+    def model_dump(self, *args, **kwargs):
+        data = super().model_dump(*args, **kwargs)
+        data["created_at"] = self.created_at.isoformat()
+        return data
+
+
+class TaskStore(ABC):
+    """Storage backend for API tasks and their step events"""
+
+    @abstractmethod
+    def add(self, task: Task) -> None:
+        """Store a newly created task"""
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[Task]:
+        """Get a task with its steps, or None if it is unknown or evicted"""
+
+    @abstractmethod
+    def append_step(self, task_id: str, step: dict) -> None:
+        """Append a step event to a task"""
+
+    @abstractmethod
+    def set_status(self, task_id: str, status: str) -> None:
+        """Update the status of a task"""
+
+    def get_steps(self, task_id: str, after: int = -1) -> List[dict]:
+        """Get the steps of a task whose seq is greater than `after`"""
+        task = self.get(task_id)
+        return task.steps[after + 1 :] if task is not None else []
+
+    @abstractmethod
+    def list(self, offset: int = 0, limit: int = 50) -> List[Task]:
+        """List tasks, newest first"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored tasks"""
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+    def flush(self) -> None:
+        """Persist any buffered writes"""
+
+    def close(self) -> None:
+        """Flush and release resources"""
+        self.flush()
+
+
+class MemoryTaskStore(TaskStore):
+    """In-process store bounded by task count (LRU) and idle time (TTL).
+
+    Only finished tasks are evicted; running tasks always stay available.
+    """
+
+    def __init__(self, max_tasks: int = 1000, ttl: Optional[float] = None):
+        self.max_tasks = max_tasks
+        self.ttl = ttl
+        self._tasks: Dict[str, Task] = {}
+        # Least recently used first, mapped to last access time
+        self._access: OrderedDict[str, float] = OrderedDict()
+        # Creation order, used as the index for pagination
+        self._index: Dict[str, None] = {}
+
+    def add(self, task: Task) -> None:
+        self._tasks[task.id] = task
+        self._index[task.id] = None
+        self._touch(task.id)
+        self._evict()
+
+    def get(self, task_id: str) -> Optional[Task]:
+        task = self._tasks.get(task_id)
+        if task is not None:
+            self._touch(task_id)
+        return task
+
+    def append_step(self, task_id: str, step: dict) -> None:
+        task = self.get(task_id)
+        if task is not None:
+            task.steps.append(step)
+
+    def set_status(self, task_id: str, status: str) -> None:
+        task = self.get(task_id)
+        if task is not None:
+            task.status = status
+            if task.is_finished:
+                self._evict()
+
+    def list(self, offset: int = 0, limit: int = 50) -> List[Task]:
+        self._evict()
+        ids = islice(reversed(self._index), offset, offset + limit)
+        return [self._tasks[task_id] for task_id in ids]
+
+    def count(self) -> int:
+        return len(self._tasks)
+
+    def _touch(self, task_id: str) -> None:
+        self._access[task_id] = time.monotonic()
+        self._access.move_to_end(task_id)
+
+    def _evict(self) -> None:
+        """Drop finished tasks that are over capacity or idle past the TTL"""
+        now = time.monotonic()
+        excess = len(self._tasks) - self.max_tasks
+        victims = []
+        for task_id, accessed in self._access.items():
+            expired = self.ttl is not None and now - accessed > self.ttl
+            if excess <= 0 and not expired:
+                # Later entries were accessed more recently
+                break
+            if self._tasks[task_id].is_finished:
+                victims.append(task_id)
+                excess -= 1
+
+        for task_id in victims:
+            del self._tasks[task_id]
+            del self._access[task_id]
+            del self._index[task_id]
+
+
+class SQLiteTaskStore(TaskStore):
+    """Persistent store that keeps only running tasks in memory.
+
+    Step events are buffered and written in batches, either when the buffer
+    reaches `batch_size` or `flush_interval` seconds after the first buffered
+    step, and always when a task finishes.
+    """
+
+    def __init__(self, path: Path, batch_size: int = 50, flush_interval: float = 1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                id TEXT PRIMARY KEY,
+                prompt TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                status TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS tasks_created_at ON tasks (created_at);
+            CREATE TABLE IF NOT EXISTS steps (
+                task_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (task_id, seq)
+            );
+            """
+        )
+        # Tasks left unfinished by a previous process can never complete
+        self._conn.execute(
+            "UPDATE tasks SET status = 'failed: server restarted' "
+            "WHERE status NOT LIKE 'failed%' AND status != 'completed'"
+        )
+        self._conn.commit()
+
+        self._active: Dict[str, Task] = {}
+        self._pending_steps: List[tuple] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def add(self, task: Task) -> None:
+        self._conn.execute(
+            "INSERT INTO tasks (id, prompt, created_at, status) VALUES (?, ?, ?, ?)",
+            (task.id, task.prompt, task.created_at.isoformat(), task.status),
+        )
+        self._conn.commit()
+        self._active[task.id] = task
+
+    def get(self, task_id: str) -> Optional[Task]:
+        if task_id in self._active:
+            return self._active[task_id]
+
+        row = self._conn.execute(
+            "SELECT id, prompt, created_at, status FROM tasks WHERE id = ?",
+            (task_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        task = self._row_to_task(row)
+        task.steps = [
+            json.loads(data)
+            for (data,) in self._conn.execute(
+                "SELECT data FROM steps WHERE task_id = ? ORDER BY seq", (task_id,)
+            )
+        ]
+        return task
+
+    def get_steps(self, task_id: str, after: int = -1) -> List[dict]:
+        if task_id in self._active:
+            return self._active[task_id].steps[after + 1 :]
+        return [
+            json.loads(data)
+            for (data,) in self._conn.execute(
+                "SELECT data FROM steps WHERE task_id = ? AND seq > ? ORDER BY seq",
+                (task_id, after),
+            )
+        ]
+
+    def append_step(self, task_id: str, step: dict) -> None:
+        task = self._active.get(task_id)
+        if task is None:
+            return
+        task.steps.append(step)
+        self._pending_steps.append((task_id, len(task.steps) - 1, json.dumps(step)))
+
+        if len(self._pending_steps) >= self.batch_size:
+            self.flush()
+        elif self._flush_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()
+                return
+            self._flush_handle = loop.call_later(self.flush_interval, self.flush)
+
+    def set_status(self, task_id: str, status: str) -> None:
+        task = self._active.get(task_id)
+        if task is not None:
+            task.status = status
+        self._conn.execute(
+            "UPDATE tasks SET status = ? WHERE id = ?", (status, task_id)
+        )
+        self._conn.commit()
+        if task is not None and task.is_finished:
+            self.flush()
+            del self._active[task_id]
+
+    def list(self, offset: int = 0, limit: int = 50) -> List[Task]:
+        rows = self._conn.execute(
+            "SELECT id, prompt, created_at, status FROM tasks "
+            "ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (limit, offset),
+        ).fetchall()
+        return [self._active.get(row[0]) or self._row_to_task(row) for row in rows]
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+    def flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending_steps:
+            return
+        pending, self._pending_steps = self._pending_steps, []
+        try:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO steps (task_id, seq, data) VALUES (?, ?, ?)",
+                pending,
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to persist {len(pending)} task steps: {e}")
+
+    def close(self) -> None:
+        self.flush()
+        self._conn.close()
+
+    @staticmethod
+    def _row_to_task(row: tuple) -> Task:
+        task_id, prompt, created_at, status = row
+        return Task(
+            id=task_id,
+            prompt=prompt,
+            created_at=datetime.fromisoformat(created_at),
+            status=status,
+        )
+
+
+def create_task_store(settings: TaskStoreSettings) -> TaskStore:
+    """Create the task store backend selected in the config"""
+    if settings.backend == "sqlite":
+        path = Path(settings.path)
+        if not path.is_absolute():
+            path = PROJECT_ROOT / path
+        return SQLiteTaskStore(
+            path, batch_size=settings.batch_size, flush_interval=settings.flush_interval
+        )
+    if settings.backend == "memory":
+        return MemoryTaskStore(max_tasks=settings.max_tasks, ttl=settings.ttl)
+    raise ValueError(f"Unknown task store backend: {settings.backend}")
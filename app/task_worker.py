@@ -0,0 +1,89 @@
+"""Worker process for TaskExecutor's process mode.
+
+Started as `python -m app.task_worker <fd>`, where fd is this end of a socket
+pair. The worker runs one task at a time with its own agents and streams the
+task's events and log lines back as length-prefixed JSON messages.
+"""
+import asyncio
+import socket
+import sys
+from typing import Optional
+
+from app.event_bus import AgentEvent
+from app.http_client import close_http_clients
+from app.logger import logger
+from app.task_executor import TaskExecutor, read_message, write_message
+from app.tool.bash import close_session_pool
+from app.tool.python_kernel import close_kernel_pool, get_kernel_pool
+
+
+async def run_task(executor: TaskExecutor, writer: asyncio.StreamWriter, message: dict):
+    task_id = message["task_id"]
+
+    async def forward_event(event: AgentEvent):
+        await write_message(
+            writer,
+            {
+                "type": "event",
+                "task_id": task_id,
+                "event": event.model_dump(mode="json"),
+            },
+        )
+
+    async def forward_log(line: str):
+        await write_message(
+            writer, {"type": "log", "task_id": task_id, "message": line}
+        )
+
+    try:
+        result = await executor.execute_task(
+            task_id,
+            message["prompt"],
+            on_log=forward_log if message.get("log_level") else None,
+            on_event=forward_event,
+            log_level=message.get("log_level") or "INFO",
+        )
+        reply = {"type": "result", "result": str(result)}
+    except asyncio.TimeoutError:
+        reply = {"type": "timeout"}
+    except asyncio.CancelledError:
+        reply = {"type": "cancelled"}
+    except Exception as e:
+        reply = {"type": "error", "message": str(e)}
+
+    # Deliver the task's queued log lines before it is reported finished
+    await logger.flush()
+    reply["task_id"] = task_id
+    await write_message(writer, reply)
+
+
+async def serve(fd: int):
+    sock = socket.socket(fileno=fd)
+    reader, writer = await asyncio.open_connection(sock=sock)
+    executor = TaskExecutor(mode="inline")
+    get_kernel_pool().fill()
+    current: Optional[asyncio.Task] = None
+    current_id: Optional[str] = None
+
+    while True:
+        message = await read_message(reader)
+        if message is None or message["type"] == "stop":
+            break
+        if message["type"] == "run":
+            current_id = message["task_id"]
+            current = asyncio.create_task(run_task(executor, writer, message))
+        elif message["type"] == "cancel" and current_id == message["task_id"]:
+            if current is not None and not current.done():
+                current.cancel()
+
+    if current is not None and not current.done():
+        current.cancel()
+        await asyncio.gather(current, return_exceptions=True)
+    await close_http_clients()
+    close_session_pool()
+    close_kernel_pool()
+    writer.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve(int(sys.argv[1])))
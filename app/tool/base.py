@@ -8,6 +8,9 @@ class BaseTool(ABC, BaseModel):
     name: str
     description: str
     parameters: Optional[dict] = None
+    # Exclusive tools hold shared state (a shell, a browser, files) and must not
+    # run concurrently with other exclusive tool calls from the same agent.
+    exclusive: bool = False
 
     class Config:
         arbitrary_types_allowed = True
@@ -73,6 +76,14 @@ class ToolResult(BaseModel):
 class CLIResult(ToolResult):
     """A ToolResult that can be rendered as a CLI output."""
 
+    exit_code: Optional[int] = Field(default=None)
+
+    def __str__(self):
+        text = super().__str__() or ""
+        if self.exit_code:
+            text += f"\n(exit code {self.exit_code})"
+        return text
+
 
 class ToolFailure(ToolResult):
     """A ToolResult that represents a failure."""
@@ -1,17 +1,124 @@
 import asyncio
 import os
-from typing import Optional
+import shlex
+import signal
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 
+from app.config import config
+from app.event_bus import AgentEvent, EventType, current_task_id, event_bus
 from app.exceptions import ToolError
 from app.tool.base import BaseTool, CLIResult, ToolResult
 
 
 _BASH_DESCRIPTION = """Execute a bash command in the terminal.
-* Long running commands: For commands that may run indefinitely, it should be run in the background and the output should be redirected to a file, e.g. command = `python3 app.py > server.log 2>&1 &`.
-* Interactive: If a bash command returns exit code `-1`, this means the process is not yet finished. The assistant must then send a second call to terminal with an empty `command` (which will retrieve any additional logs), or it can send additional text (set `command` to the text) to STDIN of the running process, or it can send command=`ctrl+c` to interrupt the process.
-* Timeout: If a command execution result says "Command timed out. Sending SIGINT to the process", the assistant should retry running the command in the background.
+* Long running commands: Commands that do not finish within the timeout keep running as a background job, and the result names the job id. Start a command as a job right away with `background` set to true. Call the tool with `job_id` and an empty command to get the job's new output, and its exit code once it has finished; send command=`ctrl+c` together with `job_id` to stop it.
+* Output of running commands is streamed live to the user while they run.
+* A non-zero exit code is reported after the output.
 """
 
+OutputCallback = Callable[[str, str], Awaitable[None]]
+
+
+class _StreamReader:
+    """Reads a stream in the background into a buffer.
+
+    `expect` returns a future that resolves as soon as a line starting with a
+    marker has arrived; only newly read bytes are searched for it. While a
+    command runs, complete lines before the marker are passed to `on_output`.
+    """
+
+    def __init__(
+        self,
+        stream: asyncio.StreamReader,
+        name: str,
+        chunk_size: int = 65536,
+    ):
+        self._stream = stream
+        self.name = name
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._marker = b""
+        self._scan_from = 0
+        self._found: Optional[asyncio.Future] = None
+        self._marker_at: Optional[int] = None
+        self._streamed = 0
+        self._eof = False
+        self.on_output: Optional[OutputCallback] = None
+        self._task = asyncio.create_task(self._read())
+
+    def expect(self, marker: bytes) -> asyncio.Future:
+        """Future for the (start, end) of the marker's line, or None at EOF"""
+        self._marker = marker
+        self._scan_from = 0
+        self._marker_at = None
+        self._found = asyncio.get_running_loop().create_future()
+        self._scan()
+        return self._found
+
+    def take(self, end: int, skip: int = 0) -> bytes:
+        """Remove and return the first `end` bytes, discarding `skip` more"""
+        data = bytes(self._buffer[:end])
+        del self._buffer[: end + skip]
+        self._streamed = max(0, self._streamed - end - skip)
+        return data
+
+    @property
+    def eof(self) -> bool:
+        return self._eof
+
+    def take_all(self) -> bytes:
+        """Remove and return everything read so far"""
+        return self.take(len(self._buffer))
+
+    def cancel(self) -> None:
+        self._task.cancel()
+        # Nothing more will be read; commands waiting for a marker end now
+        self._eof = True
+        self._scan()
+
+    async def _read(self) -> None:
+        while chunk := await self._stream.read(self._chunk_size):
+            self._buffer += chunk
+            self._scan()
+            await self._stream_output()
+        self._eof = True
+        self._scan()
+
+    def _scan(self) -> None:
+        if self._found is None or self._found.done():
+            return
+        if self._marker_at is None:
+            index = self._buffer.find(self._marker, self._scan_from)
+            if index < 0:
+                # The marker may have arrived partially; rescan its possible start
+                self._scan_from = max(0, len(self._buffer) - len(self._marker) + 1)
+            else:
+                self._marker_at = index
+        if self._marker_at is not None:
+            line_end = self._buffer.find(b"\n", self._marker_at)
+            if line_end >= 0:
+                self._found.set_result((self._marker_at, line_end + 1))
+                return
+        if self._eof:
+            self._found.set_result(None)
+
+    async def _stream_output(self) -> None:
+        if self.on_output is None or self._found is None:
+            return
+        if self._marker_at is not None:
+            end = self._marker_at
+        else:
+            # Only whole lines, so a multi-byte character or the marker is never split
+            end = max(self._buffer.rfind(b"\n"), self._buffer.rfind(b"\r")) + 1
+        if end > self._streamed:
+            text = self._buffer[self._streamed : end].decode(errors="replace")
+            self._streamed = end
+            try:
+                await self.on_output(text, self.name)
+            except Exception as e:
+                print(f"Error streaming bash output: {e}")
+
 
 class _BashSession:
     """A session of a bash shell."""
@@ -20,13 +127,12 @@ class _BashSession:
     _process: asyncio.subprocess.Process
 
     command: str = "/bin/bash"
-    _output_delay: float = 0.2  # seconds
-    _timeout: float = 120.0  # seconds
     _sentinel: str = "<<exit>>"
 
-    def __init__(self):
+    def __init__(self, cwd: Optional[str] = None):
         self._started = False
-        self._timed_out = False
+        # Working directory after the last completed command
+        self.cwd = cwd
 
     async def start(self):
         if self._started:
@@ -40,10 +146,40 @@ class _BashSession:
             stdin=asyncio.subprocess.PIPE,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
+            cwd=self.cwd,
         )
+        self._stdout = _StreamReader(self._process.stdout, "stdout")
+        self._stderr = _StreamReader(self._process.stderr, "stderr")
+        if self.cwd is None:
+            self.cwd = os.getcwd()
 
         self._started = True
 
+    @property
+    def alive(self) -> bool:
+        # The return code is only set once the process is reaped; closed output
+        # means the shell has gone already
+        return (
+            self._started
+            and self._process.returncode is None
+            and not self._stdout.eof
+        )
+
+    async def prepare(
+        self, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None
+    ) -> None:
+        """Move the shell to `cwd` and export `env`, in a single round trip"""
+        commands = [
+            f"export {name}={shlex.quote(value)}" for name, value in (env or {}).items()
+        ]
+        if cwd is not None and cwd != self.cwd:
+            commands.append(f"cd -- {shlex.quote(cwd)}")
+        if not commands:
+            return
+        result = await self.run("; ".join(commands))
+        if result.error:
+            raise ToolError(f"Failed to prepare bash session: {result.error}")
+
     def stop(self):
         """Terminate the bash shell."""
         if not self._started:
@@ -51,9 +187,27 @@ class _BashSession:
         if self._process.returncode is not None:
             return
         self._process.terminate()
+        self._stdout.cancel()
+        self._stderr.cancel()
 
-    async def run(self, command: str):
-        """Execute a command in the bash shell."""
+    def interrupt(self):
+        """Kill the shell and everything it started, letting a running command
+        finish with the output it produced so far."""
+        if not self._started or self._process.returncode is not None:
+            return
+        # The shell leads its own process group (setsid), so children that still
+        # hold the output pipes open go too and the readers reach EOF
+        try:
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    async def run(self, command: str, on_output: Optional[OutputCallback] = None):
+        """Execute a command in the bash shell.
+
+        Waits until the command finishes, passing output lines to `on_output`
+        as they arrive. The result carries the command's exit code.
+        """
         if not self._started:
             raise ToolError("Session has not started.")
         if self._process.returncode is not None:
@@ -61,56 +215,197 @@ class _BashSession:
                 system="tool must be restarted",
                 error=f"bash has exited with returncode {self._process.returncode}",
             )
-        if self._timed_out:
-            raise ToolError(
-                f"timed out: bash has not returned in {self._timeout} seconds and must be restarted",
-            )
 
         # we know these are not None because we created the process with PIPEs
         assert self._process.stdin
-        assert self._process.stdout
-        assert self._process.stderr
+
+        # A fresh sentinel per command, echoed to both streams, so output that
+        # happens to contain an old sentinel cannot end the command early.
+        # The stdout line also reports the exit code and working directory.
+        sentinel = f"{self._sentinel[:-2]}-{uuid.uuid4().hex}>>"
+        self._stdout.on_output = self._stderr.on_output = on_output
+        stdout_done = self._stdout.expect(sentinel.encode())
+        stderr_done = self._stderr.expect(sentinel.encode())
 
         # send command to the process
         self._process.stdin.write(
-            command.encode() + f"; echo '{self._sentinel}'\n".encode()
+            command.encode()
+            + f"\necho \"{sentinel} $? $PWD\"; echo '{sentinel}' >&2\n".encode()
         )
         await self._process.stdin.drain()
 
-        # read output from the process, until the sentinel is found
+        # wait until both streams have delivered the sentinel
         try:
-            async with asyncio.timeout(self._timeout):
-                while True:
-                    await asyncio.sleep(self._output_delay)
-                    # if we read directly from stdout/stderr, it will wait forever for
-                    # EOF. use the StreamReader buffer directly instead.
-                    output = (
-                        self._process.stdout._buffer.decode()
-                    )  # pyright: ignore[reportAttributeAccessIssue]
-                    if self._sentinel in output:
-                        # strip the sentinel and break
-                        output = output[: output.index(self._sentinel)]
-                        break
-        except asyncio.TimeoutError:
-            self._timed_out = True
-            raise ToolError(
-                f"timed out: bash has not returned in {self._timeout} seconds and must be restarted",
-            ) from None
+            stdout_line, stderr_line = await asyncio.gather(stdout_done, stderr_done)
+        finally:
+            self._stdout.on_output = self._stderr.on_output = None
 
+        if stdout_line is None or stderr_line is None:
+            await self._process.wait()
+            return ToolResult(
+                system="tool must be restarted",
+                error=f"bash has exited with returncode {self._process.returncode}",
+            )
+
+        output, exit_code = self._take_output(self._stdout, stdout_line, sentinel)
+        error, _ = self._take_output(self._stderr, stderr_line, sentinel)
+        return CLIResult(output=output, error=error, exit_code=exit_code)
+
+    def _take_output(
+        self, reader: _StreamReader, line: Tuple[int, int], sentinel: str
+    ) -> Tuple[str, Optional[int]]:
+        start, end = line
+        data = reader.take(end)
+        output = data[:start].decode(errors="replace")
         if output.endswith("\n"):
             output = output[:-1]
 
-        error = (
-            self._process.stderr._buffer.decode()
-        )  # pyright: ignore[reportAttributeAccessIssue]
-        if error.endswith("\n"):
-            error = error[:-1]
+        # On stdout the sentinel is followed by "<exit code> <working directory>"
+        exit_code = None
+        fields = data[start + len(sentinel) : end].decode(errors="replace").strip()
+        if fields:
+            code, _, self.cwd = fields.partition(" ")
+            exit_code = int(code)
+        return output, exit_code
+
+
+class BashSessionPool:
+    """Bash shells started ahead of time and handed out one per user.
+
+    `acquire` takes a warm shell, moves it to the requested working directory
+    and environment and starts a replacement in the background, so callers
+    do not wait for a process to spawn. Released shells are killed rather
+    than reused: nothing one task did to its shell (variables, functions,
+    background processes) can leak into the next.
+    """
+
+    def __init__(self, size: int = 2):
+        self.size = size
+        self._idle: List[_BashSession] = []
+        self._fill_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def acquire(
+        self, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None
+    ) -> _BashSession:
+        self._check_loop()
+        session = None
+        while self._idle and session is None:
+            candidate = self._idle.pop()
+            if candidate.alive:
+                session = candidate
+            else:
+                candidate.stop()
+        if session is None:
+            session = _BashSession()
+            await session.start()
+        self.fill()
+
+        try:
+            await session.prepare(cwd, env)
+        except ToolError:
+            self.release(session)
+            if session.alive:
+                raise
+            # The shell died while idle; start over with a new one
+            session = _BashSession()
+            await session.start()
+            try:
+                await session.prepare(cwd, env)
+            except BaseException:
+                self.release(session)
+                raise
+        except BaseException:
+            self.release(session)
+            raise
+        return session
+
+    async def renew(
+        self,
+        session: _BashSession,
+        cwd: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+    ) -> _BashSession:
+        """Return `session` while its shell is alive, otherwise release it and
+        acquire a new one in `cwd`"""
+        if session.alive:
+            return session
+        self.release(session)
+        return await self.acquire(cwd, env)
+
+    def release(self, session: _BashSession) -> None:
+        """Kill a shell and everything still running in it"""
+        session.interrupt()
+        if session.alive:
+            session.stop()
+
+    def fill(self) -> None:
+        """Start shells in the background until `size` are idle"""
+        self._check_loop()
+        if self._fill_task is None or self._fill_task.done():
+            self._fill_task = asyncio.create_task(self._fill())
+
+    def close(self) -> None:
+        if self._fill_task is not None:
+            self._fill_task.cancel()
+            self._fill_task = None
+        while self._idle:
+            self.release(self._idle.pop())
+
+    async def _fill(self) -> None:
+        while len(self._idle) < self.size:
+            session = _BashSession()
+            await session.start()
+            self._idle.append(session)
+
+    def _check_loop(self) -> None:
+        # Subprocesses belong to the event loop that started them
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            for session in self._idle:
+                session.interrupt()
+            self._idle.clear()
+            self._fill_task = None
+            self._loop = loop
+
+
+_session_pool: Optional[BashSessionPool] = None
+
+
+def get_session_pool() -> BashSessionPool:
+    """Get the process-wide pool of bash shells, creating it on first use"""
+    global _session_pool
+    if _session_pool is None:
+        _session_pool = BashSessionPool(size=config.bash.pool_size)
+    return _session_pool
 
-        # clear the buffers so that the next output can be read correctly
-        self._process.stdout._buffer.clear()  # pyright: ignore[reportAttributeAccessIssue]
-        self._process.stderr._buffer.clear()  # pyright: ignore[reportAttributeAccessIssue]
 
-        return CLIResult(output=output, error=error)
+def close_session_pool() -> None:
+    """Kill the idle shells of the process-wide pool"""
+    if _session_pool is not None:
+        _session_pool.close()
+
+
+class _BashJob:
+    """A command running in its own session in the background"""
+
+    def __init__(self, job_id: str, command: str, session: _BashSession):
+        self.job_id = job_id
+        self.command = command
+        self.session = session
+        self.task: Optional[asyncio.Task] = None
+        # Streamed output not yet returned to the agent, and how much was returned
+        self.unread: Dict[str, List[str]] = {"stdout": [], "stderr": []}
+        self.returned: Dict[str, int] = {"stdout": 0, "stderr": 0}
+
+    def collect(self, text: str, stream: str) -> None:
+        self.unread[stream].append(text)
+
+    def read_new(self, stream: str) -> str:
+        text = "".join(self.unread[stream])
+        self.unread[stream].clear()
+        self.returned[stream] += len(text)
+        return text
 
 
 class Bash(BaseTool):
@@ -123,33 +418,168 @@ class Bash(BaseTool):
         "properties": {
             "command": {
                 "type": "string",
-                "description": "The bash command to execute. Can be empty to view additional logs when previous exit code is `-1`. Can be `ctrl+c` to interrupt the currently running process.",
+                "description": "The bash command to execute. Can be empty together with `job_id` to poll a background job, or `ctrl+c` to stop it.",
+            },
+            "background": {
+                "type": "boolean",
+                "description": "Run the command as a background job and return its job id immediately.",
+            },
+            "job_id": {
+                "type": "string",
+                "description": "Id of a background job to get new output and, once finished, the exit code of.",
             },
         },
         "required": ["command"],
     }
 
     _session: Optional[_BashSession] = None
+    _jobs: Dict[str, _BashJob] = {}
+    # Working directory of the last session that was handed over to a job
+    _detached_cwd: Optional[str] = None
+    exclusive: bool = True
+
+    # Seconds a command may run in the foreground before it continues as a job
+    timeout: float = 120.0
+    # Directory and environment variables the shell starts with
+    cwd: Optional[str] = None
+    env: Dict[str, str] = {}
+
+    @property
+    def current_dir(self) -> str:
+        """The shell's working directory, as of its last command"""
+        if self._session is not None:
+            return self._session.cwd
+        return self._detached_cwd or self.cwd or os.getcwd()
 
     async def execute(
-        self, command: str | None = None, restart: bool = False, **kwargs
+        self,
+        command: str | None = None,
+        restart: bool = False,
+        background: bool = False,
+        job_id: Optional[str] = None,
+        **kwargs,
     ) -> CLIResult:
         if restart:
             if self._session:
-                self._session.stop()
-            self._session = _BashSession()
-            await self._session.start()
+                # The new shell starts where the old one was
+                self._detached_cwd = self._session.cwd
+                get_session_pool().release(self._session)
+                self._session = None
+            await self._get_session()
 
             return ToolResult(system="tool has been restarted.")
 
+        if job_id is not None:
+            return await self._poll_job(job_id, interrupt=command == "ctrl+c")
+
+        if command is None:
+            raise ToolError("no command provided.")
+
+        if background:
+            # The job gets a session of its own, started where the shell is now
+            session = await get_session_pool().acquire(self.current_dir, self.env)
+            job = self._start_job(session, command)
+            return CLIResult(output=self._job_message(job, "was started"))
+
+        job = self._start_job(await self._get_session(), command)
+        await asyncio.wait([job.task], timeout=self.timeout)
+        if job.task.done():
+            del self._jobs[job.job_id]
+            return job.task.result()
+
+        # Leave the command running in its session; later commands get a new one
+        # that starts where the detached session was before the command
+        self._detached_cwd = self._session.cwd
+        self._session = None
+        output = job.read_new("stdout")
+        return CLIResult(
+            output=f"{output}\n{self._job_message(job, f'is still running after {self.timeout:.0f}s')}",
+            error=job.read_new("stderr") or None,
+        )
+
+    async def cleanup(self) -> None:
+        """Kill the shell and any background jobs"""
+        pool = get_session_pool()
+        if self._session is not None:
+            pool.release(self._session)
+            self._session = None
+        for job in self._jobs.values():
+            pool.release(job.session)
+        self._jobs.clear()
+
+    async def _get_session(self) -> _BashSession:
+        pool = get_session_pool()
         if self._session is None:
-            self._session = _BashSession()
-            await self._session.start()
+            self._session = await pool.acquire(self.current_dir, self.env)
+        else:
+            # A shell that exited (e.g. `exit 1`) is replaced where it was
+            self._session = await pool.renew(self._session, self.current_dir, self.env)
+        return self._session
 
-        if command is not None:
-            return await self._session.run(command)
+    def _start_job(self, session: _BashSession, command: str) -> _BashJob:
+        job = _BashJob(uuid.uuid4().hex[:8], command, session)
+        # The session's readers may have been started by another task's pool
+        # fill, so their context cannot tell whose output this is
+        task_id = current_task_id.get()
+
+        async def on_output(text: str, stream_name: str) -> None:
+            job.collect(text, stream_name)
+            await event_bus.emit(
+                AgentEvent(
+                    type=EventType.TOOL_OUTPUT,
+                    source=self.name,
+                    content=text,
+                    data={
+                        "tool": self.name,
+                        "job_id": job.job_id,
+                        "stream": stream_name,
+                    },
+                    task_id=task_id,
+                )
+            )
 
-        raise ToolError("no command provided.")
+        job.task = asyncio.create_task(session.run(command, on_output=on_output))
+        self._jobs[job.job_id] = job
+        return job
+
+    async def _poll_job(self, job_id: str, interrupt: bool = False) -> CLIResult:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise ToolError(f"no background job with id {job_id}.")
+
+        if interrupt and not job.task.done():
+            job.session.interrupt()
+            await asyncio.wait([job.task], timeout=5)
+            del self._jobs[job_id]
+            get_session_pool().release(job.session)
+            return CLIResult(
+                output=f"{job.read_new('stdout')}\nBackground job {job_id} was stopped.",
+                error=job.read_new("stderr") or None,
+            )
+
+        if not job.task.done():
+            return CLIResult(
+                output=f"{job.read_new('stdout')}\n{self._job_message(job, 'is still running')}",
+                error=job.read_new("stderr") or None,
+            )
+
+        del self._jobs[job_id]
+        get_session_pool().release(job.session)
+        result = job.task.result()
+        if not isinstance(result, CLIResult):
+            return result
+        # Return only what was not returned by earlier polls
+        return result.replace(
+            output=(result.output or "")[job.returned["stdout"] :],
+            error=(result.error or "")[job.returned["stderr"] :] or None,
+        )
+
+    @staticmethod
+    def _job_message(job: _BashJob, state: str) -> str:
+        return (
+            f"Command `{job.command}` {state} as background job {job.job_id}. "
+            f'Call bash with job_id={job.job_id} and command="" for its new output and exit code.'
+        )
 
 
 if __name__ == "__main__":
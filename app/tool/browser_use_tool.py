@@ -90,6 +90,7 @@ class BrowserUseTool(BaseTool):
     }
 
     lock: asyncio.Lock = Field(default_factory=asyncio.Lock)
+    exclusive: bool = True
     browser: Optional[BrowserUseBrowser] = Field(default=None, exclude=True)
     context: Optional[BrowserContext] = Field(default=None, exclude=True)
     dom_service: Optional[DomService] = Field(default=None, exclude=True)
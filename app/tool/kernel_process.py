@@ -0,0 +1,139 @@
+"""Interpreter processes behind PythonExecute.
+
+Started by app.tool.python_kernel as
+`python -u <path of this file> <fd> <max_memory_mb> <max_cpu_seconds> [module ...]`,
+by path so that none of the app's modules are imported. This process is a
+template (zygote): it imports the given modules once, then forks a kernel
+for every request on the unix socket `fd`. A request carries the kernel's
+stdin, stdout and stderr pipes as file descriptors; the reply is the
+kernel's pid. Kernels start with the modules already imported.
+
+Each line on a kernel's stdin is a JSON request `{"code", "marker"}`. The
+code runs in globals that persist between requests, with its output going
+to the stdout and stderr pipes as it is written. Every request ends with a
+line starting with its marker on both streams; the stdout line carries the
+result as JSON. Memory and per-request CPU limits of 0 are unset.
+
+Only the standard library may be used here.
+"""
+import importlib
+import json
+import os
+import resource
+import signal
+import socket
+import sys
+import traceback
+
+
+def limit_memory(max_memory_mb: int) -> None:
+    """Cap the address space; 0 leaves it unset"""
+    if max_memory_mb:
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def limit_cpu(max_cpu_seconds: int) -> None:
+    """Allow `max_cpu_seconds` more CPU time from now; 0 leaves it unset.
+
+    RLIMIT_CPU counts the process's whole lifetime, so the soft limit is moved
+    forward before every request. Exceeding it kills the kernel with SIGXCPU.
+    """
+    if max_cpu_seconds:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = int(usage.ru_utime + usage.ru_stime) + 1
+        resource.setrlimit(
+            resource.RLIMIT_CPU, (used + max_cpu_seconds, resource.RLIM_INFINITY)
+        )
+
+
+def run(code: str, namespace: dict) -> dict:
+    try:
+        exec(compile(code, "<python_execute>", "exec"), namespace)
+    except SystemExit as e:
+        return {"success": e.code in (None, 0), "error": f"SystemExit: {e.code}"}
+    except BaseException as e:
+        # Leave this function's frame out of the traceback
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        return {"success": False, "error": f"{type(e).__name__}: {e}"}
+    return {"success": True}
+
+
+def serve(max_cpu_seconds: int) -> None:
+    """Run requests from stdin until it is closed"""
+    # Requests arrive on the original stdin; the code reads /dev/null instead
+    requests = os.fdopen(os.dup(0), "r")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+
+    namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+    for line in requests:
+        request = json.loads(line)
+        limit_cpu(max_cpu_seconds)
+        result = run(request["code"], namespace)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.write(1, f"{request['marker']} {json.dumps(result)}\n".encode())
+        os.write(2, f"{request['marker']}\n".encode())
+
+
+def preload(modules: list) -> None:
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"Could not preload {name}: {e}", file=sys.stderr)
+
+
+def fork_kernel(
+    control: socket.socket, fds: list, max_memory_mb: int, max_cpu_seconds: int
+) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    try:
+        # Only the template may take fork requests; a kernel, or a command it
+        # runs, holding the socket could fork kernels and keep it from closing
+        control.close()
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        # A group of its own, so killing the kernel also kills what it started
+        os.setsid()
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        limit_memory(max_memory_mb)
+        serve(max_cpu_seconds)
+    finally:
+        os._exit(0)
+
+
+def main() -> None:
+    # Imports resolve like in an interactive interpreter: from the working
+    # directory, not from the app's tool package this file lives in
+    if sys.path and os.path.abspath(sys.path[0]) == os.path.dirname(
+        os.path.abspath(__file__)
+    ):
+        sys.path[0] = ""
+
+    control = socket.socket(fileno=int(sys.argv[1]))
+    control.set_inheritable(False)
+    max_memory_mb, max_cpu_seconds = int(sys.argv[2]), int(sys.argv[3])
+    preload(sys.argv[4:])
+
+    # Kernels are reaped automatically; the app watches their pipes instead
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    while True:
+        message, fds, _, _ = socket.recv_fds(control, 16, 3)
+        if not message:
+            break
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = fork_kernel(control, fds, max_memory_mb, max_cpu_seconds)
+        for fd in fds:
+            os.close(fd)
+        control.sendall(f"{pid}\n".encode())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,213 @@
 # tool/planning.py
+from collections import Counter
 from typing import Dict, List, Literal, Optional
 
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
+
 from app.exceptions import ToolError
 from app.tool.base import BaseTool, ToolResult
 
 
+PlanStepStatus = Literal["not_started", "in_progress", "completed", "blocked"]
+ACTIONABLE_STATUSES = ("not_started", "in_progress")
+
+
 _PLANNING_TOOL_DESCRIPTION = """
 A planning tool that allows the agent to create and manage plans for solving complex tasks.
 The tool provides functionality for creating plans, updating plan steps, and tracking progress.
 """
 
 
+class Plan(BaseModel):
+    """A plan and the progress of its steps.
+
+    Mutate plans through `mark`, `set_title`, `set_steps` and
+    `set_dependencies`. They keep track of the first actionable (not started
+    or in progress) step and of per-status counts, and invalidate only the
+    rendered text of the steps that changed, so finding the next step and
+    re-rendering after a status change are cheap.
+    """
+
+    plan_id: str
+    title: str
+    steps: List[str]
+    step_statuses: List[PlanStepStatus] = Field(default_factory=list)
+    step_notes: List[str] = Field(default_factory=list)
+    step_dependencies: Optional[List[List[int]]] = None
+
+    # Every step before this index is completed or blocked
+    _cursor: int = PrivateAttr(default=0)
+    _counts: Counter = PrivateAttr(default_factory=Counter)
+    # Rendered text of each step (None when stale) and of the whole plan
+    _step_texts: List[Optional[str]] = PrivateAttr(default_factory=list)
+    _text: Optional[str] = PrivateAttr(default=None)
+
+    @model_validator(mode="after")
+    def fill_step_state(self) -> "Plan":
+        missing = len(self.steps) - len(self.step_statuses)
+        self.step_statuses += ["not_started"] * missing
+        self.step_notes += [""] * (len(self.steps) - len(self.step_notes))
+        self._reset_caches()
+        return self
+
+    @property
+    def first_actionable_index(self) -> Optional[int]:
+        """Index of the first step not started or in progress, or None"""
+        cursor, statuses = self._cursor, self.step_statuses
+        while cursor < len(statuses) and statuses[cursor] not in ACTIONABLE_STATUSES:
+            cursor += 1
+        self._cursor = cursor
+        return cursor if cursor < len(statuses) else None
+
+    @property
+    def next_step_index(self) -> Optional[int]:
+        """The step to work on next: the first actionable step whose dependencies
+        are completed, or failing that the first actionable step"""
+        first = self.first_actionable_index
+        if first is None or self.step_dependencies is None:
+            # Without explicit dependencies the first actionable step is the one
+            return first
+        ready = self.ready_steps()
+        return ready[0] if ready else first
+
+    def mark(
+        self,
+        step_index: int,
+        status: Optional[PlanStepStatus] = None,
+        notes: Optional[str] = None,
+    ) -> None:
+        """Set a step's status and/or notes"""
+        if status and status != self.step_statuses[step_index]:
+            self._counts[self.step_statuses[step_index]] -= 1
+            self._counts[status] += 1
+            self.step_statuses[step_index] = status
+            if status in ACTIONABLE_STATUSES and step_index < self._cursor:
+                self._cursor = step_index
+            self._invalidate(step_index)
+        if notes and notes != self.step_notes[step_index]:
+            self.step_notes[step_index] = notes
+            self._invalidate(step_index)
+
+    def set_title(self, title: str) -> None:
+        self.title = title
+        self._text = None
+
+    def set_steps(self, steps: List[str]) -> None:
+        """Replace the steps, keeping the status and notes of steps that are
+        unchanged at the same position"""
+        statuses, notes = [], []
+        for i, step in enumerate(steps):
+            if i < len(self.steps) and step == self.steps[i]:
+                statuses.append(self.step_statuses[i])
+                notes.append(self.step_notes[i])
+            else:
+                statuses.append("not_started")
+                notes.append("")
+
+        # Dependencies given for the old steps no longer apply
+        if len(steps) != len(self.steps):
+            self.step_dependencies = None
+        self.steps, self.step_statuses, self.step_notes = steps, statuses, notes
+        self._reset_caches()
+
+    def set_dependencies(self, dependencies: Optional[List[List[int]]]) -> None:
+        self.step_dependencies = dependencies
+        self._reset_caches()
+
+    def dependencies(self) -> List[List[int]]:
+        """Dependencies of each step; without explicit ones, each step depends on the previous"""
+        if self.step_dependencies is None:
+            return [[i - 1] if i else [] for i in range(len(self.steps))]
+        return self.step_dependencies
+
+    def ready_steps(self) -> List[int]:
+        """Indices of actionable steps whose dependencies are all completed"""
+        first = self.first_actionable_index
+        if first is None:
+            return []
+        statuses, dependencies = self.step_statuses, self.dependencies()
+        return [
+            i
+            for i in range(first, len(self.steps))
+            if statuses[i] in ACTIONABLE_STATUSES
+            and all(statuses[dep] == "completed" for dep in dependencies[i])
+        ]
+
+    def count(self, status: PlanStepStatus) -> int:
+        return self._counts[status]
+
+    def render(self, with_id: bool = True) -> str:
+        """Format the plan for display, re-rendering only steps that changed.
+
+        Without the ID the text is the same for equal plans across runs, so it
+        can be part of a cacheable prompt.
+        """
+        if self._text is None:
+            self._text = self._render()
+        if with_id:
+            return self._text
+        return self._header(False) + self._text[len(self._header(True)) :]
+
+    def _header(self, with_id: bool) -> str:
+        output = f"Plan: {self.title}"
+        output += f" (ID: {self.plan_id})\n" if with_id else "\n"
+        return output + "=" * len(output) + "\n\n"
+
+    def _render(self) -> str:
+        output = self._header(True)
+
+        # Calculate progress statistics
+        total_steps = len(self.steps)
+        completed = self.count("completed")
+        in_progress = self.count("in_progress")
+        blocked = self.count("blocked")
+        not_started = self.count("not_started")
+
+        output += f"Progress: {completed}/{total_steps} steps completed "
+        if total_steps > 0:
+            percentage = (completed / total_steps) * 100
+            output += f"({percentage:.1f}%)\n"
+        else:
+            output += "(0%)\n"
+
+        output += f"Status: {completed} completed, {in_progress} in progress, {blocked} blocked, {not_started} not started\n\n"
+        output += "Steps:\n"
+
+        # Add each step with its status and notes
+        step_texts = self._step_texts
+        for i, text in enumerate(step_texts):
+            if text is None:
+                step_texts[i] = self._render_step(i)
+
+        return output + "".join(step_texts)
+
+    def _render_step(self, i: int) -> str:
+        status_symbol = {
+            "not_started": "[ ]",
+            "in_progress": "[→]",
+            "completed": "[✓]",
+            "blocked": "[!]",
+        }.get(self.step_statuses[i], "[ ]")
+
+        output = f"{i}. {status_symbol} {self.steps[i]}\n"
+        if self.step_dependencies and self.step_dependencies[i]:
+            depends_on = ", ".join(str(dep) for dep in self.step_dependencies[i])
+            output += f"   Depends on: {depends_on}\n"
+        if self.step_notes[i]:
+            output += f"   Notes: {self.step_notes[i]}\n"
+        return output
+
+    def _invalidate(self, step_index: int) -> None:
+        self._step_texts[step_index] = None
+        self._text = None
+
+    def _reset_caches(self) -> None:
+        self._cursor = 0
+        self._counts = Counter(self.step_statuses)
+        self._step_texts = [None] * len(self.steps)
+        self._text = None
+
+
 class PlanningTool(BaseTool):
     """
     A planning tool that allows the agent to create and manage plans for solving complex tasks.
@@ -48,6 +245,11 @@ class PlanningTool(BaseTool):
                 "type": "array",
                 "items": {"type": "string"},
             },
+            "dependencies": {
+                "description": "For each step, the 0-based indices of the steps it depends on. Steps whose dependencies are completed can run in parallel. Optional for create and update commands; by default each step depends on the one before it.",
+                "type": "array",
+                "items": {"type": "array", "items": {"type": "integer"}},
+            },
             "step_index": {
                 "description": "Index of the step to update (0-based). Required for mark_step command.",
                 "type": "integer",
@@ -66,7 +268,7 @@ class PlanningTool(BaseTool):
         "additionalProperties": False,
     }
 
-    plans: dict = {}  # Dictionary to store plans by plan_id
+    plans: Dict[str, Plan] = {}  # Dictionary to store plans by plan_id
     _current_plan_id: Optional[str] = None  # Track the current active plan
 
     async def execute(
@@ -78,6 +280,7 @@ class PlanningTool(BaseTool):
         plan_id: Optional[str] = None,
         title: Optional[str] = None,
         steps: Optional[List[str]] = None,
+        dependencies: Optional[List[List[int]]] = None,
         step_index: Optional[int] = None,
         step_status: Optional[
             Literal["not_started", "in_progress", "completed", "blocked"]
@@ -93,15 +296,16 @@ class PlanningTool(BaseTool):
         - plan_id: Unique identifier for the plan
         - title: Title for the plan (used with create command)
         - steps: List of steps for the plan (used with create command)
+        - dependencies: Indices of the steps each step depends on (used with create and update commands)
         - step_index: Index of the step to update (used with mark_step command)
         - step_status: Status to set for a step (used with mark_step command)
         - step_notes: Additional notes for a step (used with mark_step command)
         """
 
         if command == "create":
-            return self._create_plan(plan_id, title, steps)
+            return self._create_plan(plan_id, title, steps, dependencies)
         elif command == "update":
-            return self._update_plan(plan_id, title, steps)
+            return self._update_plan(plan_id, title, steps, dependencies)
         elif command == "list":
             return self._list_plans()
         elif command == "get":
@@ -118,7 +322,11 @@ class PlanningTool(BaseTool):
             )
 
     def _create_plan(
-        self, plan_id: Optional[str], title: Optional[str], steps: Optional[List[str]]
+        self,
+        plan_id: Optional[str],
+        title: Optional[str],
+        steps: Optional[List[str]],
+        dependencies: Optional[List[List[int]]] = None,
     ) -> ToolResult:
         """Create a new plan with the given ID, title, and steps."""
         if not plan_id:
@@ -141,14 +349,13 @@ class PlanningTool(BaseTool):
                 "Parameter `steps` must be a non-empty list of strings for command: create"
             )
 
+        if dependencies is not None:
+            self._validate_dependencies(dependencies, len(steps))
+
         # Create a new plan with initialized step statuses
-        plan = {
-            "plan_id": plan_id,
-            "title": title,
-            "steps": steps,
-            "step_statuses": ["not_started"] * len(steps),
-            "step_notes": [""] * len(steps),
-        }
+        plan = Plan(
+            plan_id=plan_id, title=title, steps=steps, step_dependencies=dependencies
+        )
 
         self.plans[plan_id] = plan
         self._current_plan_id = plan_id  # Set as active plan
@@ -158,7 +365,11 @@ class PlanningTool(BaseTool):
         )
 
     def _update_plan(
-        self, plan_id: Optional[str], title: Optional[str], steps: Optional[List[str]]
+        self,
+        plan_id: Optional[str],
+        title: Optional[str],
+        steps: Optional[List[str]],
+        dependencies: Optional[List[List[int]]] = None,
     ) -> ToolResult:
         """Update an existing plan with new title or steps."""
         if not plan_id:
@@ -170,7 +381,7 @@ class PlanningTool(BaseTool):
         plan = self.plans[plan_id]
 
         if title:
-            plan["title"] = title
+            plan.set_title(title)
 
         if steps:
             if not isinstance(steps, list) or not all(
@@ -181,31 +392,47 @@ class PlanningTool(BaseTool):
                 )
 
             # Preserve existing step statuses for unchanged steps
-            old_steps = plan["steps"]
-            old_statuses = plan["step_statuses"]
-            old_notes = plan["step_notes"]
-
-            # Create new step statuses and notes
-            new_statuses = []
-            new_notes = []
-
-            for i, step in enumerate(steps):
-                # If the step exists at the same position in old steps, preserve status and notes
-                if i < len(old_steps) and step == old_steps[i]:
-                    new_statuses.append(old_statuses[i])
-                    new_notes.append(old_notes[i])
-                else:
-                    new_statuses.append("not_started")
-                    new_notes.append("")
-
-            plan["steps"] = steps
-            plan["step_statuses"] = new_statuses
-            plan["step_notes"] = new_notes
+            plan.set_steps(steps)
+
+        if dependencies is not None:
+            self._validate_dependencies(dependencies, len(plan.steps))
+            plan.set_dependencies(dependencies)
 
         return ToolResult(
             output=f"Plan updated successfully: {plan_id}\n\n{self._format_plan(plan)}"
         )
 
+    @staticmethod
+    def _validate_dependencies(dependencies: List[List[int]], step_count: int) -> None:
+        """Check that dependencies name existing steps and contain no cycles."""
+        if len(dependencies) != step_count or not all(
+            isinstance(deps, list) for deps in dependencies
+        ):
+            raise ToolError(
+                "Parameter `dependencies` must contain one list of step indices per step"
+            )
+        for i, deps in enumerate(dependencies):
+            for dep in deps:
+                if not isinstance(dep, int) or not 0 <= dep < step_count or dep == i:
+                    raise ToolError(f"Invalid dependency {dep!r} for step {i}")
+
+        # Kahn's algorithm: every step must become ready at some point
+        remaining = [len(set(deps)) for deps in dependencies]
+        dependents = [[] for _ in range(step_count)]
+        for i, deps in enumerate(dependencies):
+            for dep in set(deps):
+                dependents[dep].append(i)
+        ready = [i for i, count in enumerate(remaining) if count == 0]
+        visited = 0
+        while ready:
+            visited += 1
+            for dependent in dependents[ready.pop()]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        if visited != step_count:
+            raise ToolError("Parameter `dependencies` must not contain cycles")
+
     def _list_plans(self) -> ToolResult:
         """List all available plans."""
         if not self.plans:
@@ -216,12 +443,10 @@ class PlanningTool(BaseTool):
         output = "Available plans:\n"
         for plan_id, plan in self.plans.items():
             current_marker = " (active)" if plan_id == self._current_plan_id else ""
-            completed = sum(
-                1 for status in plan["step_statuses"] if status == "completed"
-            )
-            total = len(plan["steps"])
+            completed = plan.count("completed")
+            total = len(plan.steps)
             progress = f"{completed}/{total} steps completed"
-            output += f"• {plan_id}{current_marker}: {plan['title']} - {progress}\n"
+            output += f"• {plan_id}{current_marker}: {plan.title} - {progress}\n"
 
         return ToolResult(output=output)
 
@@ -278,9 +503,9 @@ class PlanningTool(BaseTool):
 
         plan = self.plans[plan_id]
 
-        if step_index < 0 or step_index >= len(plan["steps"]):
+        if step_index < 0 or step_index >= len(plan.steps):
             raise ToolError(
-                f"Invalid step_index: {step_index}. Valid indices range from 0 to {len(plan['steps'])-1}."
+                f"Invalid step_index: {step_index}. Valid indices range from 0 to {len(plan.steps)-1}."
             )
 
         if step_status and step_status not in [
@@ -293,11 +518,7 @@ class PlanningTool(BaseTool):
                 f"Invalid step_status: {step_status}. Valid statuses are: not_started, in_progress, completed, blocked"
             )
 
-        if step_status:
-            plan["step_statuses"][step_index] = step_status
-
-        if step_notes:
-            plan["step_notes"][step_index] = step_notes
+        plan.mark(step_index, step_status, step_notes)
 
         return ToolResult(
             output=f"Step {step_index} updated in plan '{plan_id}'.\n\n{self._format_plan(plan)}"
@@ -319,45 +540,6 @@ class PlanningTool(BaseTool):
 
         return ToolResult(output=f"Plan '{plan_id}' has been deleted.")
 
-    def _format_plan(self, plan: Dict) -> str:
+    def _format_plan(self, plan: Plan) -> str:
         """Format a plan for display."""
-        output = f"Plan: {plan['title']} (ID: {plan['plan_id']})\n"
-        output += "=" * len(output) + "\n\n"
-
-        # Calculate progress statistics
-        total_steps = len(plan["steps"])
-        completed = sum(1 for status in plan["step_statuses"] if status == "completed")
-        in_progress = sum(
-            1 for status in plan["step_statuses"] if status == "in_progress"
-        )
-        blocked = sum(1 for status in plan["step_statuses"] if status == "blocked")
-        not_started = sum(
-            1 for status in plan["step_statuses"] if status == "not_started"
-        )
-
-        output += f"Progress: {completed}/{total_steps} steps completed "
-        if total_steps > 0:
-            percentage = (completed / total_steps) * 100
-            output += f"({percentage:.1f}%)\n"
-        else:
-            output += "(0%)\n"
-
-        output += f"Status: {completed} completed, {in_progress} in progress, {blocked} blocked, {not_started} not started\n\n"
-        output += "Steps:\n"
-
-        # Add each step with its status and notes
-        for i, (step, status, notes) in enumerate(
-            zip(plan["steps"], plan["step_statuses"], plan["step_notes"])
-        ):
-            status_symbol = {
-                "not_started": "[ ]",
-                "in_progress": "[→]",
-                "completed": "[✓]",
-                "blocked": "[!]",
-            }.get(status, "[ ]")
-
-            output += f"{i}. {status_symbol} {step}\n"
-            if notes:
-                output += f"   Notes: {notes}\n"
-
-        return output
+        return plan.render()
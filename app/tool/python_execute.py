@@ -1,14 +1,16 @@
-import threading
-from typing import Dict
+from typing import Dict, Optional
 
+from app.config import config
+from app.event_bus import AgentEvent, EventType, current_task_id, event_bus
 from app.tool.base import BaseTool
+from app.tool.python_kernel import PythonKernel, get_kernel_pool
 
 
 class PythonExecute(BaseTool):
-    """A tool for executing Python code with timeout and safety restrictions."""
+    """A tool for executing Python code in a persistent interpreter process."""
 
     name: str = "python_execute"
-    description: str = "Executes Python code string. Note: Only print outputs are visible, function return values are not captured. Use print statements to see results."
+    description: str = "Executes Python code string. Note: Only print outputs are visible, function return values are not captured. Use print statements to see results. Variables, functions and imports persist between calls."
     parameters: dict = {
         "type": "object",
         "properties": {
@@ -19,52 +21,63 @@ class PythonExecute(BaseTool):
         },
         "required": ["code"],
     }
+    exclusive: bool = True  # one interpreter, running one call at a time
+
+    _kernel: Optional[PythonKernel] = None
 
     async def execute(
         self,
         code: str,
-        timeout: int = 5,
+        timeout: Optional[float] = None,
     ) -> Dict:
         """
         Executes the provided Python code with a timeout.
 
         Args:
             code (str): The Python code to execute.
-            timeout (int): Execution timeout in seconds.
+            timeout (float): Execution timeout in seconds, [python_execute]
+                timeout by default. The interpreter is killed when it is
+                exceeded and its variables are lost.
 
         Returns:
-            Dict: Contains 'output' with execution output or error message and 'success' status.
+            Dict: Contains 'observation' with execution output or error message and 'success' status.
         """
-        result = {"observation": ""}
-
-        def run_code():
-            try:
-                safe_globals = {"__builtins__": dict(__builtins__)}
-
-                import sys
-                from io import StringIO
-
-                output_buffer = StringIO()
-                sys.stdout = output_buffer
-
-                exec(code, safe_globals, {})
-
-                sys.stdout = sys.__stdout__
-
-                result["observation"] = output_buffer.getvalue()
-
-            except Exception as e:
-                result["observation"] = str(e)
-                result["success"] = False
-
-        thread = threading.Thread(target=run_code)
-        thread.start()
-        thread.join(timeout)
-
-        if thread.is_alive():
-            return {
-                "observation": f"Execution timeout after {timeout} seconds",
-                "success": False,
-            }
-
-        return result
+        if timeout is None:
+            timeout = config.python_execute.timeout
+        if self._kernel is None:
+            self._kernel = await get_kernel_pool().acquire()
+
+        # Kernels are started ahead of time outside any task, so their readers
+        # cannot tell whose output this is
+        task_id = current_task_id.get()
+
+        async def on_output(text: str, stream_name: str) -> None:
+            await event_bus.emit(
+                AgentEvent(
+                    type=EventType.TOOL_OUTPUT,
+                    source=self.name,
+                    content=text,
+                    data={"tool": self.name, "stream": stream_name},
+                    task_id=task_id,
+                )
+            )
+
+        result = await self._kernel.run(code, timeout, on_output=on_output)
+        observation = result.get("stdout", "") + result.get("stderr", "")
+        if not self._kernel.alive:
+            get_kernel_pool().release(self._kernel)
+            self._kernel = None
+            observation += (
+                f"{result['error']}\n"
+                "The interpreter was restarted; variables from earlier calls are gone."
+            )
+        elif not result["success"] and not observation:
+            observation = result["error"]
+
+        return {"observation": observation, "success": result["success"]}
+
+    async def cleanup(self) -> None:
+        """Kill the interpreter"""
+        if self._kernel is not None:
+            get_kernel_pool().release(self._kernel)
+            self._kernel = None
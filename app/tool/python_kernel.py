@@ -0,0 +1,349 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import sys
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.config import config
+from app.exceptions import ToolError
+from app.tool.bash import OutputCallback, _StreamReader
+
+
+KERNEL_SCRIPT = str(Path(__file__).with_name("kernel_process.py"))
+
+
+class _Zygote:
+    """The template process that kernels are forked from.
+
+    It imports the preload modules once; forking a kernel from it then takes
+    milliseconds however long those imports took.
+    """
+
+    def __init__(
+        self, max_memory_mb: int = 0, max_cpu_seconds: int = 0, preload: List[str] = ()
+    ):
+        self.max_memory_mb = max_memory_mb
+        self.max_cpu_seconds = max_cpu_seconds
+        self.preload = list(preload)
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        async with self._lock:
+            if self._process is None:
+                await self._start()
+
+    async def _start(self) -> None:
+        parent_sock, child_sock = socket.socketpair()
+        fd = child_sock.fileno()
+        self._process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-u",
+            KERNEL_SCRIPT,
+            str(fd),
+            str(self.max_memory_mb),
+            str(self.max_cpu_seconds),
+            *self.preload,
+            pass_fds=(fd,),
+            start_new_session=True,
+            stdin=asyncio.subprocess.DEVNULL,
+        )
+        child_sock.close()
+        parent_sock.setblocking(False)
+        self._sock = parent_sock
+
+    @property
+    def exited(self) -> bool:
+        return self._process is not None and self._process.returncode is not None
+
+    async def fork(self, fds: List[int]) -> int:
+        """Fork a kernel with `fds` as its stdin, stdout and stderr; returns its pid"""
+        await self.start()
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            try:
+                socket.send_fds(self._sock, [b"fork"], fds)
+                reply = b""
+                while not reply.endswith(b"\n"):
+                    chunk = await loop.sock_recv(self._sock, 64)
+                    if not chunk:
+                        raise ConnectionResetError
+                    reply += chunk
+            except ConnectionError:
+                raise ToolError(
+                    f"Python kernel template exited with returncode {self._process.returncode}"
+                )
+        return int(reply)
+
+    def kill(self) -> None:
+        """Kill the template; kernels forked from it keep running"""
+        if self._process is None:
+            return
+        self._sock.close()
+        if self._process.returncode is None:
+            self._process.kill()
+
+
+class PythonKernel:
+    """A persistent Python interpreter in a child process.
+
+    Variables defined by one call are visible to the next. Output reaches the
+    parent over pipes as it is written. The kernel leads its own process
+    group, so a call that runs past its timeout is ended by killing the group;
+    the kernel is dead afterwards.
+    """
+
+    _marker: str = "<<kernel-done>>"
+
+    def __init__(self, zygote: _Zygote):
+        self._zygote = zygote
+        self._pid: Optional[int] = None
+        self._killed = False
+
+    async def start(self) -> None:
+        if self._pid is not None:
+            return
+        loop = asyncio.get_running_loop()
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        try:
+            self._pid = await self._zygote.fork([stdin_r, stdout_w, stderr_w])
+        except BaseException:
+            for fd in (stdin_w, stdout_r, stderr_r):
+                os.close(fd)
+            raise
+        finally:
+            for fd in (stdin_r, stdout_w, stderr_w):
+                os.close(fd)
+
+        stdout = asyncio.StreamReader()
+        stderr = asyncio.StreamReader()
+        self._transports = [
+            (
+                await loop.connect_read_pipe(
+                    lambda: asyncio.StreamReaderProtocol(stream), os.fdopen(fd, "rb", 0)
+                )
+            )[0]
+            for stream, fd in ((stdout, stdout_r), (stderr, stderr_r))
+        ]
+        self._stdout = _StreamReader(stdout, "stdout")
+        self._stderr = _StreamReader(stderr, "stderr")
+        # The same protocol asyncio's own subprocess pipes use for writing
+        transport, protocol = await loop.connect_write_pipe(
+            asyncio.streams.FlowControlMixin, os.fdopen(stdin_w, "wb", 0)
+        )
+        self._transports.append(transport)
+        self._stdin = asyncio.StreamWriter(transport, protocol, None, loop)
+
+    @property
+    def alive(self) -> bool:
+        # A kernel that exited has closed its end of the output pipes
+        return self._pid is not None and not self._killed and not self._stdout.eof
+
+    def kill(self) -> None:
+        """Kill the interpreter and any processes it started"""
+        if self._pid is None or self._killed:
+            return
+        self._kill_group()
+        self._killed = True
+        self._stdout.cancel()
+        self._stderr.cancel()
+        for transport in self._transports:
+            transport.close()
+
+    def _kill_group(self) -> None:
+        if self._stdout.eof:
+            return
+        try:
+            os.killpg(self._pid, signal.SIGKILL)
+        except ProcessLookupError:
+            # Not yet the leader of its own group
+            try:
+                os.kill(self._pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    async def run(
+        self,
+        code: str,
+        timeout: Optional[float] = None,
+        on_output: Optional[OutputCallback] = None,
+    ) -> Dict:
+        """Run code in the interpreter, passing output lines to `on_output`.
+
+        Returns a dict with the call's 'stdout' and 'stderr', 'success', and
+        an 'error' message if the code raised or the kernel had to be killed.
+        """
+        if self._pid is None:
+            raise ToolError("Kernel has not started.")
+        if not self.alive:
+            return self._exited_result()
+
+        marker = f"{self._marker[:-2]}-{uuid.uuid4().hex}>>"
+        self._stdout.on_output = self._stderr.on_output = on_output
+        stdout_done = self._stdout.expect(marker.encode())
+        stderr_done = self._stderr.expect(marker.encode())
+
+        self._stdin.write(json.dumps({"code": code, "marker": marker}).encode() + b"\n")
+        both_done = asyncio.gather(stdout_done, stderr_done)
+        try:
+            await self._stdin.drain()
+            stdout_line, stderr_line = await asyncio.wait_for(
+                asyncio.shield(both_done), timeout
+            )
+        except asyncio.TimeoutError:
+            self._kill_group()
+            # Let the readers drain what the killed processes wrote
+            await asyncio.wait([both_done], timeout=1)
+            self.kill()
+            result = self._take_remaining()
+            result.update(
+                success=False, error=f"Execution timeout after {timeout} seconds"
+            )
+            return result
+        except ConnectionError:
+            stdout_line = stderr_line = None
+        finally:
+            self._stdout.on_output = self._stderr.on_output = None
+
+        if stdout_line is None or stderr_line is None:
+            result = self._take_remaining()
+            result.update(self._exited_result())
+            return result
+
+        start, end = stdout_line
+        data = self._stdout.take(end)
+        result = json.loads(data[start + len(marker) : end])
+        result["stdout"] = data[:start].decode(errors="replace")
+        start, end = stderr_line
+        result["stderr"] = self._stderr.take(end)[:start].decode(errors="replace")
+        return result
+
+    def _take_remaining(self) -> Dict:
+        """Output of an unfinished call, up to where it stopped"""
+        return {
+            "stdout": self._stdout.take_all().decode(errors="replace"),
+            "stderr": self._stderr.take_all().decode(errors="replace"),
+        }
+
+    def _exited_result(self) -> Dict:
+        return {
+            "success": False,
+            "error": "Python kernel exited",
+        }
+
+
+class KernelPool:
+    """Python kernels started ahead of time and handed out one per user.
+
+    Kernels are forked from a template process that has imported the
+    `preload` modules, so they start with those imported. `acquire` takes a
+    warm kernel and forks a replacement in the background, so the first call
+    does not wait for the interpreter to start. Released kernels are killed
+    rather than reused, so no task sees another's globals.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        max_memory_mb: int = 0,
+        max_cpu_seconds: int = 0,
+        preload: List[str] = (),
+    ):
+        self.size = size
+        self.max_memory_mb = max_memory_mb
+        self.max_cpu_seconds = max_cpu_seconds
+        self.preload = list(preload)
+        self._zygote: Optional[_Zygote] = None
+        self._idle: List[PythonKernel] = []
+        self._fill_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def acquire(self) -> PythonKernel:
+        self._check_loop()
+        kernel = None
+        while self._idle and kernel is None:
+            candidate = self._idle.pop()
+            if candidate.alive:
+                kernel = candidate
+            else:
+                candidate.kill()
+        if kernel is None:
+            kernel = await self._new_kernel()
+        self.fill()
+        return kernel
+
+    def release(self, kernel: PythonKernel) -> None:
+        kernel.kill()
+
+    def fill(self) -> None:
+        """Start kernels in the background until `size` are idle"""
+        self._check_loop()
+        if self._fill_task is None or self._fill_task.done():
+            self._fill_task = asyncio.create_task(self._fill())
+
+    def close(self) -> None:
+        if self._fill_task is not None:
+            self._fill_task.cancel()
+            self._fill_task = None
+        while self._idle:
+            self.release(self._idle.pop())
+        if self._zygote is not None:
+            self._zygote.kill()
+            self._zygote = None
+
+    async def _new_kernel(self) -> PythonKernel:
+        if self._zygote is None or self._zygote.exited:
+            if self._zygote is not None:
+                self._zygote.kill()
+            self._zygote = _Zygote(
+                self.max_memory_mb, self.max_cpu_seconds, self.preload
+            )
+        kernel = PythonKernel(self._zygote)
+        await kernel.start()
+        return kernel
+
+    async def _fill(self) -> None:
+        while len(self._idle) < self.size:
+            self._idle.append(await self._new_kernel())
+
+    def _check_loop(self) -> None:
+        # Subprocesses belong to the event loop that started them
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            for kernel in self._idle:
+                kernel.kill()
+            self._idle.clear()
+            if self._zygote is not None:
+                self._zygote.kill()
+                self._zygote = None
+            self._fill_task = None
+            self._loop = loop
+
+
+_kernel_pool: Optional[KernelPool] = None
+
+
+def get_kernel_pool() -> KernelPool:
+    """Get the process-wide pool of Python kernels, creating it on first use"""
+    global _kernel_pool
+    if _kernel_pool is None:
+        settings = config.python_execute
+        _kernel_pool = KernelPool(
+            size=settings.pool_size,
+            max_memory_mb=settings.max_memory_mb,
+            max_cpu_seconds=settings.max_cpu_seconds,
+            preload=settings.preload,
+        )
+    return _kernel_pool
+
+
+def close_kernel_pool() -> None:
+    """Kill the idle kernels and the template of the process-wide pool"""
+    if _kernel_pool is not None:
+        _kernel_pool.close()
@@ -85,6 +85,7 @@ class StrReplaceEditor(BaseTool):
         },
         "required": ["command", "path"],
     }
+    exclusive: bool = True
 
     _file_history: list = defaultdict(list)
 
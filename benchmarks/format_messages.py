@@ -0,0 +1,66 @@
+"""Per-step cost of formatting agent history for an LLM request.
+
+Each agent step sends the whole history through `LLM.format_messages`.
+Messages held in `Memory` are frozen and memoize their wire dict, so only new
+messages are serialized and validated; unfrozen messages are converted and
+checked again on every call.
+
+Run from the project root:
+    python -m benchmarks.format_messages
+"""
+import json
+import timeit
+
+from app.llm import LLM
+from app.schema import Memory, Message, ToolCall
+
+
+SIZES = (50, 100, 500)
+
+
+def build_history(size: int) -> list:
+    """A history of user prompts, assistant tool calls and tool results"""
+    messages = [Message.user_message("Summarize the latest essays and save them.")]
+    step = 0
+    while len(messages) < size:
+        call = ToolCall(
+            id=f"call_{step}",
+            function={
+                "name": "python_execute",
+                "arguments": json.dumps({"code": f"print({step} * 2)\n" * 5}),
+            },
+        )
+        messages.append(Message.user_message("What should you do next?"))
+        messages.append(
+            Message(role="assistant", content="Running the code.", tool_calls=[call])
+        )
+        messages.append(Message.tool_message("x" * 400, "python_execute", call.id))
+        step += 1
+    return messages[:size]
+
+
+def per_step_ms(messages: list, repeat: int = 5, number: int = 50) -> float:
+    best = min(
+        timeit.repeat(
+            lambda: LLM.format_messages(messages), repeat=repeat, number=number
+        )
+    )
+    return best / number * 1000
+
+
+def main():
+    print(
+        f"{'messages':>8}  {'unfrozen ms/step':>16}  {'memoized ms/step':>16}  {'speedup':>7}"
+    )
+    for size in SIZES:
+        unfrozen = build_history(size)
+        memory = Memory(max_messages=size)
+        memory.add_messages(build_history(size))
+
+        before = per_step_ms(unfrozen)
+        after = per_step_ms(memory.messages)
+        print(f"{size:>8}  {before:>16.3f}  {after:>16.3f}  {before / after:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
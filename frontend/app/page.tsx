@@ -26,7 +26,7 @@ export default function Home() {
     // Fetch recent tasks
     const fetchRecentTasks = async () => {
       try {
-        const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/tasks`);
+        const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/tasks?limit=5`);
         if (response.ok) {
           const data = await response.json();
           setRecentTasks(data.slice(0, 5)); // Take only the 5 most recent
@@ -42,16 +42,20 @@ export default function TaskPage() {
         
         const data = await response.json();
         setTask(data);
+        // Resume the stream after the last step we already have
+        const steps = data.steps || [];
+        return steps.length ? steps[steps.length - 1].seq : -1;
       } catch (err) {
         setError(err.message || 'Failed to load task');
+        return null;
       } finally {
         setLoading(false);
       }
     };
     
-    // Set up SSE stream
-    const setupEventSource = () => {
-      const apiUrl = `${process.env.NEXT_PUBLIC_API_URL}/tasks/${taskId}/events`;
+    // Set up SSE stream; the server only sends steps after lastSeq
+    const setupEventSource = (lastSeq) => {
+      const apiUrl = `${process.env.NEXT_PUBLIC_API_URL}/tasks/${taskId}/events?last_event_id=${lastSeq}`;
       console.log(`Connecting to SSE at ${apiUrl}`);
       
       const eventSource = new EventSource(apiUrl);
@@ -74,28 +78,20 @@ export default function TaskPage() {
         }
       });
       
-      ['think', 'tool', 'act', 'log', 'result'].forEach(type => {
+      ['think', 'tool', 'act', 'plan', 'log', 'result'].forEach(type => {
         eventSource.addEventListener(type, (event) => {
           try {
             const data = JSON.parse(event.data);
             setTask(prev => {
               if (!prev || !prev.steps) return prev;
               
-              // Check if we already have this step
-              const existingStepIndex = prev.steps.findIndex(s => 
-                s.step === data.step && s.type === data.type
-              );
-              
-              const newSteps = [...prev.steps];
-              if (existingStepIndex >= 0) {
-                newSteps[existingStepIndex] = data;
-              } else {
-                newSteps.push(data);
-              }
+              // Steps arrive in seq order; skip any we already have
+              const last = prev.steps[prev.steps.length - 1];
+              if (last && last.seq >= data.seq) return prev;
               
               return {
                 ...prev,
-                steps: newSteps
+                steps: [...prev.steps, data]
               };
             });
             
@@ -115,17 +111,20 @@ export default function TaskPage() {
         console.error('SSE error');
         eventSource.close();
       };
-      
-      return () => {
-        console.log('Closing SSE connection');
-        eventSource.close();
-      };
     };
     
-    fetchTask();
-    const cleanup = setupEventSource();
+    let cancelled = false;
+    fetchTask().then(lastSeq => {
+      if (!cancelled && lastSeq !== null) setupEventSource(lastSeq);
+    });
     
-    return cleanup;
+    return () => {
+      cancelled = true;
+      if (eventSourceRef.current) {
+        console.log('Closing SSE connection');
+        eventSourceRef.current.close();
+      }
+    };
   }, [taskId]);
 
   // Handle follow-up prompt
@@ -286,6 +285,7 @@ export default function TaskPage() {
           if (step.type === 'think') icon = '✨';
           else if (step.type === 'tool') icon = '🛠️';
           else if (step.type === 'act') icon = '🎯';
+          else if (step.type === 'plan') icon = '📋';
           else if (step.type === 'result') icon = '✓';
           else if (step.type === 'error') icon = '⚠️';
           
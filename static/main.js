@@ -49,358 +49,140 @@ function setupSSE(taskId) {
     let retryCount = 0;
     const maxRetries = 3;
     const retryDelay = 2000;
-    
-    function connect() {
-        const eventSource = new EventSource(`/tasks/${taskId}/events`);
-        currentEventSource = eventSource;
-
-        const container = document.getElementById('task-container');
-        
-        // let heartbeatTimer = setInterval(() => {
-        //     container.innerHTML += '<div class="ping">·</div>';
-        // }, 5000);
-
-        const pollInterval = setInterval(() => {
-            fetch(`/tasks/${taskId}`)
-                .then(response => response.json())
-                .then(task => {
-                    updateTaskStatus(task);
-                })
-                .catch(error => {
-                    console.error('轮询失败:', error);
-                });
-        }, 10000);
-
-    if (!eventSource._listenersAdded) {
-        eventSource._listenersAdded = true;
-        
-        let lastResultContent = '';
-        eventSource.addEventListener('status', (event) => {
-            clearInterval(heartbeatTimer);
-            try {
-                const data = JSON.parse(event.data);
-                container.querySelector('.loading')?.remove();
-                container.classList.add('active');
-                const welcomeMessage = document.querySelector('.welcome-message');
-                if (welcomeMessage) {
-                    welcomeMessage.style.display = 'none';
-                }
+    // 最后收到的步骤序号，重连时从这里继续，只接收增量
+    let lastSeq = -1;
+    let lastResultContent = '';
+    let isTaskComplete = false;
 
-                let stepContainer = container.querySelector('.step-container');
-                if (!stepContainer) {
-                    container.innerHTML = '<div class="step-container"></div>';
-                    stepContainer = container.querySelector('.step-container');
-                }
+    const container = document.getElementById('task-container');
 
-                // 保存result内容
-                if (data.steps && data.steps.length > 0) {
-                    // 遍历所有步骤，找到最后一个result类型
-                    for (let i = data.steps.length - 1; i >= 0; i--) {
-                        if (data.steps[i].type === 'result') {
-                            lastResultContent = data.steps[i].result;
-                            break;
-                        }
-                    }
-                }
+    function getStepContainer() {
+        container.querySelector('.loading')?.remove();
+        container.classList.add('active');
+        let stepContainer = container.querySelector('.step-container');
+        if (!stepContainer) {
+            container.innerHTML = '<div class="step-container"></div>';
+            stepContainer = container.querySelector('.step-container');
+        }
+        return stepContainer;
+    }
 
-                // Parse and display each step with proper formatting
-                stepContainer.innerHTML = data.steps.map(step => {
-                    const content = step.result;
-                    const timestamp = new Date().toLocaleTimeString();
-                    return `
-                        <div class="step-item ${step.type || 'step'}">
-                            <div class="log-line">
-                                <span class="log-prefix">${getEventIcon(step.type)} [${timestamp}] ${getEventLabel(step.type)}:</span>
-                                <pre>${content}</pre>
-                            </div>
-                        </div>
-                    `;
-                }).join('');
-                
-                // Auto-scroll to bottom
-                container.scrollTo({
-                    top: container.scrollHeight,
-                    behavior: 'smooth'
-                });
-            } catch (e) {
-                console.error('状态更新失败:', e);
+    // 将单个步骤增量追加到页面
+    function appendStep(data) {
+        if (data.seq !== undefined) {
+            if (data.seq <= lastSeq) {
+                return;
             }
-        });
-
-        // 添加对think事件的处理
-        eventSource.addEventListener('think', (event) => {
-            clearInterval(heartbeatTimer);
-            try {
-                const data = JSON.parse(event.data);
-                container.querySelector('.loading')?.remove();
-                
-                let stepContainer = container.querySelector('.step-container');
-                if (!stepContainer) {
-                    container.innerHTML = '<div class="step-container"></div>';
-                    stepContainer = container.querySelector('.step-container');
-                }
+            lastSeq = data.seq;
+        }
+        if (data.type === 'result') {
+            lastResultContent = data.result;
+        }
 
-                const content = data.result;
-                const timestamp = new Date().toLocaleTimeString();
-                
-                const step = document.createElement('div');
-                step.className = 'step-item think';
-                step.innerHTML = `
-                    <div class="log-line">
-                        <span class="log-prefix">${getEventIcon('think')} [${timestamp}] ${getEventLabel('think')}:</span>
-                        <pre>${content}</pre>
-                    </div>
-                `;
-                
-                stepContainer.appendChild(step);
-                container.scrollTo({
-                    top: container.scrollHeight,
-                    behavior: 'smooth'
-                });
+        const stepContainer = getStepContainer();
+        if (data.type === 'think') {
+            stepContainer.querySelector('.step-item.think-live')?.remove();
+        }
+        if (data.type === 'act') {
+            stepContainer.querySelector('.step-item.act-live')?.remove();
+        }
 
-                // 更新任务状态
-                fetch(`/tasks/${taskId}`)
-                    .then(response => response.json())
-                    .then(task => {
-                        updateTaskStatus(task);
-                    })
-                    .catch(error => {
-                        console.error('状态更新失败:', error);
-                    });
-            } catch (e) {
-                console.error('思考事件处理失败:', e);
-            }
+        const timestamp = new Date().toLocaleTimeString();
+        const step = document.createElement('div');
+        step.className = `step-item ${data.type || 'step'}`;
+        step.innerHTML = `
+            <div class="log-line">
+                <span class="log-prefix">${getEventIcon(data.type)} [${timestamp}] ${getEventLabel(data.type)}:</span>
+                <pre>${data.result}</pre>
+            </div>
+        `;
+        stepContainer.appendChild(step);
+        container.scrollTo({
+            top: container.scrollHeight,
+            behavior: 'smooth'
         });
+    }
 
-        // 添加对tool事件的处理
-        eventSource.addEventListener('tool', (event) => {
-            clearInterval(heartbeatTimer);
-            try {
-                const data = JSON.parse(event.data);
-                container.querySelector('.loading')?.remove();
-                
-                let stepContainer = container.querySelector('.step-container');
-                if (!stepContainer) {
-                    container.innerHTML = '<div class="step-container"></div>';
-                    stepContainer = container.querySelector('.step-container');
-                }
-
-                const content = data.result;
-                const timestamp = new Date().toLocaleTimeString();
-                
-                const step = document.createElement('div');
-                step.className = 'step-item tool';
-                step.innerHTML = `
-                    <div class="log-line">
-                        <span class="log-prefix">${getEventIcon('tool')} [${timestamp}] ${getEventLabel('tool')}:</span>
-                        <pre>${content}</pre>
-                    </div>
-                `;
-                
-                stepContainer.appendChild(step);
-                container.scrollTo({
-                    top: container.scrollHeight,
-                    behavior: 'smooth'
-                });
-
-                // 更新任务状态
-                fetch(`/tasks/${taskId}`)
-                    .then(response => response.json())
-                    .then(task => {
-                        updateTaskStatus(task);
-                    })
-                    .catch(error => {
-                        console.error('状态更新失败:', error);
-                    });
-            } catch (e) {
-                console.error('工具事件处理失败:', e);
-            }
-        });
+    function connect() {
+        const eventSource = new EventSource(`/tasks/${taskId}/events?last_event_id=${lastSeq}`);
+        currentEventSource = eventSource;
 
-        // 添加对act事件的处理
-        eventSource.addEventListener('act', (event) => {
-            clearInterval(heartbeatTimer);
+        eventSource.addEventListener('status', (event) => {
             try {
                 const data = JSON.parse(event.data);
-                container.querySelector('.loading')?.remove();
-                
-                let stepContainer = container.querySelector('.step-container');
-                if (!stepContainer) {
-                    container.innerHTML = '<div class="step-container"></div>';
-                    stepContainer = container.querySelector('.step-container');
+                getStepContainer();
+                const welcomeMessage = document.querySelector('.welcome-message');
+                if (welcomeMessage) {
+                    welcomeMessage.style.display = 'none';
                 }
-
-                const content = data.result;
-                const timestamp = new Date().toLocaleTimeString();
-                
-                const step = document.createElement('div');
-                step.className = 'step-item act';
-                step.innerHTML = `
-                    <div class="log-line">
-                        <span class="log-prefix">${getEventIcon('act')} [${timestamp}] ${getEventLabel('act')}:</span>
-                        <pre>${content}</pre>
-                    </div>
-                `;
-                
-                stepContainer.appendChild(step);
-                container.scrollTo({
-                    top: container.scrollHeight,
-                    behavior: 'smooth'
-                });
-
-                // 更新任务状态
-                fetch(`/tasks/${taskId}`)
-                    .then(response => response.json())
-                    .then(task => {
-                        updateTaskStatus(task);
-                    })
-                    .catch(error => {
-                        console.error('状态更新失败:', error);
-                    });
+                updateTaskStatus({ id: taskId, status: data.status });
             } catch (e) {
-                console.error('执行事件处理失败:', e);
+                console.error('状态更新失败:', e);
             }
         });
 
-        // 添加对run事件的处理
-        // 添加对log事件的处理
-        eventSource.addEventListener('log', (event) => {
-            clearInterval(heartbeatTimer);
-            try {
-                const data = JSON.parse(event.data);
-                container.querySelector('.loading')?.remove();
-                
-                let stepContainer = container.querySelector('.step-container');
-                if (!stepContainer) {
-                    container.innerHTML = '<div class="step-container"></div>';
-                    stepContainer = container.querySelector('.step-container');
+        ['think', 'tool', 'act', 'plan', 'log', 'run', 'result', 'step'].forEach(type => {
+            eventSource.addEventListener(type, (event) => {
+                try {
+                    appendStep(JSON.parse(event.data));
+                } catch (e) {
+                    console.error('步骤事件处理失败:', e);
                 }
-
-                const content = data.result;
-                const timestamp = new Date().toLocaleTimeString();
-                
-                const step = document.createElement('div');
-                step.className = 'step-item log';
-                step.innerHTML = `
-                    <div class="log-line">
-                        <span class="log-prefix">${getEventIcon('log')} [${timestamp}] ${getEventLabel('log')}:</span>
-                        <pre>${content}</pre>
-                    </div>
-                `;
-                
-                stepContainer.appendChild(step);
-                container.scrollTo({
-                    top: container.scrollHeight,
-                    behavior: 'smooth'
-                });
-
-                // 更新任务状态
-                fetch(`/tasks/${taskId}`)
-                    .then(response => response.json())
-                    .then(task => {
-                        updateTaskStatus(task);
-                    })
-                    .catch(error => {
-                        console.error('状态更新失败:', error);
-                    });
-            } catch (e) {
-                console.error('日志事件处理失败:', e);
-            }
+            });
         });
 
-        eventSource.addEventListener('run', (event) => {
-            clearInterval(heartbeatTimer);
+        // 流式思考内容：实时追加到临时块中，完整的think事件到达后移除
+        eventSource.addEventListener('think_delta', (event) => {
             try {
                 const data = JSON.parse(event.data);
-                container.querySelector('.loading')?.remove();
-                
-                let stepContainer = container.querySelector('.step-container');
-                if (!stepContainer) {
-                    container.innerHTML = '<div class="step-container"></div>';
-                    stepContainer = container.querySelector('.step-container');
+                const stepContainer = getStepContainer();
+
+                let live = stepContainer.querySelector('.step-item.think-live pre');
+                if (!live) {
+                    const step = document.createElement('div');
+                    step.className = 'step-item think think-live';
+                    step.innerHTML = `
+                        <div class="log-line">
+                            <span class="log-prefix">${getEventIcon('think')} ${getEventLabel('think')}:</span>
+                            <pre></pre>
+                        </div>
+                    `;
+                    stepContainer.appendChild(step);
+                    live = step.querySelector('pre');
                 }
-
-                const content = data.result;
-                const timestamp = new Date().toLocaleTimeString();
-                
-                const step = document.createElement('div');
-                step.className = 'step-item run';
-                step.innerHTML = `
-                    <div class="log-line">
-                        <span class="log-prefix">${getEventIcon('run')} [${timestamp}] ${getEventLabel('run')}:</span>
-                        <pre>${content}</pre>
-                    </div>
-                `;
-                
-                stepContainer.appendChild(step);
-                container.scrollTo({
-                    top: container.scrollHeight,
-                    behavior: 'smooth'
-                });
-
-                // 更新任务状态
-                fetch(`/tasks/${taskId}`)
-                    .then(response => response.json())
-                    .then(task => {
-                        updateTaskStatus(task);
-                    })
-                    .catch(error => {
-                        console.error('状态更新失败:', error);
-                    });
+                live.textContent += data.result;
             } catch (e) {
-                console.error('运行事件处理失败:', e);
+                console.error('流式思考处理失败:', e);
             }
         });
 
-        eventSource.addEventListener('message', (event) => {
-            clearInterval(heartbeatTimer);
+        // 命令的实时输出：追加到临时块中，工具结果(act事件)到达后移除
+        eventSource.addEventListener('tool_output', (event) => {
             try {
                 const data = JSON.parse(event.data);
-                container.querySelector('.loading')?.remove();
-
-                let stepContainer = container.querySelector('.step-container');
-                if (!stepContainer) {
-                    container.innerHTML = '<div class="step-container"></div>';
-                    stepContainer = container.querySelector('.step-container');
+                const stepContainer = getStepContainer();
+
+                let live = stepContainer.querySelector('.step-item.act-live pre');
+                if (!live) {
+                    const step = document.createElement('div');
+                    step.className = 'step-item act act-live';
+                    step.innerHTML = `
+                        <div class="log-line">
+                            <span class="log-prefix">${getEventIcon('act')} ${getEventLabel('act')}:</span>
+                            <pre></pre>
+                        </div>
+                    `;
+                    stepContainer.appendChild(step);
+                    live = step.querySelector('pre');
                 }
-                
-                // Create new step element
-                const step = document.createElement('div');
-                step.className = `step-item ${data.type || 'step'}`;
-                
-                // Format content and timestamp
-                const content = data.result;
-                const timestamp = new Date().toLocaleTimeString();
-                
-                step.innerHTML = `
-                    <div class="log-line ${data.type || 'info'}">
-                        <span class="log-prefix">${getEventIcon(data.type)} [${timestamp}] ${getEventLabel(data.type)}:</span>
-                        <pre>${content}</pre>
-                    </div>
-                `;
-            
-                // Add step to container with animation
-                stepContainer.prepend(step);
-                setTimeout(() => {
-                    step.classList.add('show');
-                }, 10);
-                
-                // Auto-scroll to bottom
-                container.scrollTo({
-                    top: container.scrollHeight,
-                    behavior: 'smooth'
-                });
+                live.textContent += data.result;
             } catch (e) {
-                console.error('消息处理失败:', e);
+                console.error('实时输出处理失败:', e);
             }
         });
 
-        let isTaskComplete = false;
-
         eventSource.addEventListener('complete', (event) => {
             isTaskComplete = true;
-            clearInterval(heartbeatTimer);
-            clearInterval(pollInterval);
             container.innerHTML += `
                 <div class="complete">
                     <div>✅ 任务完成</div>
@@ -413,10 +195,18 @@ function setupSSE(taskId) {
         });
 
         eventSource.addEventListener('error', (event) => {
-            clearInterval(heartbeatTimer);
-            clearInterval(pollInterval);
+            // 连接错误没有数据，由onerror处理
+            if (!event.data) {
+                return;
+            }
             try {
                 const data = JSON.parse(event.data);
+                // 带序号的是被归类为错误的日志步骤，而不是任务失败
+                if (data.seq !== undefined) {
+                    appendStep(data);
+                    return;
+                }
+                isTaskComplete = true;
                 container.innerHTML += `
                     <div class="error">
                         ❌ 错误: ${data.message}
@@ -428,23 +218,15 @@ function setupSSE(taskId) {
                 console.error('错误处理失败:', e);
             }
         });
-    }
-            
-    container.scrollTo({
-        top: container.scrollHeight,
-        behavior: 'smooth'
-    });
 
         eventSource.onerror = (err) => {
             if (isTaskComplete) {
                 return;
             }
-            
+
             console.error('SSE连接错误:', err);
-            clearInterval(heartbeatTimer);
-            clearInterval(pollInterval);
             eventSource.close();
-            
+
             if (retryCount < maxRetries) {
                 retryCount++;
                 container.innerHTML += `
@@ -462,7 +244,7 @@ function setupSSE(taskId) {
             }
         };
     }
-    
+
     connect();
 }
 
@@ -471,6 +253,7 @@ function getEventIcon(eventType) {
         case 'think': return '🤔';
         case 'tool': return '🛠️';
         case 'act': return '🚀';
+        case 'plan': return '📋';
         case 'result': return '🏁';
         case 'error': return '❌';
         case 'complete': return '✅';
@@ -485,6 +268,7 @@ function getEventLabel(eventType) {
         case 'think': return '思考';
         case 'tool': return '工具执行';
         case 'act': return '执行';
+        case 'plan': return '计划';
         case 'result': return '结果';
         case 'error': return '错误';
         case 'complete': return '完成';
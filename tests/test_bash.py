@@ -0,0 +1,35 @@
+from app.tool.bash import Bash, BashSessionPool, close_session_pool
+
+
+async def test_exited_shell_is_replaced_in_same_directory(tmp_path):
+    bash = Bash()
+    try:
+        await bash.execute(f"cd {tmp_path}")
+        result = await bash.execute("exit 1")
+        assert result.error
+
+        result = await bash.execute("echo ok; pwd")
+        assert result.output == f"ok\n{tmp_path}"
+        assert not result.error
+    finally:
+        await bash.cleanup()
+        close_session_pool()
+
+
+async def test_pool_skips_shell_that_died_while_idle():
+    pool = BashSessionPool(size=1)
+    try:
+        pool.fill()
+        await pool._fill_task
+        idle = pool._idle[0]
+        # Dead once its output has closed, possibly before it is reaped
+        idle.interrupt()
+        await idle._stdout._task
+
+        session = await pool.acquire()
+        assert session is not idle
+        result = await session.run("echo ok")
+        assert result.output == "ok"
+        pool.release(session)
+    finally:
+        pool.close()
@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+from app.broadcast import BroadcastChannel
+from app.exceptions import SlowConsumerError
+
+
+async def test_send_waits_for_subscriber_to_catch_up():
+    channel = BroadcastChannel(capacity=2, max_wait=5)
+    subscription = channel.subscribe()
+    await channel.send(0)
+    await channel.send(1)
+
+    send = asyncio.create_task(channel.send(2))
+    await asyncio.sleep(0.05)
+    assert not send.done()
+
+    assert await subscription.get() == 0
+    await asyncio.wait_for(send, 1)
+    assert [await subscription.get() for _ in range(2)] == [1, 2]
+
+
+async def test_subscriber_that_does_not_catch_up_is_dropped():
+    channel = BroadcastChannel(capacity=2, max_wait=0.05)
+    subscription = channel.subscribe()
+    for event in range(3):
+        await channel.send(event)
+
+    with pytest.raises(SlowConsumerError):
+        await subscription.get()
+    # A dropped subscriber no longer holds the channel up
+    await asyncio.wait_for(channel.send(3), 0.01)
@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+from tenacity import wait_none
+
+from app.config import LLMSettings
+from app.llm import LLM
+
+
+def make_llm(name: str, **settings) -> LLM:
+    llm_settings = LLMSettings(
+        model="test-model",
+        base_url="http://llm.invalid/v1",
+        api_key="sk-test",
+        api_type="",
+        api_version="",
+        **settings,
+    )
+    return LLM(name, {name: llm_settings})
+
+
+def fake_create(requests: list, response=None, error: Exception = None):
+    async def create(**params):
+        requests.append(params)
+        if error is not None:
+            raise error
+        return response
+
+    return create
+
+
+def tool_response():
+    message = SimpleNamespace(content="done", tool_calls=None)
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=message)],
+        usage=SimpleNamespace(total_tokens=10),
+    )
+
+
+async def test_ask_tool_uses_client_timeout_by_default():
+    llm = make_llm("test_timeout")
+    requests = []
+    llm.client = SimpleNamespace(
+        chat=SimpleNamespace(
+            completions=SimpleNamespace(create=fake_create(requests, tool_response()))
+        )
+    )
+
+    await llm.ask_tool([{"role": "user", "content": "hi"}])
+    await llm.ask_tool([{"role": "user", "content": "hi"}], timeout=5)
+
+    assert "timeout" not in requests[0]
+    assert requests[1]["timeout"] == 5
+
+
+async def test_failed_attempt_does_not_charge_token_bucket(monkeypatch):
+    monkeypatch.setattr(LLM.ask_tool.retry, "wait", wait_none())
+    llm = make_llm("test_rate_limit", tokens_per_minute=1_000_000)
+    requests = []
+    failing = fake_create(requests, error=RuntimeError("429"))
+    succeeding = fake_create(requests, tool_response())
+
+    async def create(**params):
+        if not requests:
+            return await failing(**params)
+        return await succeeding(**params)
+
+    llm.client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    )
+
+    await llm.ask_tool([{"role": "user", "content": "hi"}])
+
+    # Only the successful attempt's reported usage stays charged
+    assert len(requests) == 2
+    bucket = llm.rate_limiter.tokens
+    assert bucket.capacity - bucket.level < 11
@@ -0,0 +1,39 @@
+from app.schema import Memory, Message, ToolCall
+
+
+def tool_call(call_id: str) -> ToolCall:
+    return ToolCall(id=call_id, function={"name": "bash", "arguments": "{}"})
+
+
+def test_eviction_trims_to_low_water_mark_and_keeps_pinned():
+    memory = Memory(max_messages=20)
+    memory.add_messages(
+        [Message.system_message("system"), Message.user_message("task")]
+    )
+    for i in range(19):
+        memory.add_message(Message.user_message(f"message {i}"))
+
+    # One over the limit evicts down to a tenth below it
+    assert len(memory.messages) == 18
+    assert [m.content for m in memory.messages[:3]] == ["system", "task", "message 3"]
+    assert memory.token_count == Memory(messages=list(memory.messages)).token_count
+
+    # The next appends fit without evicting
+    memory.add_message(Message.user_message("next"))
+    assert len(memory.messages) == 19
+
+
+def test_tool_results_are_evicted_with_their_call():
+    memory = Memory(max_messages=4)
+    memory.add_messages(
+        [
+            Message.user_message("task"),
+            Message.from_tool_calls([tool_call("a"), tool_call("b")]),
+            Message.tool_message("result a", name="bash", tool_call_id="a"),
+            Message.tool_message("result b", name="bash", tool_call_id="b"),
+            Message.assistant_message("done"),
+        ]
+    )
+
+    assert [m.role for m in memory.messages] == ["user", "assistant"]
+    assert memory.messages[1].content == "done"
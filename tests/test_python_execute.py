@@ -0,0 +1,15 @@
+from app.tool.python_execute import PythonExecute
+from app.tool.python_kernel import close_kernel_pool
+
+
+async def test_long_call_keeps_namespace():
+    tool = PythonExecute()
+    try:
+        result = await tool.execute("import time\nx = 41\ntime.sleep(6)\nx += 1")
+        assert result["success"], result["observation"]
+
+        result = await tool.execute("print(x)")
+        assert result == {"observation": "42\n", "success": True}
+    finally:
+        await tool.cleanup()
+        close_kernel_pool()